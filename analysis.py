@@ -0,0 +1,148 @@
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.opc.package import _PackageLoader
+from pptx.opc.packuri import PACKAGE_URI
+from pptx.package import Package
+import io
+import zipfile
+
+# ======================================================
+# 🔍 ANALISI PPTX (CPU-BOUND, ESEGUIBILE IN PROCESS POOL)
+# ======================================================
+# python-pptx carica in memoria TUTTE le parti del pacchetto all'apertura.
+# Per non decomprimere ogni immagine solo per confrontarne il peso, il
+# pacchetto viene aperto con un lettore che pesca dallo zip originale solo le
+# parti XML e restituisce ppt/media/* vuoti (niente copia del pacchetto): i
+# pesi arrivano dalle dimensioni nello zip e dallo stesso zip si legge poi
+# solo il blob vincente di ogni slide.
+
+MEDIA_PREFIX = "ppt/media/"
+
+
+class _MediaFreeReader:
+    """Lettore di parti per python-pptx (come PackageReader) sullo zip già aperto: media vuoti."""
+
+    def __init__(self, zf):
+        self._zf = zf
+        self._names = set(zf.namelist())
+
+    def __contains__(self, pack_uri):
+        return pack_uri.membername in self._names
+
+    def __getitem__(self, pack_uri):
+        name = pack_uri.membername
+        if name not in self._names:
+            raise KeyError(f"no member '{pack_uri}' in package")
+        return b"" if name.startswith(MEDIA_PREFIX) else self._zf.read(name)
+
+    def rels_xml_for(self, partname):
+        uri = partname.rels_uri
+        return self[uri] if uri in self else None
+
+
+class _MediaFreeLoader(_PackageLoader):
+    def __init__(self, zf, package):
+        super().__init__(None, package)
+        self._reader = _MediaFreeReader(zf)
+
+    @property
+    def _package_reader(self):
+        return self._reader
+
+
+def _open_without_media(zf):
+    """Presentation dallo zip aperto senza decomprimere i media + {partname: peso in bytes}."""
+    sizes = {"/" + i.filename: i.file_size for i in zf.infolist() if i.filename.startswith(MEDIA_PREFIX)}
+    package = Package(None)
+    # Stessi passi di OpcPackage._load, con il lettore al posto di quello che legge tutto lo zip
+    pkg_xml_rels, parts = _MediaFreeLoader(zf, package)._load()
+    package._rels.load_from_xml(PACKAGE_URI, pkg_xml_rels, parts)
+    return package.main_document_part.presentation, sizes
+
+def _image_partname(shape):
+    rId = shape._element.blip_rId
+    if not rId: return None
+    return str(shape.part.related_part(rId).partname)
+
+def get_images_recursive_by_weight(shapes, sizes):
+    """Cerca immagini ricorsivamente. Vince il PESO (Bytes), letto dallo zip: (peso, partname)."""
+    images_found = []
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.PICTURE or (shape.shape_type == MSO_SHAPE_TYPE.PLACEHOLDER and hasattr(shape, "image")):
+            try:
+                partname = _image_partname(shape)
+                if partname in sizes:
+                    images_found.append((sizes[partname], partname))
+            except: pass
+        elif shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            images_found.extend(get_images_recursive_by_weight(shape.shapes, sizes))
+    return images_found
+
+def _heaviest(candidates):
+    # max() restituisce il primo a parità di peso: stesso ordine slide > layout > master di prima
+    return max(candidates, key=lambda x: x[0]) if candidates else None
+
+def analyze_pptx_content(file_obj):
+    """Estrae testo e immagini (Heavyweight logic)."""
+    if isinstance(file_obj, str):
+        with open(file_obj, "rb") as f: data = f.read()
+    else:
+        data = file_obj.getvalue() if hasattr(file_obj, "getvalue") else file_obj.read()
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    prs, sizes = _open_without_media(zf)
+    full_text = []
+    winners = {}
+    # Layout e master sono condivisi tra le slide: candidato migliore calcolato una volta per parte
+    part_best = {}
+
+    def best_of_part(owner):
+        key = owner.part.partname
+        if key not in part_best:
+            part_best[key] = _heaviest(get_images_recursive_by_weight(owner.shapes, sizes))
+        return part_best[key]
+
+    for i, slide in enumerate(prs.slides):
+        s_txt = []
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text.strip():
+                s_txt.append(shape.text.strip())
+        visible_text = " | ".join(s_txt)
+
+        notes_text = ""
+        if slide.has_notes_slide:
+            try:
+                if slide.notes_slide.notes_text_frame:
+                    notes_content = slide.notes_slide.notes_text_frame.text.strip()
+                    if notes_content:
+                        notes_text = f"\n[[ ISTRUZIONI DALLE NOTE: {notes_content} ]]"
+            except: pass
+
+        full_text.append(f"SLIDE {i+1} CONTENUTO: {visible_text} {notes_text}")
+
+        candidates = []
+        own = _heaviest(get_images_recursive_by_weight(slide.shapes, sizes))
+        if own: candidates.append(own)
+        if slide.slide_layout:
+            best = best_of_part(slide.slide_layout)
+            if best: candidates.append(best)
+        if slide.slide_layout and slide.slide_layout.slide_master:
+            best = best_of_part(slide.slide_layout.slide_master)
+            if best: candidates.append(best)
+
+        best = _heaviest(candidates)
+        if best:
+            winners[i] = best[1]
+
+    # Solo ora si decomprimono i blob vincenti (una volta sola anche se condivisi)
+    extracted_images = {}
+    blobs = {}
+    with zf:
+        for i, partname in winners.items():
+            if partname not in blobs:
+                blobs[partname] = zf.read(partname.lstrip("/"))
+            extracted_images[i] = blobs[partname]
+
+    return "\n---\n".join(full_text), extracted_images
+
+def analyze_pptx_bytes(data):
+    """Wrapper picklabile per il process pool: riceve i bytes del file."""
+    return analyze_pptx_content(io.BytesIO(data))
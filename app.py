@@ -1,17 +1,21 @@
 import streamlit as st
-import google.generativeai as genai
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from google.cloud import storage
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
-from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-import json
 import os
 import time
 import uuid
 import io
+import clients
+import pipeline
+import brain
+import images
+import prefetch
+import llm_cache
+import copy_pool
+import save_jobs
+import tracing
+import live_analysis
+import local_render
+import finalize
+from session_images import SessionImageStore
 
 # --- CONFIGURAZIONE ---
 st.set_page_config(page_title="Slide Monster: GOD MODE", page_icon="🦍", layout="wide")
@@ -26,39 +30,51 @@ else:
     DEF_TEMPLATE_ID = ""
     DEF_FOLDER_ID = ""
 
-GCP_PROJECT_ID = "gen-lang-client-0247086002"
-GCS_BUCKET_NAME = "bucket_grimmy"
-GCP_LOCATION = "us-central1"
+from settings import GCP_PROJECT_ID, GCS_BUCKET_NAME, GCP_LOCATION, GEMINI_MODELS, IMAGEN_MODELS, CONTEXT_TOKEN_BUDGET
+from session_images import make_thumbnail
+
+DECKS_PER_PAGE = (1, 3, 5, 10)
+RENDER_LABELS = {
+    "slides": "Slides API (copia + sostituzioni)",
+    "local": "Locale python-pptx → Google Slides",
+    "pptx": "Locale python-pptx → file .pptx",
+}
 
 # --- GESTIONE STATO ---
 if "app_state" not in st.session_state: st.session_state.app_state = "UPLOAD"
 if "draft_data" not in st.session_state: st.session_state.draft_data = {}
 if "final_images" not in st.session_state: st.session_state.final_images = {}
-if "original_images" not in st.session_state: st.session_state.original_images = {} 
+# Immagini originali: store con budget di memoria (miniature in RAM, blob su disco)
+if "original_images" not in st.session_state: st.session_state.original_images = SessionImageStore()
+if "prefetcher" not in st.session_state: st.session_state.prefetcher = None
+# Bottone "Genera Immagine": job in background annullabili (stesso meccanismo del prefetch) ed errori per slot
+if "generator" not in st.session_state: st.session_state.generator = None
+if "generation_errors" not in st.session_state: st.session_state.generation_errors = {}
+# Job di salvataggio in background seguito da questa sessione (vedi save_jobs.py)
+if "save_job" not in st.session_state: st.session_state.save_job = None
+# Identifica i job di questa sessione: la lista dei salvataggi da riprendere mostra solo quelli
+if "session_owner" not in st.session_state: st.session_state.session_owner = uuid.uuid4().hex
+# .pptx compilati in locale pronti da scaricare: nome file -> bytes
+if "local_pptx" not in st.session_state: st.session_state.local_pptx = {}
+# Analisi in streaming ancora in corso (vedi live_analysis.py) e deck falliti
+if "analysis" not in st.session_state: st.session_state.analysis = None
+if "analysis_errors" not in st.session_state: st.session_state.analysis_errors = []
+# Prompt immagine modificati (non tornano nell'ai_data): sopravvivono al cambio pagina
+if "prompt_edits" not in st.session_state: st.session_state.prompt_edits = {}
 
 # --- INIZIALIZZAZIONE ---
+# I client sono costruiti una volta per processo (vedi clients.py):
+# ai rerun successivi get_registry restituisce quelli già pronti.
 try:
     if "gcp_service_account" in st.secrets and "json_content" in st.secrets["gcp_service_account"]:
-        service_account_info = json.loads(st.secrets["gcp_service_account"]["json_content"])
+        service_account_json = st.secrets["gcp_service_account"]["json_content"]
     else:
-        service_account_info = json.loads(st.secrets["GCP_SERVICE_ACCOUNT"])
-    
-    creds = service_account.Credentials.from_service_account_info(
-        service_account_info,
-        scopes=[
-            'https://www.googleapis.com/auth/cloud-platform',
-            'https://www.googleapis.com/auth/drive',
-            'https://www.googleapis.com/auth/presentations'
-        ]
-    )
+        service_account_json = st.secrets["GCP_SERVICE_ACCOUNT"]
 
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"]) 
-    drive_service = build('drive', 'v3', credentials=creds)
-    slides_service = build('slides', 'v1', credentials=creds)
-    
-    vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION, credentials=creds)
-    storage_client = storage.Client(credentials=creds, project=GCP_PROJECT_ID)
-    bucket = storage_client.bucket(GCS_BUCKET_NAME)
+    registry = clients.get_registry(
+        service_account_json, st.secrets["GOOGLE_API_KEY"], GCP_PROJECT_ID, GCP_LOCATION, GCS_BUCKET_NAME
+    )
+    registry.bucket()
 
 except Exception as e:
     st.error(f"⚠️ Errore Inizializzazione: {e}")
@@ -74,268 +90,350 @@ with st.sidebar:
         tmpl = st.text_input("ID Template PPT", value=DEF_TEMPLATE_ID)
         fold = st.text_input("ID Cartella Output", value=DEF_FOLDER_ID)
         make_english = st.checkbox("🇬🇧 Genera anche versione Inglese", value=True)
+        render_mode = st.selectbox("Compilazione file", pipeline.RENDER_MODES, format_func=lambda m: RENDER_LABELS[m],
+                                   help="Locale: il deck si compila qui con python-pptx e va su Drive con un solo upload")
 
     st.divider()
 
     st.subheader("🧠 Cervello (Testo)")
     # Menu a tendina per Gemini
-    gemini_options = ["models/gemini-3-pro-preview", "models/gemini-1.5-pro"]
-    selected_gemini = st.selectbox("Modello Testo:", gemini_options, index=0)
+    selected_gemini = st.selectbox("Modello Testo:", GEMINI_MODELS, index=0)
 
     st.subheader("🎨 Artista (Grafica)")
     # Menu a tendina per Imagen
     # Nota: Imagen 3 è la versione "Fast/Pro" attuale. 
-    imagen_options = ["imagen-3.0-generate-001", "imagen-3.0-fast-generate-001"]
-    selected_imagen = st.selectbox("Modello Immagini:", imagen_options, index=0)
+    selected_imagen = st.selectbox("Modello Immagini:", IMAGEN_MODELS, index=0)
+
+    with st.expander("⚡ Prestazioni", expanded=False):
+        parse_workers = st.number_input("Parsing PPTX paralleli (processi)", min_value=0, max_value=16, value=pipeline.DEFAULT_PARSE_WORKERS, help="0 = parsing nei thread, senza process pool")
+        llm_workers = st.number_input("Chiamate Gemini parallele", min_value=1, max_value=16, value=pipeline.DEFAULT_LLM_WORKERS)
+        drive_workers = st.number_input("Salvataggi Drive/Slides paralleli", min_value=1, max_value=8, value=pipeline.DEFAULT_DRIVE_WORKERS, help="Le scritture restano entro le quote Drive/Slides per utente")
+        context_budget = st.number_input("Budget token testo sorgente", min_value=0, max_value=200000, step=1000, value=CONTEXT_TOKEN_BUDGET,
+                                         help="Testo ripulito da ripetizioni e template, note in testa; i deck più lunghi vengono riassunti a blocchi. 0 = testo intero")
+        use_llm_cache = st.checkbox("💾 Usa cache risposte Gemini", value=True, help="Disattiva per forzare nuove risposte (vengono comunque salvate)")
+        try:
+            cstats = llm_cache.get_cache().stats()
+            st.caption(f"Cache Gemini: {cstats['hits']} hit / {cstats['misses']} miss · {cstats['entries']} risposte salvate")
+            if st.button("🧹 Svuota cache Gemini", use_container_width=True):
+                llm_cache.get_cache().clear()
+                st.rerun()
+        except Exception as e:
+            st.caption(f"Cache Gemini non disponibile: {e}")
+        image_budget = st.number_input("Memoria immagini originali per sessione (MB)", min_value=8, max_value=1024, value=64, step=8, help="Oltre questa soglia i blob vengono scaricati su disco")
+        pool_size = st.number_input("Copie template pre-riscaldate", min_value=0, max_value=20, value=0, help="Copie pronte nella cartella di output: al salvataggio basta rinominarle. 0 = disattivato")
+        stream_analysis = st.checkbox("🌊 Analisi in streaming", value=True, help="L'editor si apre subito e i campi compaiono man mano che Gemini li scrive")
+        prefetch_images = st.checkbox("🔮 Pre-genera le immagini dopo l'analisi", value=False, help="Avvia Imagen in background per tutti i prompt appena un deck è analizzato")
+
+    st.session_state.original_images.set_budget(image_budget)
+
+    with st.expander("📈 Tracce API", expanded=False):
+        rows = tracing.tracer.summary()
+        if rows: st.dataframe(rows, hide_index=True, use_container_width=True)
+        else: st.caption("Nessuna chiamata registrata.")
+        traced_decks = tracing.tracer.decks()
+        if traced_decks:
+            sel = st.selectbox("Timeline deck", traced_decks)
+            spans = tracing.tracer.spans(sel)
+            t0 = min(s.start for s in spans)
+            timeline = [{"chiamata": f"{s.service}.{s.op}", "inizio": round(s.start - t0, 2), "fine": round(s.start - t0 + max(s.duration, 0.01), 2),
+                         "esito": s.outcome, "ms": round(s.duration * 1000), "tentativo": s.attempt} for s in spans]
+            st.vega_lite_chart(spec={
+                "data": {"values": timeline}, "mark": "bar",
+                "encoding": {
+                    "y": {"field": "chiamata", "type": "nominal", "title": None},
+                    "x": {"field": "inizio", "type": "quantitative", "title": "secondi"}, "x2": {"field": "fine"},
+                    "color": {"field": "esito", "type": "nominal", "scale": {"domain": ["ok", "cache", "error"], "range": ["#4c9a2a", "#7aa6c2", "#d62728"]}},
+                    "tooltip": [{"field": "chiamata"}, {"field": "ms"}, {"field": "esito"}, {"field": "tentativo"}],
+                },
+            }, use_container_width=True)
+        c1, c2 = st.columns(2)
+        c1.download_button("⬇️ JSONL", tracing.tracer.export_jsonl(), file_name="tracce.jsonl", use_container_width=True)
+        c2.download_button("⬇️ Prometheus", tracing.tracer.export_prometheus(), file_name="slide_monster.prom", use_container_width=True)
+        if st.button("🧹 Azzera tracce", use_container_width=True):
+            tracing.tracer.clear()
+            st.rerun()
+    # Il riempimento del pool gira in background: qui si fissa solo la dimensione
+    copy_pool.configure(registry, tmpl, fold, int(pool_size))
+
+    # Salvataggi interrotti (riavvio del server) o con errori: si riprendono dalle fasi mancanti
+    stalled = save_jobs.interrupted(save_jobs.get_store(), tmpl, fold, st.session_state.session_owner)
+    if stalled:
+        with st.expander(f"📦 Salvataggi da riprendere ({len(stalled)})", expanded=False):
+            for job in stalled:
+                prog = save_jobs.progress(save_jobs.get_store(), job["job_id"])
+                st.caption(f"{time.strftime('%d/%m %H:%M', time.localtime(job['created']))} · {prog['done']}/{prog['total']} file · {job['status']}")
+                c1, c2 = st.columns(2)
+                if c1.button("▶️ Riprendi", key=f"resume_{job['job_id']}", use_container_width=True):
+                    save_jobs.submit(registry, save_jobs.get_store(), job["job_id"])
+                    st.session_state.save_job = job["job_id"]
+                    st.rerun()
+                if c2.button("🗑️ Scarta", key=f"drop_{job['job_id']}", use_container_width=True):
+                    save_jobs.get_store().delete(job["job_id"])
+                    st.rerun()
 
     st.divider()
     if st.button("🔄 Reset Totale", type="secondary", use_container_width=True):
+        if st.session_state.prefetcher: st.session_state.prefetcher.cancel_all()
+        st.session_state.prefetcher = None
+        if st.session_state.generator: st.session_state.generator.cancel_all()
+        st.session_state.generation_errors = {}
         st.session_state.app_state = "UPLOAD"
         st.session_state.draft_data = {}
         st.session_state.final_images = {}
-        st.session_state.original_images = {}
+        st.session_state.original_images.clear()
+        st.session_state.save_job = None
+        st.session_state.local_pptx = {}
+        st.session_state.analysis = None
+        st.session_state.analysis_errors = []
+        st.session_state.prompt_edits = {}
         st.rerun()
 
 # --- FUNZIONI CORE ---
 
-def get_images_recursive_by_weight(shapes):
-    """Cerca immagini ricorsivamente. Vince il PESO (Bytes)."""
-    images_found = []
-    for shape in shapes:
-        if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-            try:
-                blob = shape.image.blob
-                weight = len(blob) 
-                images_found.append((weight, blob))
-            except: pass
-        elif shape.shape_type == MSO_SHAPE_TYPE.GROUP:
-            images_found.extend(get_images_recursive_by_weight(shape.shapes))
-        elif shape.shape_type == MSO_SHAPE_TYPE.PLACEHOLDER:
-            if hasattr(shape, "image"):
-                try:
-                    blob = shape.image.blob
-                    weight = len(blob)
-                    images_found.append((weight, blob))
-                except: pass
-    return images_found
-
-def analyze_pptx_content(file_obj):
-    """Estrae testo e immagini (Heavyweight logic)."""
-    prs = Presentation(file_obj)
-    full_text = []
-    extracted_images = {} 
-
-    for i, slide in enumerate(prs.slides):
-        s_txt = []
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                s_txt.append(shape.text.strip())
-        visible_text = " | ".join(s_txt)
-
-        notes_text = ""
-        if slide.has_notes_slide:
-            try:
-                if slide.notes_slide.notes_text_frame:
-                    notes_content = slide.notes_slide.notes_text_frame.text.strip()
-                    if notes_content:
-                        notes_text = f"\n[[ ISTRUZIONI DALLE NOTE: {notes_content} ]]"
-            except: pass
-        
-        full_text.append(f"SLIDE {i+1} CONTENUTO: {visible_text} {notes_text}")
-
-        candidates = []
-        candidates.extend(get_images_recursive_by_weight(slide.shapes))
-        if slide.slide_layout:
-            candidates.extend(get_images_recursive_by_weight(slide.slide_layout.shapes))
-        if slide.slide_layout and slide.slide_layout.slide_master:
-            candidates.extend(get_images_recursive_by_weight(slide.slide_layout.slide_master.shapes))
-        
-        if candidates:
-            candidates.sort(key=lambda x: x[0], reverse=True)
-            extracted_images[i] = candidates[0][1]
-    
-    return "\n---\n".join(full_text), extracted_images
-
-def brain_process(text, model_name):
-    """PROMPT PRO COPYWRITER"""
-    prompt = f"""
-    Sei un SENIOR COPYWRITER esperto in Team Building e vendita di eventi B2B.
-    Il tuo compito è analizzare il materiale grezzo (Slide + Note) e riscriverlo per VENDERE il format.
-    
-    ⚠️ REGOLE ASSOLUTE DI STILE:
-    1. **NO EMOJI**. Sei professionale.
-    2. **LUNGHEZZA:** I testi descrittivi (Pagina 2 e 3) devono essere CORPOSI (almeno 130-150 parole l'uno). Non fare riassuntini. Scrivi testi ricchi, ben articolati in paragrafi.
-    3. **FORMATTAZIONE:** Usa il **MAIUSCOLO** per le parole chiave e gli elenchi puntati (simbolo •).
-    4. **TONO:** Persuasivo, incoraggiante, emozionale ma concreto.
-    
-    STRUTTURA JSON:
-    {{
-        "page_1_cover": {{ "title": "NOME DEL FORMAT", "subtitle": "Slogan", "image_prompt": "Visual description in English" }},
-        "page_2_desc": {{ "body": "Testo ESTESO (min 130 parole) sull'azione. Usa paragrafi e MAIUSCOLO per enfasi.", "image_prompt": "Visual description in English" }},
-        "page_3_desc": {{ "body": "Testo ESTESO (min 130 parole) sull'emozione. Usa paragrafi e MAIUSCOLO per enfasi.", "image_prompt": "Visual description in English" }},
-        "page_4_details": {{
-            "svolgimento": "Elenco puntato (•) DETTAGLIATO delle fasi.",
-            "logistica": "Elenco puntato (•) DETTAGLIATO (spazi, tempi, pax).",
-            "tecnica": "Elenco puntato (•) DETTAGLIATO (audio, video, prese)."
-        }},
-        "page_7_costi": {{ "dettaglio": "Elenco puntato (•) CHIARO: IL COSTO INCLUDE... / IL COSTO NON COMPRENDE..." }}
-    }}
-    """
-    model = genai.GenerativeModel(model_name)
+def upload_bytes_to_bucket(image_bytes):
     try:
-        resp = model.generate_content(f"{prompt}\n\nTESTO SORGENTE:\n{text}", generation_config={"response_mime_type": "application/json"})
-        return json.loads(resp.text)
+        return images.upload_bytes_to_bucket(registry, image_bytes)
     except Exception as e:
-        st.error(f"Errore Gemini Brain: {e}")
+        st.error(f"Errore Upload Bucket: {e}")
         return None
 
-def translate_struct_to_english(ai_data, model_name):
-    prompt = """
-    You are a professional translator and copywriter. 
-    Translate the values in the following JSON from Italian to English.
-    RULES:
-    1. **KEEP THE FORMAT NAME (TITLE) AS IS**. Do not translate proper names.
-    2. **Translate fully**. Do not summarize. Keep the text long and persuasive.
-    3. **Maintain formatting**: Keep the bullet points (•) and UPPERCASE words.
-    Return ONLY valid JSON.
+def cancel_prefetch(fname, slot):
+    # Scelta manuale dell'utente: il job in background non deve sovrascriverla
+    if st.session_state.prefetcher: st.session_state.prefetcher.cancel(fname, slot)
+    if st.session_state.generator: st.session_state.generator.cancel(fname, slot)
+
+def get_generator():
+    if st.session_state.generator is None:
+        st.session_state.generator = prefetch.ImagePrefetcher(registry, selected_imagen, prefetch.interactive_pool)
+    return st.session_state.generator
+
+def prompt_changed(fname, slot, prompt):
+    if st.session_state.prefetcher and prompt is not None: st.session_state.prefetcher.resubmit_if_pending(fname, slot, prompt)
+
+def apply_prefetched():
+    """Copia in final_images le immagini pre-generate arrivate (senza toccare quelle già scelte)."""
+    pf = st.session_state.prefetcher
+    if pf is None: return
+    for fname, slot, url, err in pf.collect():
+        if fname not in st.session_state.final_images: continue
+        if url and not st.session_state.final_images[fname].get(slot):
+            st.session_state.final_images[fname][slot] = url
+        elif err is not None:
+            st.toast(f"⚠️ Pre-generazione {fname}/{slot} fallita: {err}")
+
+def apply_generated():
+    """Immagini chieste con "Genera Immagine": sostituiscono quella dello slot."""
+    gen = st.session_state.generator
+    if gen is None: return
+    for fname, slot, url, err in gen.collect():
+        if fname not in st.session_state.final_images: continue
+        if url:
+            st.session_state.final_images[fname][slot] = url
+        else:
+            st.session_state.generation_errors[(fname, slot)] = str(err or "upload non riuscito")
+
+def apply_streamed():
+    """Porta nel draft i campi arrivati dall'analisi in streaming."""
+    job = st.session_state.analysis
+    if job is None: return
+    for kind, fname, payload in job.collect():
+        content = st.session_state.draft_data.get(fname)
+        if content is None: continue
+        if kind == "field":
+            sec, field, value = payload
+            content['ai_data'].setdefault(sec, {}).setdefault(field, value)
+        elif kind == "done":
+            # setdefault: quello che l'utente ha già modificato resta com'è
+            for sec, fields in payload["ai_data"].items():
+                if isinstance(fields, dict):
+                    for field, value in fields.items():
+                        content['ai_data'].setdefault(sec, {}).setdefault(field, value)
+            content.pop('streaming', None)
+            st.session_state.original_images.put_many(fname, payload["images"])
+            if st.session_state.prefetcher: st.session_state.prefetcher.submit_deck(fname, content['ai_data'])
+        else:
+            st.session_state.draft_data.pop(fname, None)
+            st.session_state.final_images.pop(fname, None)
+            st.session_state.analysis_errors.append((fname, str(payload)))
+    if not job.pending() and not job.has_events():
+        st.session_state.analysis = None
+
+@st.fragment(run_every=1)
+def analysis_status():
+    job = st.session_state.analysis
+    if job is None: return
+    if job.has_events(): st.rerun()
+    n = len(job.pending())
+    if n: st.caption(f"🌊 Gemini sta scrivendo: {n} deck in arrivo...")
+
+def field_widget(widget, label, fname, section, field, key, store=True, **kwargs):
+    """Widget di un campo dell'ai_data. Durante lo streaming compare solo quando il campo è completo.
+
+    store=False: il valore non torna nell'ai_data (es. prompt immagine). None se il campo non c'è ancora.
     """
-    model = genai.GenerativeModel(model_name) 
-    try:
-        resp = model.generate_content(f"{prompt}\n\nJSON:\n{json.dumps(ai_data)}", generation_config={"response_mime_type": "application/json"})
-        return json.loads(resp.text)
-    except Exception as e:
-        print(f"Errore Traduzione Struct: {e}")
-        return ai_data 
+    content = st.session_state.draft_data[fname]
+    sec = content['ai_data'].setdefault(section, {})
+    if content.get('streaming') and field not in sec:
+        st.caption(f"⏳ {label}: in arrivo...")
+        return None
+    if store:
+        value = widget(label, value=sec.get(field, ''), key=key, **kwargs)
+        sec[field] = value
+    else:
+        value = widget(label, value=st.session_state.prompt_edits.get(key, sec.get(field, '')), key=key, **kwargs)
+        st.session_state.prompt_edits[key] = value
+    return value
+
+@st.fragment(run_every=3)
+def prefetch_status():
+    pf = st.session_state.prefetcher
+    if pf is None: return
+    if pf.has_results(): st.rerun()
+    n = pf.pending_count()
+    if n: st.caption(f"🔮 Pre-generazione immagini in corso: {n} rimanenti...")
+
+def show_save_progress(prog):
+    st.progress(prog["done"]/max(1, prog["total"]), text=f"{prog['done']}/{prog['total']} file salvati")
+    for f in prog["files"]:
+        if f["done"]: st.success(f"✅ Fatto ({f['lang']}): {f['name']}")
+        elif f["error"]: st.error(f"❌ Errore ({f['lang']}): {f['name']} — {f['error']}")
+        for what, msg in f["failures"]:
+            st.warning(f"⚠️ {f['name']}: {what} non applicata — {msg}")
+    if prog["error"]: st.error(f"❌ Salvataggio interrotto: {prog['error']}")
+
+def store_translations(prog):
+    """Le traduzioni ENG del job tornano nel draft per i salvataggi successivi."""
+    for fname, en_data in prog["translations"].items():
+        if fname in st.session_state.draft_data:
+            st.session_state.draft_data[fname]['ai_data_en'] = en_data
+            st.session_state.draft_data[fname]['ai_data_en_src'] = brain.data_fingerprint(st.session_state.draft_data[fname]['ai_data'])
+
+@st.fragment(run_every=2)
+def save_job_status():
+    # Solo lettura dello stato: il job gira in background anche se la pagina si ricarica
+    prog = save_jobs.progress(save_jobs.get_store(), st.session_state.save_job)
+    if prog is None: return
+    if prog["running"]:
+        st.caption("💾 Salvataggio in corso in background...")
+        show_save_progress(prog)
+    else:
+        # Finito: un rerun completo smette di interrogare e mostra il riepilogo
+        st.rerun()
 
-def get_template_static_text(presentation_id):
-    try:
-        prs = slides_service.presentations().get(presentationId=presentation_id).execute()
-        texts = set()
-        for slide in prs.get('slides', []):
-            for el in slide.get('pageElements', []):
-                if 'shape' in el and 'text' in el['shape']:
-                    for tr in el['shape']['text']['textElements']:
-                        if 'textRun' in tr and 'content' in tr['textRun']:
-                            c = tr['textRun']['content'].strip()
-                            if c and "{{" not in c and "}}" not in c and len(c) > 2: texts.add(c)
-        return list(texts)
-    except: return []
-
-def translate_list_strings(text_list, model_name):
-    if not text_list: return {}
-    prompt = "Translate these Italian strings to English for a corporate presentation. Return JSON {original: translation}."
-    model = genai.GenerativeModel(model_name)
-    try:
-        resp = model.generate_content(f"{prompt}\n\nLIST:\n{json.dumps(text_list)}", generation_config={"response_mime_type": "application/json"})
-        return json.loads(resp.text)
-    except: return {}
-
-def apply_static_translations(presentation_id, translation_map):
-    if not translation_map: return
-    reqs = []
-    for it, en in translation_map.items():
-        if it and en and it != en:
-            reqs.append({'replaceAllText': {'containsText': {'text': it, 'matchCase': True}, 'replaceText': en}})
-    if reqs:
-        for i in range(0, len(reqs), 50):
-            try: slides_service.presentations().batchUpdate(presentationId=presentation_id, body={'requests': reqs[i:i+50]}).execute()
-            except: pass
+def show_original(store, fname, idx, caption=None):
+    thumb = store.thumbnail(fname, idx)
+    if thumb: st.image(thumb, caption=caption, use_container_width=True)
+    else: st.caption(f"{caption or 'Originale'}: anteprima non disponibile per questo formato")
 
-def upload_bytes_to_bucket(image_bytes):
+@st.cache_data(max_entries=256, show_spinner=False)
+def url_thumbnail(url):
+    # URL content-addressed (images.object_name): stesso URL = stessa immagine
     try:
-        filename = f"img_{uuid.uuid4()}.png"
-        blob = bucket.blob(filename)
-        blob.upload_from_string(image_bytes, content_type="image/png")
-        blob.make_public() 
-        return f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/{filename}"
-    except Exception as e:
-        st.error(f"Errore Upload Bucket: {e}")
+        return make_thumbnail(images.fetch_image(registry, url))
+    except Exception:
         return None
 
-def generate_imagen_safe(prompt, model_name):
-    for i in range(3):
-        try:
-            model = ImageGenerationModel.from_pretrained(model_name)
-            # Parametri fissi per consistenza: 1 immagine, 16:9
-            images = model.generate_images(prompt=prompt, number_of_images=1, aspect_ratio="16:9", person_generation="allow_adult")
-            if images: return images[0]._image_bytes
-        except Exception as e:
-            if "429" in str(e) or "Quota" in str(e): 
-                time.sleep(10 * (i+1))
-            else: 
-                # Se fallisce, restituisco l'errore per il debug
-                st.error(f"Errore Imagen ({model_name}): {e}")
-                return None
-    return None
-
-def find_image_element_id_smart(prs_id, label):
-    try:
-        prs = slides_service.presentations().get(presentationId=prs_id).execute()
-        label_clean = label.strip().upper()
-        for slide in prs.get('slides', []):
-            for el in slide.get('pageElements', []):
-                if 'description' in el and el['description'].strip().upper() == label_clean:
-                    return el['objectId']
-    except: pass
-    return None
-
-def worker_bot_finalize(template_id, folder_id, filename, ai_data, urls_map, translate_mode, gemini_model):
-    try:
-        copy = drive_service.files().copy(
-            fileId=template_id, body={'name': filename, 'parents': [folder_id]}, supportsAllDrives=True
-        ).execute()
-        new_id = copy.get('id')
-        
-        final_data = ai_data
-        
-        if translate_mode:
-            st.toast(f"🇬🇧 Traduzione AI ({gemini_model}): {filename}")
-            final_data = translate_struct_to_english(ai_data, gemini_model)
-            
-            if final_data['page_2_desc']['body'] == ai_data['page_2_desc']['body']:
-                 final_data = translate_struct_to_english(ai_data, gemini_model) 
-            
-            static_texts = get_template_static_text(new_id)
-            if static_texts:
-                t_map = translate_list_strings(static_texts, gemini_model)
-                apply_static_translations(new_id, t_map)
-        
-        main_format_title = final_data.get('page_1_cover', {}).get('title', 'Format')
-
-        reqs = []
-        reqs.append({'replaceAllText': {'containsText': {'text': '{{TITLE}}'}, 'replaceText': main_format_title}})
-        
-        if 'page_1_cover' in final_data:
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{SUBTITLE}}'}, 'replaceText': final_data['page_1_cover'].get('subtitle', '')}})
-        
-        if 'page_2_desc' in final_data:
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{BODY_1}}'}, 'replaceText': final_data['page_2_desc'].get('body', '')}})
-        
-        if 'page_3_desc' in final_data:
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{BODY_2}}'}, 'replaceText': final_data['page_3_desc'].get('body', '')}})
-        
-        if 'page_4_details' in final_data:
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{SVOLGIMENTO}}'}, 'replaceText': final_data['page_4_details'].get('svolgimento', '')}})
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{LOGISTICA}}'}, 'replaceText': final_data['page_4_details'].get('logistica', '')}})
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{TECNICA}}'}, 'replaceText': final_data['page_4_details'].get('tecnica', '')}})
-        
-        if 'page_7_costi' in final_data:
-            reqs.append({'replaceAllText': {'containsText': {'text': '{{DETTAGLIO_COSTO}}'}, 'replaceText': final_data['page_7_costi'].get('dettaglio', '')}})
-
-        if reqs:
-            slides_service.presentations().batchUpdate(presentationId=new_id, body={'requests': reqs}).execute()
-
-        for label, url in urls_map.items():
-            if url:
-                el_id = find_image_element_id_smart(new_id, label)
-                if el_id:
-                    req = {'replaceImage': {'imageObjectId': el_id, 'imageReplaceMethod': 'CENTER_CROP', 'url': url}}
-                    try: slides_service.presentations().batchUpdate(presentationId=new_id, body={'requests': [req]}).execute()
-                    except: pass
-        return new_id
-    except Exception as e:
-        print(f"Error in finalize: {e}")
-        return None
+def show_final(fname, slot):
+    url = st.session_state.final_images[fname].get(slot)
+    if url: st.image(url_thumbnail(url) or url, use_container_width=True)
+
+def page_label(page, i, n):
+    if not page: return "Nessun deck"
+    if len(page) == 1: return page[0]
+    return f"{i + 1}/{n}: {page[0]} … {page[-1]}"
+
+@st.fragment(run_every=1)
+def generation_status(fname, slot):
+    """Attesa di una generazione: lo script non è bloccato e l'utente può annullare."""
+    gen = st.session_state.generator
+    if gen is None or not gen.pending(fname, slot):
+        st.rerun()
+    st.caption(f"🎨 Sto dipingendo... (massimo {images.INTERACTIVE_DEADLINE}s)")
+    if st.button("✖️ Annulla", key=f"cancel_gen_{fname}_{slot}", use_container_width=True):
+        gen.cancel(fname, slot)
+        st.rerun()
+
+def image_slot(fname, section, slot, idx, keys):
+    """Colonne Generatore AI / Originale PPT di uno slot immagine. keys: (prompt, genera, originale)."""
+    orig_imgs = st.session_state.original_images
+    c_ai, c_org = st.columns([1, 1], gap="large")
+    with c_ai:
+        st.info(f"🤖 **Generatore AI** ({selected_imagen})")
+        p = field_widget(st.text_area, "Prompt", fname, section, 'image_prompt', key=keys[0], store=False, height=100)
+        prompt_changed(fname, slot, p)
+        gen = get_generator()
+        if not gen.pending(fname, slot) and st.button("Genera Immagine", key=keys[1], use_container_width=True, disabled=p is None):
+            cancel_prefetch(fname, slot)
+            st.session_state.generation_errors.pop((fname, slot), None)
+            gen.submit(fname, slot, p, selected_imagen, images.INTERACTIVE_DEADLINE, images.INTERACTIVE_CALL_TIMEOUT)
+        if gen.pending(fname, slot):
+            generation_status(fname, slot)
+        err = st.session_state.generation_errors.get((fname, slot))
+        if err:
+            st.error(f"Errore Imagen ({selected_imagen}): {err}")
+            st.warning("⚠️ Generazione fallita. Riprova o cambia prompt.")
+        show_final(fname, slot)
+
+    with c_org:
+        st.warning("📁 **Originale PPT**")
+        if orig_imgs.has(fname, idx):
+            show_original(orig_imgs, fname, idx, caption=f"Originale ({orig_imgs.size(fname, idx)//1024} KB)")
+            if st.button("Usa Originale", key=keys[2], use_container_width=True):
+                cancel_prefetch(fname, slot)
+                st.session_state.generation_errors.pop((fname, slot), None)
+                st.session_state.final_images[fname][slot] = upload_bytes_to_bucket(orig_imgs.get(fname, idx))
+                st.rerun(scope="fragment")
+
+@st.fragment
+def deck_editor(fname):
+    """Editor di UN deck: un widget modificato riesegue solo questo frammento."""
+    if fname not in st.session_state.draft_data: return
+    st.markdown(f"## 📂 {fname}")
+
+    tabs = st.tabs(["🏠 1. Cover", "📄 2. L'Esperienza", "📄 3. L'Emozione", "🛠️ 4. Scheda Tecnica", "💰 7. Costi"])
+
+    # --- TAB 1: COVER ---
+    with tabs[0]:
+        st.subheader("📝 Testi Cover")
+        field_widget(st.text_input, "Titolo Format (Globale)", fname, 'page_1_cover', 'title', key=f"t1_{fname}")
+        field_widget(st.text_input, "Sottotitolo", fname, 'page_1_cover', 'subtitle', key=f"s1_{fname}")
+        st.divider()
+        image_slot(fname, 'page_1_cover', 'cover', 0, (f"p1_{fname}", f"b1_{fname}", f"bo1_{fname}"))
+
+    # --- TAB 2: DESC 1 ---
+    with tabs[1]:
+        st.subheader("📝 L'Esperienza")
+        field_widget(st.text_area, "Body (Azione)", fname, 'page_2_desc', 'body', key=f"b2_{fname}", height=300)
+        st.divider()
+        image_slot(fname, 'page_2_desc', 'desc_1', 1, (f"p2_{fname}", f"b2_gen_{fname}", f"bo2_{fname}"))
+
+    # --- TAB 3: DESC 2 ---
+    with tabs[2]:
+        st.subheader("📝 Il Valore")
+        field_widget(st.text_area, "Body (Emozione)", fname, 'page_3_desc', 'body', key=f"b3_{fname}", height=300)
+        st.divider()
+        image_slot(fname, 'page_3_desc', 'desc_2', 2, (f"p3_{fname}", f"b3_gen_{fname}", f"bo3_{fname}"))
+
+    # --- TAB 4: DETAILS ---
+    with tabs[3]:
+        st.subheader("🛠️ Dettagli Tecnici")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.markdown("**Svolgimento**")
+            field_widget(st.text_area, "Lista fasi", fname, 'page_4_details', 'svolgimento', key=f"d1_{fname}", height=400)
+        with c2:
+            st.markdown("**Logistica**")
+            field_widget(st.text_area, "Lista logistica", fname, 'page_4_details', 'logistica', key=f"d2_{fname}", height=400)
+        with c3:
+            st.markdown("**Tecnica**")
+            field_widget(st.text_area, "Lista tecnica", fname, 'page_4_details', 'tecnica', key=f"d3_{fname}", height=400)
+
+    # --- TAB 5: COSTI ---
+    with tabs[4]:
+        st.subheader("💰 Dettagli Economici (Slide 7)")
+        field_widget(st.text_area, "Dettaglio Costi (Include/Esclude)", fname, 'page_7_costi', 'dettaglio', key=f"c_det_{fname}", height=400)
+
+    st.markdown("---")
 
 # ==========================================
 # MAIN INTERFACE
@@ -351,21 +449,42 @@ if st.session_state.app_state == "UPLOAD":
         with col_act1:
             if st.button("🧠 ANALIZZA", type="primary", use_container_width=True):
                 if uploaded:
+                    if st.session_state.prefetcher: st.session_state.prefetcher.cancel_all()
+                    st.session_state.prefetcher = prefetch.ImagePrefetcher(registry, selected_imagen) if prefetch_images else None
                     st.session_state.draft_data = {}
                     st.session_state.final_images = {}
-                    st.session_state.original_images = {}
+                    st.session_state.original_images.clear()
                     
-                    bar = st.progress(0)
-                    for i, f in enumerate(uploaded):
-                        fname = f.name.replace(".pptx", "") + "_ITA"
-                        txt, imgs_dict = analyze_pptx_content(f)
-                        data = brain_process(txt, selected_gemini)
-                        
-                        if data:
-                            st.session_state.draft_data[fname] = {"ai_data": data}
+                    files = [(f.name.replace(".pptx", "") + "_ITA", f.getvalue()) for f in uploaded]
+                    st.session_state.analysis_errors = []
+                    if stream_analysis:
+                        # L'editor si apre subito: i deck si riempiono mentre Gemini scrive
+                        st.session_state.analysis = live_analysis.LiveAnalysis(registry, files, selected_gemini, int(parse_workers), int(llm_workers), use_llm_cache,
+                                                                           int(context_budget))
+                        for fname, _ in files:
+                            st.session_state.draft_data[fname] = {"ai_data": {}, "streaming": True}
+                            st.session_state.final_images[fname] = {}
+                        st.session_state.app_state = "EDIT"
+                        st.rerun()
+                    bar = st.progress(0, text=f"0/{len(files)} deck analizzati")
+                    done = 0
+                    # I risultati arrivano nell'ordine in cui i deck finiscono
+                    for fname, res, err in pipeline.analyze_batch(registry, files, selected_gemini, int(parse_workers), int(llm_workers), use_llm_cache,
+                                                                   context_budget=int(context_budget)):
+                        done += 1
+                        if err is not None:
+                            st.error(f"Errore Gemini Brain ({fname}): {err}")
+                        elif res["ai_data"]:
+                            st.session_state.draft_data[fname] = {"ai_data": res["ai_data"]}
                             st.session_state.final_images[fname] = {}
-                            st.session_state.original_images[fname] = imgs_dict
-                        bar.progress((i+1)/len(uploaded))
+                            st.session_state.original_images.put_many(fname, res["images"])
+                            # Le immagini partono subito, mentre gli altri deck sono ancora in analisi
+                            if st.session_state.prefetcher: st.session_state.prefetcher.submit_deck(fname, res["ai_data"])
+                        bar.progress(done/len(files), text=f"{done}/{len(files)} deck analizzati ({fname})")
+
+                    # Ripristina l'ordine di caricamento per l'editor
+                    order = [fname for fname, _ in files]
+                    st.session_state.draft_data = {k: st.session_state.draft_data[k] for k in order if k in st.session_state.draft_data}
                     st.session_state.app_state = "EDIT"
                     st.rerun()
         with col_act2:
@@ -373,165 +492,81 @@ if st.session_state.app_state == "UPLOAD":
 
 # --- FASE 2: EDITING ---
 elif st.session_state.app_state == "EDIT":
+    apply_streamed()
+    for fname, err in st.session_state.analysis_errors:
+        st.error(f"Errore Gemini Brain ({fname}): {err}")
+    if st.session_state.analysis:
+        analysis_status()
+    apply_prefetched()
+    apply_generated()
+    pf = st.session_state.prefetcher
+    if pf and (pf.pending_count() or pf.has_results()):
+        prefetch_status()
     
     col_h1, col_h2 = st.columns([3, 1])
     with col_h1:
         st.info("✏️ **Sala di Regia**: Layout verticale. Controlla e Genera.")
     with col_h2:
-        if st.button("💾 SALVA SU DRIVE", type="primary", use_container_width=True):
-            bar = st.progress(0)
-            total_ops = len(st.session_state.draft_data)
-            
-            for i, (fname, content) in enumerate(st.session_state.draft_data.items()):
-                url_map = {}
-                saved = st.session_state.final_images.get(fname, {})
-                
-                if 'cover' in saved: url_map['IMG_1'] = saved['cover'] 
-                if 'desc_1' in saved: url_map['IMG_2'] = saved['desc_1'] 
-                if 'desc_2' in saved: url_map['IMG_3'] = saved['desc_2'] 
-                
-                # ITA
-                st.toast(f"🇮🇹 Saving ITA: {fname}")
-                res_ita = worker_bot_finalize(tmpl, fold, fname, content['ai_data'], url_map, False, selected_gemini)
-                
-                # ENG
-                if make_english:
-                    if "_ITA" in fname:
-                        fname_eng = fname.replace("_ITA", "_ENG")
-                    else:
-                        fname_eng = fname + "_ENG"
-                        
-                    st.toast(f"🇬🇧 Saving ENG: {fname_eng}")
-                    res_eng = worker_bot_finalize(tmpl, fold, fname_eng, content['ai_data'], url_map, True, selected_gemini)
-
-                if res_ita: st.success(f"✅ Fatto: {fname}")
-                else: st.error(f"❌ Errore: {fname}")
-                
-                bar.progress((i+1)/total_ops)
-            st.balloons()
-            time.sleep(2)
-
-    for fname, content in st.session_state.draft_data.items():
-        data = content['ai_data']
-        orig_imgs = st.session_state.original_images.get(fname, {})
-        
-        st.markdown(f"## 📂 {fname}")
-        
-        tabs = st.tabs(["🏠 1. Cover", "📄 2. L'Esperienza", "📄 3. L'Emozione", "🛠️ 4. Scheda Tecnica", "💰 7. Costi"])
-        
-        # --- TAB 1: COVER ---
-        with tabs[0]:
-            st.subheader("📝 Testi Cover")
-            new_t = st.text_input("Titolo Format (Globale)", value=data['page_1_cover'].get('title', ''), key=f"t1_{fname}")
-            new_s = st.text_input("Sottotitolo", value=data['page_1_cover'].get('subtitle', ''), key=f"s1_{fname}")
-            st.session_state.draft_data[fname]['ai_data']['page_1_cover']['title'] = new_t
-            st.session_state.draft_data[fname]['ai_data']['page_1_cover']['subtitle'] = new_s
-            
-            st.divider()
-            
-            c_ai, c_org = st.columns([1, 1], gap="large")
-            with c_ai:
-                st.info(f"🤖 **Generatore AI** ({selected_imagen})")
-                p = st.text_area("Prompt", value=data['page_1_cover'].get('image_prompt', ''), height=100, key=f"p1_{fname}")
-                if st.button("Genera Immagine", key=f"b1_{fname}", use_container_width=True):
-                    with st.spinner("🎨 Sto dipingendo... attendi..."):
-                        bytes_img = generate_imagen_safe(p, selected_imagen)
-                        if bytes_img: 
-                            st.session_state.final_images[fname]['cover'] = upload_bytes_to_bucket(bytes_img)
-                            st.rerun()
-                        else:
-                            st.warning("⚠️ Generazione fallita. Riprova o cambia prompt.")
-                
-                if st.session_state.final_images[fname].get('cover'):
-                    st.image(st.session_state.final_images[fname]['cover'], use_container_width=True)
-            
-            with c_org:
-                st.warning("📁 **Originale PPT**")
-                if orig_imgs.get(0):
-                    st.image(orig_imgs[0], caption=f"Originale ({len(orig_imgs[0])//1024} KB)", use_container_width=True)
-                    if st.button("Usa Originale", key=f"bo1_{fname}", use_container_width=True):
-                        st.session_state.final_images[fname]['cover'] = upload_bytes_to_bucket(orig_imgs[0]); st.rerun()
-
-        # --- TAB 2: DESC 1 ---
-        with tabs[1]:
-            st.subheader("📝 L'Esperienza")
-            new_b = st.text_area("Body (Azione)", value=data['page_2_desc'].get('body', ''), height=300, key=f"b2_{fname}")
-            st.session_state.draft_data[fname]['ai_data']['page_2_desc']['body'] = new_b
-            
-            st.divider()
-            
-            c_ai, c_org = st.columns([1, 1], gap="large")
-            with c_ai:
-                st.info(f"🤖 **Generatore AI** ({selected_imagen})")
-                p = st.text_area("Prompt", value=data['page_2_desc'].get('image_prompt', ''), height=100, key=f"p2_{fname}")
-                if st.button("Genera Immagine", key=f"b2_gen_{fname}", use_container_width=True):
-                    with st.spinner("🎨 Sto dipingendo..."):
-                        bytes_img = generate_imagen_safe(p, selected_imagen)
-                        if bytes_img: 
-                            st.session_state.final_images[fname]['desc_1'] = upload_bytes_to_bucket(bytes_img)
-                            st.rerun()
-                if st.session_state.final_images[fname].get('desc_1'):
-                    st.image(st.session_state.final_images[fname]['desc_1'], use_container_width=True)
-
-            with c_org:
-                st.warning("📁 **Originale PPT**")
-                if orig_imgs.get(1):
-                    st.image(orig_imgs[1], use_container_width=True)
-                    if st.button("Usa Originale", key=f"bo2_{fname}", use_container_width=True):
-                        st.session_state.final_images[fname]['desc_1'] = upload_bytes_to_bucket(orig_imgs[1]); st.rerun()
-
-        # --- TAB 3: DESC 2 ---
-        with tabs[2]:
-            st.subheader("📝 Il Valore")
-            new_b = st.text_area("Body (Emozione)", value=data['page_3_desc'].get('body', ''), height=300, key=f"b3_{fname}")
-            st.session_state.draft_data[fname]['ai_data']['page_3_desc']['body'] = new_b
-            
-            st.divider()
-            
-            c_ai, c_org = st.columns([1, 1], gap="large")
-            with c_ai:
-                st.info(f"🤖 **Generatore AI** ({selected_imagen})")
-                p = st.text_area("Prompt", value=data['page_3_desc'].get('image_prompt', ''), height=100, key=f"p3_{fname}")
-                if st.button("Genera Immagine", key=f"b3_gen_{fname}", use_container_width=True):
-                    with st.spinner("🎨 Sto dipingendo..."):
-                        bytes_img = generate_imagen_safe(p, selected_imagen)
-                        if bytes_img: 
-                            st.session_state.final_images[fname]['desc_2'] = upload_bytes_to_bucket(bytes_img)
-                            st.rerun()
-                if st.session_state.final_images[fname].get('desc_2'):
-                    st.image(st.session_state.final_images[fname]['desc_2'], use_container_width=True)
-
-            with c_org:
-                st.warning("📁 **Originale PPT**")
-                if orig_imgs.get(2):
-                    st.image(orig_imgs[2], use_container_width=True)
-                    if st.button("Usa Originale", key=f"bo3_{fname}", use_container_width=True):
-                        st.session_state.final_images[fname]['desc_2'] = upload_bytes_to_bucket(orig_imgs[2]); st.rerun()
-
-        # --- TAB 4: DETAILS ---
-        with tabs[3]:
-            st.subheader("🛠️ Dettagli Tecnici")
-            c1, c2, c3 = st.columns(3)
-            with c1:
-                st.markdown("**Svolgimento**")
-                v1 = st.text_area("Lista fasi", value=data['page_4_details'].get('svolgimento', ''), height=400, key=f"d1_{fname}")
-                st.session_state.draft_data[fname]['ai_data']['page_4_details']['svolgimento'] = v1
-            with c2:
-                st.markdown("**Logistica**")
-                v2 = st.text_area("Lista logistica", value=data['page_4_details'].get('logistica', ''), height=400, key=f"d2_{fname}")
-                st.session_state.draft_data[fname]['ai_data']['page_4_details']['logistica'] = v2
-            with c3:
-                st.markdown("**Tecnica**")
-                v3 = st.text_area("Lista tecnica", value=data['page_4_details'].get('tecnica', ''), height=400, key=f"d3_{fname}")
-                st.session_state.draft_data[fname]['ai_data']['page_4_details']['tecnica'] = v3
-
-        # --- TAB 5: COSTI ---
-        with tabs[4]:
-            st.subheader("💰 Dettagli Economici (Slide 7)")
-            det = st.text_area("Dettaglio Costi (Include/Esclude)", value=data.get('page_7_costi', {}).get('dettaglio', ''), height=400, key=f"c_det_{fname}")
-            
-            if 'page_7_costi' not in st.session_state.draft_data[fname]['ai_data']:
-                st.session_state.draft_data[fname]['ai_data']['page_7_costi'] = {}
-            st.session_state.draft_data[fname]['ai_data']['page_7_costi']['dettaglio'] = det
-
-        st.markdown("---")
+        if st.button("💾 SALVA SU DRIVE", type="primary", use_container_width=True, disabled=st.session_state.analysis is not None):
+            decks = []
+            for fname, content in st.session_state.draft_data.items():
+                url_map = pipeline.urls_map_for(st.session_state.final_images.get(fname, {}))
+                decks.append((fname, content['ai_data'], url_map))
+
+            # Traduzioni ENG già fatte e ancora valide (testo italiano invariato): si riusano
+            translations = {}
+            for fname, content in st.session_state.draft_data.items():
+                if content.get('ai_data_en') and content.get('ai_data_en_src') == brain.data_fingerprint(content['ai_data']):
+                    translations[fname] = content['ai_data_en']
+
+            st.session_state.save_job = save_jobs.start(
+                registry, save_jobs.get_store(), tmpl, fold, decks, make_english, selected_gemini,
+                int(drive_workers), int(llm_workers), use_llm_cache, translations, render_mode,
+                owner=st.session_state.session_owner)
+            st.session_state.save_job_shown = None
+
+        if st.button("📥 Prepara PPTX", use_container_width=True, disabled=st.session_state.analysis is not None,
+                     help="Compila i deck qui con python-pptx, da scaricare senza salvarli su Drive"):
+            st.session_state.local_pptx = {}
+            with st.spinner("🖨️ Compilo i PPTX..."):
+                for fname, content in st.session_state.draft_data.items():
+                    url_map = pipeline.urls_map_for(st.session_state.final_images.get(fname, {}))
+                    out = [(fname, False, None)]
+                    # ENG solo se la traduzione c'è già ed è ancora valida
+                    if make_english and content.get('ai_data_en') and content.get('ai_data_en_src') == brain.data_fingerprint(content['ai_data']):
+                        out.append((finalize.eng_filename(fname), True, content['ai_data_en']))
+                    for name, translate, en_data in out:
+                        try:
+                            data, failures = local_render.build_deck(registry, tmpl, content['ai_data'], url_map, translate, selected_gemini, en_data, use_llm_cache)
+                            st.session_state.local_pptx[name] = data
+                            for what, msg in failures: st.warning(f"⚠️ {name}: {what} non applicata — {msg}")
+                        except Exception as e:
+                            st.error(f"❌ PPTX {name}: {e}")
+        for name, data in st.session_state.local_pptx.items():
+            st.download_button(f"⬇️ {name}.pptx", data, file_name=f"{name}.pptx", mime=local_render.PPTX_MIME,
+                               key=f"dl_{name}", use_container_width=True)
+
+    if st.session_state.save_job:
+        prog = save_jobs.progress(save_jobs.get_store(), st.session_state.save_job)
+        if prog and prog["running"]:
+            save_job_status()
+        elif prog:
+            show_save_progress(prog)
+            if st.session_state.get("save_job_shown") != prog["job_id"]:
+                store_translations(prog)
+                st.session_state.save_job_shown = prog["job_id"]
+                if not prog["failed"] and not prog["error"]: st.balloons()
+
+    names = list(st.session_state.draft_data)
+    c_pp, c_pg = st.columns([1, 3])
+    with c_pp:
+        per_page = st.selectbox("Deck per pagina", DECKS_PER_PAGE, key="edit_per_page")
+    pages = [names[i:i + per_page] for i in range(0, len(names), per_page)] or [[]]
+    labels = [page_label(page, i, len(pages)) for i, page in enumerate(pages)]
+    if st.session_state.get("edit_page") not in labels: st.session_state.edit_page = labels[0]
+    with c_pg:
+        st.selectbox("Deck", labels, key="edit_page")
+
+    # Solo i deck della pagina scelta: il costo di ogni interazione non cresce col batch
+    for fname in pages[labels.index(st.session_state.edit_page)]:
+        deck_editor(fname)
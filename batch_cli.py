@@ -0,0 +1,212 @@
+"""Slide Monster da riga di comando: batch notturni senza browser.
+
+Uso:
+    python batch_cli.py CARTELLA_PPTX --template ID --folder ID \\
+        --service-account sa.json [--api-key KEY] [--images auto] [--summary out.json]
+        [--render local] [--pptx-dir CARTELLA]
+
+Per ogni .pptx della cartella: analisi + Gemini, immagini automatiche
+(opzionali), salvataggio ITA ed ENG su Drive. Stessa pipeline dell'app
+(pipeline.py), con parallelismo configurabile. Alla fine scrive un
+riepilogo JSON; exit code 1 se almeno un deck ha avuto errori.
+Con --render local/pptx i deck si compilano in locale (local_render.py);
+con --pptx-dir i .pptx compilati si scrivono anche su disco (basta
+--no-save per non caricare nulla su Drive).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import clients
+import copy_pool
+import finalize
+import local_render
+import pipeline
+import prefetch
+import tracing
+from settings import GCP_PROJECT_ID, GCS_BUCKET_NAME, GCP_LOCATION, GEMINI_MODELS, IMAGEN_MODELS, CONTEXT_TOKEN_BUDGET
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Slide Monster: elaborazione batch di una cartella di PPTX")
+    p.add_argument("input_dir", help="Cartella con i file .pptx")
+    p.add_argument("--template", default=os.environ.get("SLIDE_MONSTER_TEMPLATE_ID"), help="ID del template Slides")
+    p.add_argument("--folder", default=os.environ.get("SLIDE_MONSTER_FOLDER_ID"), help="ID della cartella Drive di output")
+    p.add_argument("--service-account", default=os.environ.get("GCP_SERVICE_ACCOUNT_FILE"), help="File JSON del service account")
+    p.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="API key Gemini (default: $GOOGLE_API_KEY)")
+    p.add_argument("--project", default=GCP_PROJECT_ID)
+    p.add_argument("--location", default=GCP_LOCATION)
+    p.add_argument("--bucket", default=GCS_BUCKET_NAME)
+    p.add_argument("--gemini-model", default=GEMINI_MODELS[0])
+    p.add_argument("--imagen-model", default=IMAGEN_MODELS[0])
+    p.add_argument("--images", choices=pipeline.IMAGE_MODES, default="none",
+                   help="none | original (immagini del PPT) | ai (Imagen) | auto (Imagen, altrimenti l'originale)")
+    p.add_argument("--no-english", action="store_true", help="Salva solo la versione ITA")
+    p.add_argument("--no-save", action="store_true", help="Solo analisi (e immagini): niente copie su Drive")
+    p.add_argument("--render", choices=pipeline.RENDER_MODES, default="slides",
+                   help="slides (copia + batchUpdate) | local (python-pptx, upload convertito in Slides) | pptx (python-pptx, upload .pptx)")
+    p.add_argument("--pptx-dir", help="Scrive qui anche i .pptx compilati in locale (ITA ed ENG)")
+    p.add_argument("--parse-workers", type=int, default=pipeline.DEFAULT_PARSE_WORKERS)
+    p.add_argument("--llm-workers", type=int, default=pipeline.DEFAULT_LLM_WORKERS)
+    p.add_argument("--drive-workers", type=int, default=pipeline.DEFAULT_DRIVE_WORKERS)
+    p.add_argument("--image-workers", type=int, default=prefetch.PREFETCH_WORKERS)
+    p.add_argument("--copy-pool", type=int, default=0, help="Copie template pre-riscaldate (vedi copy_pool.py)")
+    p.add_argument("--no-cache", action="store_true", help="Ignora la cache delle risposte Gemini")
+    p.add_argument("--context-budget", type=int, default=CONTEXT_TOKEN_BUDGET,
+                   help="Token massimi del testo sorgente per deck (0 = testo intero, senza compattazione)")
+    p.add_argument("--summary", default="slide_monster_summary.json", help="Dove scrivere il riepilogo JSON ('-' = stdout)")
+    p.add_argument("--trace", help="Prefisso per le tracce delle chiamate API: PREFISSO.jsonl e PREFISSO.prom")
+    args = p.parse_args(argv)
+    if not args.service_account:
+        p.error("serve --service-account (o $GCP_SERVICE_ACCOUNT_FILE)")
+    if not args.no_save and not (args.template and args.folder):
+        p.error("servono --template e --folder (oppure --no-save)")
+    if args.pptx_dir and not args.template:
+        p.error("--pptx-dir richiede --template")
+    return args
+
+
+def log(msg):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", file=sys.stderr, flush=True)
+
+
+def run(args):
+    """Esegue il batch e restituisce il riepilogo (dict serializzabile in JSON)."""
+    with open(args.service_account) as f:
+        registry = clients.get_registry(f.read(), args.api_key, args.project, args.location, args.bucket)
+
+    names = sorted(n for n in os.listdir(args.input_dir) if n.lower().endswith(".pptx") and not n.startswith("~$"))
+    files = []
+    for n in names:
+        with open(os.path.join(args.input_dir, n), "rb") as f:
+            files.append((os.path.splitext(n)[0] + "_ITA", f.read()))
+
+    use_cache = not args.no_cache
+    started = time.time()
+    summary = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "input_dir": os.path.abspath(args.input_dir),
+        "options": {k: v for k, v in vars(args).items() if k not in ("api_key", "service_account")},
+        "decks": {fname: {"source": n, "ok": True, "errors": []} for n, (fname, _) in zip(names, files)},
+        "stages": {},
+    }
+    decks = summary["decks"]
+
+    def fail(fname, stage, err):
+        decks[fname]["ok"] = False
+        decks[fname]["errors"].append({"stage": stage, "error": str(err)})
+        log(f"❌ {fname} [{stage}]: {err}")
+
+    # --- ANALISI ---
+    t = time.time()
+    analyzed = {}
+    for fname, res, err in pipeline.analyze_batch(registry, files, args.gemini_model, args.parse_workers, args.llm_workers, use_cache,
+                                                  context_budget=args.context_budget):
+        if err is not None:
+            fail(fname, "analysis", err)
+        elif res["ai_data"]:
+            analyzed[fname] = res
+            decks[fname]["ai_data"] = res["ai_data"]
+            log(f"🧠 {fname} analizzato ({len(analyzed)}/{len(files)})")
+        else:
+            fail(fname, "analysis", "risposta Gemini vuota")
+    summary["stages"]["analysis_s"] = round(time.time() - t, 2)
+
+    # --- IMMAGINI ---
+    t = time.time()
+    final_images = {fname: {} for fname in analyzed}
+    for fname, slot, url, err in pipeline.images_batch(registry, analyzed, args.images, args.imagen_model, args.image_workers):
+        if err is not None:
+            fail(fname, f"image:{slot}", err)
+        elif url:
+            final_images[fname][slot] = url
+            log(f"🎨 {fname}/{slot}")
+    for fname, saved in final_images.items():
+        decks[fname]["images"] = saved
+    summary["stages"]["images_s"] = round(time.time() - t, 2)
+
+    # --- SALVATAGGIO ITA / ENG ---
+    t = time.time()
+    translations = {}
+    if not args.no_save and analyzed:
+        copy_pool.configure(registry, args.template, args.folder, args.copy_pool)
+        batch = [(fname, analyzed[fname]["ai_data"], pipeline.urls_map_for(final_images[fname])) for fname in analyzed]
+        # I file ENG hanno il loro nome: si risale al deck ITA
+        owner = {**{f: f for f, _, _ in batch}, **{finalize.eng_filename(f): f for f, _, _ in batch}}
+        for out_name, lang, new_id, failures, err in pipeline.finalize_batch(
+                registry, args.template, args.folder, batch, not args.no_english, args.gemini_model,
+                args.drive_workers, args.llm_workers, use_cache, translations, render=args.render):
+            fname = owner[out_name]
+            entry = decks[fname].setdefault("files", {})
+            entry[lang] = {
+                "name": out_name,
+                "id": new_id,
+                "url": f"https://docs.google.com/presentation/d/{new_id}/edit" if new_id else None,
+                "skipped_requests": [{"request": what, "error": msg} for what, msg in failures],
+            }
+            if new_id:
+                log(f"💾 {out_name} ({lang})")
+            else:
+                fail(fname, f"save:{lang}", err)
+        for fname, en_data in translations.items():
+            decks[fname]["ai_data_en"] = en_data
+    summary["stages"]["save_s"] = round(time.time() - t, 2)
+
+    # --- PPTX LOCALI ---
+    if args.pptx_dir and analyzed:
+        t = time.time()
+        os.makedirs(args.pptx_dir, exist_ok=True)
+        langs = [("ITA", False)] if args.no_english else [("ITA", False), ("ENG", True)]
+        for fname in analyzed:
+            for lang, translate in langs:
+                out_name = finalize.eng_filename(fname) if translate else fname
+                try:
+                    data, failures = local_render.build_deck(
+                        registry, args.template, analyzed[fname]["ai_data"], pipeline.urls_map_for(final_images[fname]),
+                        translate, args.gemini_model, translations.get(fname), use_cache)
+                except Exception as e:
+                    fail(fname, f"pptx:{lang}", e)
+                    continue
+                path = os.path.join(args.pptx_dir, out_name + ".pptx")
+                with open(path, "wb") as f:
+                    f.write(data)
+                decks[fname].setdefault("pptx", {})[lang] = {
+                    "path": path, "skipped_requests": [{"request": what, "error": msg} for what, msg in failures]}
+                log(f"🖨️ {path}")
+        summary["stages"]["pptx_s"] = round(time.time() - t, 2)
+
+    summary["elapsed_s"] = round(time.time() - started, 2)
+    summary["totals"] = {
+        "decks": len(files),
+        "ok": sum(1 for d in decks.values() if d["ok"]),
+        "failed": sum(1 for d in decks.values() if not d["ok"]),
+        "files_saved": sum(1 for d in decks.values() for f in d.get("files", {}).values() if f["id"]),
+    }
+    return summary
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = run(args)
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == "-":
+        print(text)
+    else:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text)
+        log(f"Riepilogo scritto in {args.summary}")
+    if args.trace:
+        with open(args.trace + ".jsonl", "w", encoding="utf-8") as f:
+            f.write(tracing.tracer.export_jsonl())
+        with open(args.trace + ".prom", "w", encoding="utf-8") as f:
+            f.write(tracing.tracer.export_prometheus())
+        log(f"Tracce scritte in {args.trace}.jsonl / {args.trace}.prom")
+    totals = summary["totals"]
+    log(f"Fatto: {totals['ok']}/{totals['decks']} deck ok, {totals['files_saved']} file salvati in {summary['elapsed_s']}s")
+    return 0 if totals["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
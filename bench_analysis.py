@@ -0,0 +1,126 @@
+"""Benchmark analyze_pptx_content su deck sintetici grandi.
+
+Uso: python bench_analysis.py [N_SLIDE] [N_IMG_MASTER] [KB_PER_IMG]
+
+Confronta l'estrazione originale (blob letti per ogni immagine, layout e
+master riscansionati per ogni slide) con quella di analysis.py, e a parte
+la sola apertura del pacchetto: python-pptx sul file intero contro il
+lettore senza media di analysis.py.
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.util import Inches
+
+import analysis
+
+
+def make_png(kb, seed):
+    """PNG valido di circa `kb` KB (chunk tEXt di riempimento)."""
+    import struct
+    import zlib
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+    ihdr = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    idat = zlib.compress(b"\x00" + bytes([seed % 256, 0, 0]))
+    filler = chunk(b"tEXt", b"x\x00" + os.urandom(kb * 1024))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + filler + chunk(b"IDAT", idat) + chunk(b"IEND", b"")
+
+
+def add_picture_xml(owner, png, shape_id):
+    """Master e layout non hanno add_picture: si inserisce il <p:pic> a mano."""
+    from pptx.oxml.shapes.picture import CT_Picture
+    _, rId = owner.part.get_or_add_image_part(io.BytesIO(png))
+    pic = CT_Picture.new_pic(shape_id, f"Picture {shape_id}", "", rId, Inches(0), Inches(0), Inches(1), Inches(1))
+    owner.shapes._spTree.append(pic)
+
+
+def make_deck(n_slides, n_master_imgs, kb):
+    prs = Presentation()
+    master = prs.slide_masters[0]
+    for k in range(n_master_imgs):
+        add_picture_xml(master, make_png(kb, k), 1000 + k)
+    for k, layout in enumerate(prs.slide_layouts):
+        add_picture_xml(layout, make_png(kb // 2, 100 + k), 2000 + k)
+    for i in range(n_slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[i % len(prs.slide_layouts)])
+        tb = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1))
+        tb.text_frame.text = f"Slide {i} testo di prova"
+        slide.shapes.add_picture(io.BytesIO(make_png(kb // 4 + i, 200 + i)), Inches(2), Inches(2), Inches(2), Inches(2))
+        slide.notes_slide.notes_text_frame.text = f"nota {i}"
+    out = io.BytesIO()
+    prs.save(out)
+    return out.getvalue()
+
+
+def legacy_images(shapes):
+    found = []
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+            try:
+                blob = shape.image.blob
+                found.append((len(blob), blob))
+            except: pass
+        elif shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            found.extend(legacy_images(shape.shapes))
+        elif shape.shape_type == MSO_SHAPE_TYPE.PLACEHOLDER and hasattr(shape, "image"):
+            try:
+                blob = shape.image.blob
+                found.append((len(blob), blob))
+            except: pass
+    return found
+
+
+def legacy_analyze(data):
+    """Replica della vecchia estrazione immagini (il testo è invariato)."""
+    prs = Presentation(io.BytesIO(data))
+    out = {}
+    for i, slide in enumerate(prs.slides):
+        cands = legacy_images(slide.shapes)
+        cands.extend(legacy_images(slide.slide_layout.shapes))
+        cands.extend(legacy_images(slide.slide_layout.slide_master.shapes))
+        if cands:
+            cands.sort(key=lambda x: x[0], reverse=True)
+            out[i] = cands[0][1]
+    return out
+
+
+def measure(fn, data, repeat=3):
+    """Tempo migliore su `repeat` run; picco memoria in un run separato (tracemalloc rallenta)."""
+    elapsed = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn(data)
+        elapsed.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, min(elapsed), peak
+
+
+if __name__ == "__main__":
+    n_slides = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    n_master = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    kb = int(sys.argv[3]) if len(sys.argv) > 3 else 800
+    data = make_deck(n_slides, n_master, kb)
+    print(f"Deck: {n_slides} slide, {n_master} immagini nel master da {kb} KB, {len(data) / 1e6:.1f} MB")
+
+    old, t_old, m_old = measure(legacy_analyze, data)
+    (_, new), t_new, m_new = measure(analysis.analyze_pptx_bytes, data)
+    assert old == new, "le immagini estratte non coincidono"
+    print(f"legacy     {t_old * 1000:8.1f} ms | picco memoria {m_old / 1e6:7.1f} MB")
+    print(f"analysis   {t_new * 1000:8.1f} ms | picco memoria {m_new / 1e6:7.1f} MB")
+
+    _, t_full, m_full = measure(lambda d: Presentation(io.BytesIO(d)), data)
+    _, t_lazy, m_lazy = measure(lambda d: analysis._open_without_media(zipfile.ZipFile(io.BytesIO(d))), data)
+    print("apertura pacchetto:")
+    print(f"  completa   {t_full * 1000:8.1f} ms | picco memoria {m_full / 1e6:7.1f} MB")
+    print(f"  senza media{t_lazy * 1000:8.1f} ms | picco memoria {m_lazy / 1e6:7.1f} MB")
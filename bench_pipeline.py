@@ -0,0 +1,146 @@
+"""Benchmark end-to-end della pipeline su servizi finti (fakes.py).
+
+Uso: python bench_pipeline.py [--decks 12] [--sizes 10,30,60] [--latency-scale 0.1]
+                              [--rate-429 0.05] [--error-rate 0.01] [--render local] [--json risultati.json]
+
+Analisi (parsing vero + Gemini finto), immagini Imagen + GCS e salvataggio
+ITA/ENG (Drive/Slides finti) su deck sintetici di varie dimensioni. Riporta
+deck/minuto per fase, percentili di latenza e numero di chiamate per API.
+Nessuna chiamata esce dal processo; cache LLM disattivata.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Cache su disco (traduzioni statiche del template...) in una cartella usa e getta
+os.environ["SLIDE_MONSTER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_pipeline_")
+
+import fakes
+import pipeline
+import prefetch
+from bench_analysis import make_deck
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def stage_report(backend):
+    ops = {}
+    for op in sorted(backend.calls):
+        lat = backend.latencies[op]
+        ops[op] = {
+            "calls": backend.calls[op], "errors": backend.errors[op],
+            "p50_ms": round(percentile(lat, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(lat, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 1),
+        }
+    return ops
+
+
+def run_stage(name, backend, n_decks, fn):
+    backend.reset_stats()
+    t0 = time.perf_counter()
+    ok, failed = fn()
+    elapsed = time.perf_counter() - t0
+    return {
+        "stage": name, "seconds": round(elapsed, 2), "ok": ok, "failed": failed,
+        "decks_per_min": round(n_decks / elapsed * 60, 1) if elapsed else None,
+        "api": stage_report(backend),
+    }
+
+
+def print_stage(rep):
+    print(f"\n== {rep['stage']}: {rep['seconds']}s · {rep['decks_per_min']} deck/min · ok {rep['ok']} · falliti {rep['failed']}")
+    if rep["api"]:
+        print(f"   {'API':36} {'chiamate':>8} {'errori':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, r in rep["api"].items():
+        print(f"   {op:36} {r['calls']:8} {r['errors']:7} {r['p50_ms']:9} {r['p95_ms']:9} {r['p99_ms']:9}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark pipeline su servizi finti")
+    p.add_argument("--decks", type=int, default=12)
+    p.add_argument("--sizes", default="10,30,60", help="Numero di slide dei deck sintetici (a rotazione)")
+    p.add_argument("--kb", type=int, default=200, help="KB per immagine del master")
+    p.add_argument("--latency-scale", type=float, default=0.1, help="Moltiplicatore delle latenze tipiche (1 = realistiche)")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--rate-429", type=float, default=0.0)
+    p.add_argument("--image-fail-rate", type=float, default=0.0, help="Probabilità che Slides rifiuti un replaceImage")
+    p.add_argument("--quotas", action="store_true", help="Applica i RateLimiter reali di Drive/Slides")
+    p.add_argument("--parse-workers", type=int, default=pipeline.DEFAULT_PARSE_WORKERS)
+    p.add_argument("--llm-workers", type=int, default=pipeline.DEFAULT_LLM_WORKERS)
+    p.add_argument("--drive-workers", type=int, default=pipeline.DEFAULT_DRIVE_WORKERS)
+    p.add_argument("--image-workers", type=int, default=prefetch.PREFETCH_WORKERS)
+    p.add_argument("--render", choices=pipeline.RENDER_MODES, default="slides", help="Come si compilano i file salvati")
+    p.add_argument("--no-images", action="store_true")
+    p.add_argument("--no-english", action="store_true")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", help="Scrive anche il report in JSON")
+    args = p.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    print(f"Genero {args.decks} deck sintetici ({args.sizes} slide)...")
+    files = [(f"deck{i:03d}_ITA", make_deck(sizes[i % len(sizes)], 2, args.kb)) for i in range(args.decks)]
+
+    config = fakes.FakeConfig(args.latency_scale, args.error_rate, args.rate_429, args.image_fail_rate, seed=args.seed)
+    backend = fakes.FakeBackend(config)
+    registry = fakes.FakeRegistry(backend, quotas=args.quotas)
+    template_id = backend.add_template()
+    folder_id = "fake-folder"
+    model, imagen = "fake-gemini", "fake-imagen"
+    analyzed = {}
+    final_images = {}
+
+    def analysis_stage():
+        failed = 0
+        for fname, res, err in pipeline.analyze_batch(registry, files, model, args.parse_workers, args.llm_workers, use_cache=False):
+            if err is None: analyzed[fname] = res
+            else: failed += 1
+        return len(analyzed), failed
+
+    def images_stage():
+        failed_decks = set()
+        for fname in analyzed: final_images[fname] = {}
+        for fname, slot, url, err in pipeline.images_batch(registry, analyzed, "ai", imagen, args.image_workers):
+            if err is not None: failed_decks.add(fname)
+            elif url: final_images[fname][slot] = url
+        return len(analyzed) - len(failed_decks), len(failed_decks)
+
+    def finalize_stage():
+        decks = [(f, analyzed[f]["ai_data"], pipeline.urls_map_for(final_images.get(f, {}))) for f in analyzed]
+        ok = failed = 0
+        for _, _, new_id, _, err in pipeline.finalize_batch(registry, template_id, folder_id, decks, not args.no_english, model,
+                                                            args.drive_workers, args.llm_workers, use_cache=False, render=args.render):
+            if new_id: ok += 1
+            else: failed += 1
+        return ok, failed
+
+    t0 = time.perf_counter()
+    report = {"options": vars(args), "stages": []}
+    report["stages"].append(run_stage("analisi", backend, len(files), analysis_stage))
+    if not args.no_images:
+        report["stages"].append(run_stage("immagini", backend, len(analyzed), images_stage))
+    report["stages"].append(run_stage("salvataggio", backend, len(analyzed), finalize_stage))
+    total = time.perf_counter() - t0
+    report["total_seconds"] = round(total, 2)
+    report["decks_per_min"] = round(len(files) / total * 60, 1)
+
+    for rep in report["stages"]:
+        print_stage(rep)
+    print(f"\nTOTALE: {len(files)} deck in {report['total_seconds']}s · {report['decks_per_min']} deck/min")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
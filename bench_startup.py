@@ -0,0 +1,64 @@
+"""Benchmark bootstrap client: avvio a freddo vs rerun Streamlit.
+
+Uso: python bench_startup.py service_account.json API_KEY [N_RERUN]
+
+Confronta il vecchio blocco di inizializzazione (ricostruito a ogni rerun)
+con il registry di clients.py (costruito una volta, poi riusato).
+"""
+import sys
+import time
+import statistics
+
+import clients
+from settings import GCP_PROJECT_ID, GCS_BUCKET_NAME, GCP_LOCATION
+
+
+def legacy_bootstrap(sa_json, api_key):
+    """Replica del vecchio blocco INIZIALIZZAZIONE di app.py."""
+    import json
+    import google.generativeai as genai
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    from google.cloud import storage
+    import vertexai
+    info = json.loads(sa_json)
+    creds = service_account.Credentials.from_service_account_info(info, scopes=clients.SCOPES)
+    genai.configure(api_key=api_key)
+    build('drive', 'v3', credentials=creds)
+    build('slides', 'v1', credentials=creds)
+    vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION, credentials=creds)
+    storage.Client(credentials=creds, project=GCP_PROJECT_ID).bucket(GCS_BUCKET_NAME)
+
+
+def registry_bootstrap(sa_json, api_key):
+    reg = clients.get_registry(sa_json, api_key, GCP_PROJECT_ID, GCP_LOCATION, GCS_BUCKET_NAME)
+    reg.genai()
+    reg.drive()
+    reg.slides()
+    reg.bucket()
+    reg.init_vertex()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - t0) * 1000
+
+
+def report(label, samples):
+    print(f"{label:<22} cold {samples[0]:8.1f} ms | rerun median {statistics.median(samples[1:]):8.2f} ms "
+          f"| rerun max {max(samples[1:]):8.2f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        sa_json = f.read()
+    api_key = sys.argv[2]
+    n = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    # Il registry va misurato per primo: altrimenti gli import sono già caldi
+    report("registry (clients.py)", [timed(registry_bootstrap, sa_json, api_key) for _ in range(n)])
+    report("legacy (per rerun)", [timed(legacy_bootstrap, sa_json, api_key) for _ in range(n)])
@@ -0,0 +1,475 @@
+import contextvars
+import copy
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import context_builder
+import llm_cache
+import tracing
+from settings import CONTEXT_TOKEN_BUDGET
+
+# ======================================================
+# 🧠 CHIAMATE GEMINI (TESTO)
+# ======================================================
+# Tutte le funzioni ricevono il registry di clients.py: possono girare
+# in thread separati e non toccano l'interfaccia Streamlit.
+# Le risposte passano dalla cache persistente (llm_cache.py); con use_cache=False
+# non si legge dalla cache ma le risposte nuove vengono comunque salvate.
+
+# Da incrementare quando si modifica il testo di un prompt: invalida la cache
+PROMPT_VERSIONS = {"brain": 1, "context_summary": 1, "pages_batch": 1, "pages_single": 1, "translate_batch": 1, "translate_fields": 1, "translate_list": 1}
+
+def _cache_key(kind, model_name, contents):
+    return llm_cache.LLMCache.make_key(kind, PROMPT_VERSIONS[kind], model_name, contents)
+
+def _cache_put(kind, model_name, contents, data):
+    cache = llm_cache.get_cache()
+    if cache:
+        try: cache.put(_cache_key(kind, model_name, contents), kind, model_name, data)
+        except Exception as e: print(f"Errore scrittura cache LLM: {e}")
+
+def _generate_json(registry, kind, model_name, contents, use_cache=True, refresh=False, schema=None, cacheable=None):
+    """generate_content in JSON con cache. refresh=True (o use_cache=False) ignora
+    la cache in lettura ma la aggiorna.
+
+    Con schema la risposta è vincolata a quella struttura (response_schema).
+    cacheable(risposta) -> False: la risposta si usa ma non si salva in cache.
+    """
+    cache = llm_cache.get_cache()
+    key = _cache_key(kind, model_name, contents)
+    if use_cache and not refresh:
+        try:
+            hit = cache.get(key)
+            if hit is not None:
+                tracing.event("gemini", kind, "cache")
+                return hit
+        except Exception as e:
+            print(f"Errore lettura cache LLM: {e}")
+
+    generation_config = {"response_mime_type": "application/json"}
+    if schema: generation_config["response_schema"] = schema
+    model = registry.genai().GenerativeModel(model_name)
+    with tracing.attempt(1 if refresh else 0), tracing.span("gemini", kind, len(contents.encode("utf-8"))) as sp:
+        resp = model.generate_content(contents, generation_config=generation_config)
+        sp.bytes_in = len(resp.text.encode("utf-8"))
+        data = json.loads(resp.text)
+
+    if cacheable is None or cacheable(data):
+        _cache_put(kind, model_name, contents, data)
+    return data
+
+def _brain_prompt(text):
+    """PROMPT PRO COPYWRITER."""
+    prompt = f"""
+    Sei un SENIOR COPYWRITER esperto in Team Building e vendita di eventi B2B.
+    Il tuo compito è analizzare il materiale grezzo (Slide + Note) e riscriverlo per VENDERE il format.
+    
+    ⚠️ REGOLE ASSOLUTE DI STILE:
+    1. **NO EMOJI**. Sei professionale.
+    2. **LUNGHEZZA:** I testi descrittivi (Pagina 2 e 3) devono essere CORPOSI (almeno 130-150 parole l'uno). Non fare riassuntini. Scrivi testi ricchi, ben articolati in paragrafi.
+    3. **FORMATTAZIONE:** Usa il **MAIUSCOLO** per le parole chiave e gli elenchi puntati (simbolo •).
+    4. **TONO:** Persuasivo, incoraggiante, emozionale ma concreto.
+    
+    STRUTTURA JSON:
+    {{
+        "page_1_cover": {{ "title": "NOME DEL FORMAT", "subtitle": "Slogan", "image_prompt": "Visual description in English" }},
+        "page_2_desc": {{ "body": "Testo ESTESO (min 130 parole) sull'azione. Usa paragrafi e MAIUSCOLO per enfasi.", "image_prompt": "Visual description in English" }},
+        "page_3_desc": {{ "body": "Testo ESTESO (min 130 parole) sull'emozione. Usa paragrafi e MAIUSCOLO per enfasi.", "image_prompt": "Visual description in English" }},
+        "page_4_details": {{
+            "svolgimento": "Elenco puntato (•) DETTAGLIATO delle fasi.",
+            "logistica": "Elenco puntato (•) DETTAGLIATO (spazi, tempi, pax).",
+            "tecnica": "Elenco puntato (•) DETTAGLIATO (audio, video, prese)."
+        }},
+        "page_7_costi": {{ "dettaglio": "Elenco puntato (•) CHIARO: IL COSTO INCLUDE... / IL COSTO NON COMPRENDE..." }}
+    }}
+    """
+    return f"{prompt}\n\nTESTO SORGENTE:\n{text}"
+
+# ======================================================
+# ✂️ CONTESTO ENTRO BUDGET (VEDI context_builder.py)
+# ======================================================
+
+SUMMARY_PROMPT = """
+    Riassumi in italiano il seguente blocco di slide di un format di Team Building.
+    Tieni nome del format, fasi, numeri (tempi, partecipanti, spazi), requisiti tecnici e costi.
+    Niente commenti, niente emoji. Massimo {words} parole.
+    RISPONDI SOLO JSON: {{"summary": "..."}}
+    """
+SUMMARY_SCHEMA = {"type": "object", "properties": {"summary": {"type": "string"}}, "required": ["summary"]}
+
+def count_tokens(registry, model_name, text):
+    """Token veri del modello (una chiamata count_tokens, senza generazione)."""
+    with tracing.span("gemini", "count_tokens", len(text.encode("utf-8"))):
+        return registry.genai().GenerativeModel(model_name).count_tokens(text).total_tokens
+
+def summarize_chunk(registry, model_name, text, words, use_cache=True):
+    contents = f"{SUMMARY_PROMPT.format(words=words)}\n\nSLIDE:\n{text}"
+    return _generate_json(registry, "context_summary", model_name, contents, use_cache, schema=SUMMARY_SCHEMA)["summary"]
+
+def source_context(registry, text, model_name, budget=None, use_cache=True):
+    """Testo sorgente ripulito e portato entro budget token (None = CONTEXT_TOKEN_BUDGET, 0 = testo intero)."""
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if budget <= 0:
+        return text
+    return context_builder.build_context(
+        text, budget,
+        count_tokens=lambda t: count_tokens(registry, model_name, t),
+        summarize=lambda t, words: summarize_chunk(registry, model_name, t, words, use_cache))
+
+def brain_process(registry, text, model_name, use_cache=True, budget=None):
+    """Solleva eccezione in caso di errore Gemini."""
+    text = source_context(registry, text, model_name, budget, use_cache)
+    return _generate_json(registry, "brain", model_name, _brain_prompt(text), use_cache)
+
+# ======================================================
+# 🌊 STREAMING: CAMPI PRONTI MAN MANO CHE ARRIVANO
+# ======================================================
+
+class JSONFieldStream:
+    """Parser incrementale di un oggetto JSON che arriva a pezzi.
+
+    feed(chunk) restituisce i valori appena COMPLETATI fino a profondità 2,
+    come (percorso, valore): es. (("page_2_desc", "body"), "...") e poi
+    (("page_2_desc",), {...}) alla chiusura della sezione. Un valore
+    restituito è definitivo: il resto della risposta non lo cambia.
+    """
+
+    MAX_DEPTH = 2
+
+    def __init__(self):
+        self.buf = ""
+        self._i = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = None
+        # Un livello per oggetto aperto: {"path", "key", "expect", "value_start", "start"}
+        self._stack = []
+
+    def feed(self, chunk):
+        self.buf += chunk
+        out = []
+        buf = self.buf
+        while self._i < len(buf):
+            c = buf[self._i]
+            if self._in_str:
+                if self._esc: self._esc = False
+                elif c == "\\": self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    self._end_string(self._i, out)
+            elif c == '"':
+                self._in_str = True
+                self._str_start = self._i
+                if self._stack and self._stack[-1]["expect"] == "value" and self._stack[-1]["value_start"] is None:
+                    self._stack[-1]["value_start"] = self._i
+            elif c in "{[":
+                top = self._stack[-1] if self._stack else None
+                if c == "{" and (top is None or (top["expect"] == "value" and top["value_start"] is None and top["path"] is not None)):
+                    path = () if top is None else top["path"] + (top["key"],)
+                    if top is not None: top["value_start"] = self._i
+                    self._stack.append({"path": path if len(path) < self.MAX_DEPTH else None, "key": None,
+                                        "expect": "key", "value_start": None, "start": self._i})
+                else:
+                    # Liste o oggetti troppo profondi: si seguono solo per ritrovare la chiusura
+                    if top is not None and top["expect"] == "value" and top["value_start"] is None: top["value_start"] = self._i
+                    self._stack.append({"path": None, "key": None, "expect": "opaque", "value_start": None, "start": self._i})
+            elif c in "}]":
+                self._close_primitive(self._i, out)
+                self._stack.pop()
+                if self._stack:
+                    parent = self._stack[-1]
+                    if parent["path"] is not None and parent["expect"] == "value":
+                        out.append((parent["path"] + (parent["key"],), json.loads(buf[parent["value_start"]:self._i + 1])))
+                        parent["expect"] = "comma"
+            elif c == ":":
+                if self._stack and self._stack[-1]["expect"] == "colon": self._stack[-1]["expect"] = "value"
+            elif c == ",":
+                self._close_primitive(self._i, out)
+                if self._stack and self._stack[-1]["expect"] != "opaque":
+                    top = self._stack[-1]
+                    top["expect"], top["key"], top["value_start"] = "key", None, None
+            elif not c.isspace():
+                top = self._stack[-1] if self._stack else None
+                if top is not None and top["expect"] == "value" and top["value_start"] is None:
+                    top["value_start"] = self._i
+            self._i += 1
+        return out
+
+    def _end_string(self, end, out):
+        top = self._stack[-1] if self._stack else None
+        if top is None or top["expect"] == "opaque": return
+        if top["expect"] == "key":
+            top["key"] = json.loads(self.buf[self._str_start:end + 1])
+            top["expect"] = "colon"
+        elif top["expect"] == "value" and top["value_start"] == self._str_start:
+            if top["path"] is not None:
+                out.append((top["path"] + (top["key"],), json.loads(self.buf[self._str_start:end + 1])))
+            top["expect"] = "comma"
+
+    def _close_primitive(self, end, out):
+        # Numeri, true/false/null: finiscono alla virgola o alla graffa
+        top = self._stack[-1] if self._stack else None
+        if top and top["expect"] == "value" and top["value_start"] is not None:
+            raw = self.buf[top["value_start"]:end].strip()
+            if raw and top["path"] is not None:
+                out.append((top["path"] + (top["key"],), json.loads(raw)))
+            top["expect"] = "comma"
+
+def brain_process_stream(registry, text, model_name, use_cache=True, on_field=None, budget=None):
+    """Come brain_process, ma in streaming: on_field(sezione, campo, valore) viene
+    chiamata appena ogni campo è completo. Restituisce l'ai_data intero."""
+    on_field = on_field or (lambda sec, field, value: None)
+    contents = _brain_prompt(source_context(registry, text, model_name, budget, use_cache))
+    cache = llm_cache.get_cache()
+    key = llm_cache.LLMCache.make_key("brain", PROMPT_VERSIONS["brain"], model_name, contents)
+    if use_cache:
+        try:
+            hit = cache.get(key)
+        except Exception as e:
+            print(f"Errore lettura cache LLM: {e}")
+            hit = None
+        if hit is not None:
+            tracing.event("gemini", "brain", "cache")
+            for sec, fields in hit.items():
+                for field, value in (fields.items() if isinstance(fields, dict) else []):
+                    on_field(sec, field, value)
+            return hit
+
+    parser = JSONFieldStream()
+    model = registry.genai().GenerativeModel(model_name)
+    with tracing.span("gemini", "brain_stream", len(contents.encode("utf-8"))) as sp:
+        for chunk in model.generate_content(contents, generation_config={"response_mime_type": "application/json"}, stream=True):
+            for path, value in parser.feed(chunk.text):
+                if len(path) == 2: on_field(path[0], path[1], value)
+        sp.bytes_in = len(parser.buf.encode("utf-8"))
+    data = json.loads(parser.buf)
+
+    if cache:
+        try: cache.put(key, "brain", model_name, data)
+        except Exception as e: print(f"Errore scrittura cache LLM: {e}")
+    return data
+
+# ======================================================
+# 🇬🇧 TRADUZIONE DECK (STRUTTURATA, A BATCH)
+# ======================================================
+
+TRANSLATE_PROMPT = """
+    You are a professional translator and copywriter. 
+    Translate the values in the following JSON from Italian to English.
+    The top-level keys identify separate decks: keep every key and the exact structure.
+    RULES:
+    1. **Translate fully**. Do not summarize. Keep the text long and persuasive.
+    2. **Maintain formatting**: Keep the bullet points (•) and UPPERCASE words.
+    3. Every value must be in ENGLISH: do not leave any field in Italian.
+    Return ONLY valid JSON.
+    """
+# Deck per richiesta in modalità batch
+TRANSLATE_BATCH_SIZE = 4
+# Il nome del format resta com'è; i prompt immagine sono già in inglese e non finiscono nel deck
+KEEP_FIELDS = {("page_1_cover", "title")}
+SKIP_FIELDS = {"image_prompt"}
+# Sotto questa lunghezza un testo identico all'originale può essere legittimo (es. "Team Building")
+MIN_CHECK_LEN = 20
+
+class TranslationError(Exception):
+    """Campi rimasti non tradotti dopo il retry: il deck non va salvato né riusato come ENG."""
+
+    def __init__(self, fields):
+        super().__init__(f"Traduzione incompleta: {sorted(fields)}")
+        self.fields = fields
+
+def _translatable(ai_data):
+    """Solo i campi da tradurre: {sezione: {campo: testo}}."""
+    out = {}
+    for sec, fields in ai_data.items():
+        if not isinstance(fields, dict): continue
+        keep = {k: v for k, v in fields.items()
+                if isinstance(v, str) and v.strip() and k not in SKIP_FIELDS and (sec, k) not in KEEP_FIELDS}
+        if keep: out[sec] = keep
+    return out
+
+def _schema_for(payload):
+    """response_schema che ricalca esattamente la struttura inviata (anche annidata)."""
+    if isinstance(payload, dict):
+        return {"type": "object", "properties": {k: _schema_for(v) for k, v in payload.items()}, "required": list(payload)}
+    return {"type": "string"}
+
+def untranslated_fields(src, out):
+    """Campi (sezione, campo) mancanti, vuoti o rimasti identici all'italiano."""
+    bad = []
+    for sec, fields in src.items():
+        got = out.get(sec) if isinstance(out, dict) else None
+        for k, v in fields.items():
+            en = got.get(k) if isinstance(got, dict) else None
+            if not isinstance(en, str) or not en.strip() or (en.strip() == v.strip() and len(v) >= MIN_CHECK_LEN):
+                bad.append((sec, k))
+    return bad
+
+def _translation_contents(payload):
+    return f"{TRANSLATE_PROMPT}\n\nJSON:\n{json.dumps(payload, ensure_ascii=False)}"
+
+def _translation_complete(payload, out):
+    """True se ogni deck del payload torna tradotto per intero."""
+    if not isinstance(out, dict): return False
+    return not any(untranslated_fields(sections, out.get(k) or {}) for k, sections in payload.items())
+
+def _request_translation(registry, kind, payload, model_name, use_cache, refresh=False):
+    # Una risposta incompleta non va in cache: la prossima volta verrebbe riletta uguale
+    try:
+        return _generate_json(registry, kind, model_name, _translation_contents(payload), use_cache, refresh,
+                              schema=_schema_for(payload), cacheable=lambda out: _translation_complete(payload, out))
+    except Exception as e:
+        print(f"Errore Traduzione ({kind}): {e}")
+        return {}
+
+def translate_decks(registry, decks, model_name, use_cache=True):
+    """Traduce più deck: {fname: ai_data} -> {fname: ai_data inglese}.
+
+    TRANSLATE_BATCH_SIZE deck per richiesta, risposta vincolata da schema.
+    I campi mancanti o non tradotti vengono ritentati UNA volta, da soli.
+    Se qualcuno resta non tradotto, al posto del deck c'è una TranslationError
+    (come imagen_client.generate_many): mai un deck mezzo italiano come ENG.
+    """
+    results = {}
+    names = list(decks)
+    for start in range(0, len(names), TRANSLATE_BATCH_SIZE):
+        chunk = names[start:start + TRANSLATE_BATCH_SIZE]
+        # Chiavi neutre: i nomi file possono contenere caratteri che confondono lo schema
+        keys = {f"deck_{i}": fname for i, fname in enumerate(chunk)}
+        payload = {k: _translatable(decks[fname]) for k, fname in keys.items()}
+        out = _request_translation(registry, "translate_batch", payload, model_name, use_cache)
+
+        merged = {k: {} for k in keys}
+        retry = {}
+        for k in keys:
+            got = out.get(k) if isinstance(out, dict) else None
+            bad = set(untranslated_fields(payload[k], got or {}))
+            for sec, fields in payload[k].items():
+                for f in fields:
+                    if (sec, f) not in bad:
+                        merged[k].setdefault(sec, {})[f] = got[sec][f]
+                    else:
+                        retry.setdefault(k, {}).setdefault(sec, {})[f] = fields[f]
+
+        incomplete = {}
+        if retry:
+            # Il retry non deve rileggere dalla cache la stessa risposta incompleta
+            again = _request_translation(registry, "translate_fields", retry, model_name, use_cache, refresh=True)
+            for k, sections in retry.items():
+                got = again.get(k) if isinstance(again, dict) else None
+                bad = set(untranslated_fields(sections, got or {}))
+                for sec, fields in sections.items():
+                    for f in fields:
+                        if (sec, f) not in bad:
+                            merged[k].setdefault(sec, {})[f] = got[sec][f]
+                if bad:
+                    print(f"Traduzione incompleta per {keys[k]}: {sorted(bad)}")
+                    incomplete[k] = bad
+
+        if retry and not incomplete:
+            # Completata dal retry: in cache va il risultato unito, sotto la chiave della richiesta batch
+            _cache_put("translate_batch", model_name, _translation_contents(payload), merged)
+        for k, fname in keys.items():
+            if k in incomplete:
+                results[fname] = TranslationError(incomplete[k])
+                continue
+            en = copy.deepcopy(decks[fname])
+            for sec, fields in merged[k].items():
+                en[sec].update(fields)
+            results[fname] = en
+    return results
+
+def data_fingerprint(ai_data):
+    """Impronta del testo italiano: una traduzione salvata vale finché non cambia."""
+    return hashlib.sha256(json.dumps(ai_data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def translate_deck(registry, ai_data, model_name, use_cache=True):
+    """Traduzione ENG di un singolo deck (vedi translate_decks). Solleva TranslationError se incompleta."""
+    en = translate_decks(registry, {"deck": ai_data}, model_name, use_cache)["deck"]
+    if isinstance(en, Exception): raise en
+    return en
+
+def translate_list_strings(registry, text_list, model_name, use_cache=True):
+    if not text_list: return {}
+    prompt = "Translate these Italian strings to English for a corporate presentation. Return JSON {original: translation}."
+    try:
+        return _generate_json(registry, "translate_list", model_name, f"{prompt}\n\nLIST:\n{json.dumps(text_list)}", use_cache)
+    except: return {}
+
+# ======================================================
+# 📄 PAGINE 1-3 (page1/page2/page3): UNA CHIAMATA PER DECK
+# ======================================================
+
+PAGES_PROMPT = """
+    Sei un Art Director e Copywriter di format di Team Building. Per OGNI deck nel JSON
+    (chiave = deck, valore = testo sorgente) prepara in una volta sola i contenuti di tre pagine:
+    - "format_name": il NOME DEL FORMAT estratto ESATTO dal testo (uno solo, valido per tutte le pagine).
+    - "page1" COPERTINA: "claim" slogan commerciale potente (max 10 parole);
+      "imagen_prompt" prompt DETTAGLIATO in inglese per una copertina FOTOREALISTICA.
+    - "page2" SCENARIO: "emotional_text" testo emozionale (max 300 caratteri);
+      "imagen_prompt" prompt in inglese per un'immagine di sfondo 16:9.
+    - "page3" DETTAGLI LOGISTICI E TECNICI: "category" sempre "Scheda Tecnica";
+      "body" elenco puntato con durata, numero partecipanti, location (indoor/outdoor) e requisiti tecnici;
+      "imagen_prompt" in inglese, close-up di un dettaglio tecnico o attrezzatura.
+    Rispondi SOLO JSON con le stesse chiavi dei deck.
+    """
+# Deck per richiesta e token di testo sorgente per deck
+PAGES_BATCH_SIZE = 4
+PAGES_CONTEXT_TOKENS = 2500
+# Testi sorgente di un blocco preparati in parallelo (conteggio token / riassunti)
+PAGES_CONTEXT_WORKERS = PAGES_BATCH_SIZE
+PAGE_FIELDS = {"page1": ("claim", "imagen_prompt"), "page2": ("emotional_text", "imagen_prompt"),
+               "page3": ("category", "body", "imagen_prompt")}
+
+def _pages_schema():
+    props = {"format_name": {"type": "string"}}
+    for page, fields in PAGE_FIELDS.items():
+        props[page] = {"type": "object", "properties": {f: {"type": "string"} for f in fields}, "required": list(fields)}
+    return {"type": "object", "properties": props, "required": list(props)}
+
+def _pages_complete(res):
+    return (isinstance(res, dict) and isinstance(res.get("format_name"), str)
+            and all(isinstance(res.get(p), dict) for p in PAGE_FIELDS))
+
+def _request_pages(registry, kind, payload, model_name, use_cache, refresh=False):
+    item = _pages_schema()
+    schema = {"type": "object", "properties": {k: item for k in payload}, "required": list(payload)}
+    # In cache solo se ogni deck è completo: altrimenti il retry rileggerebbe la stessa risposta
+    complete = lambda out: isinstance(out, dict) and all(_pages_complete(out.get(k)) for k in payload)
+    try:
+        return _generate_json(registry, kind, model_name, f"{PAGES_PROMPT}\n\nDECK:\n{json.dumps(payload, ensure_ascii=False)}",
+                              use_cache, refresh, schema=schema, cacheable=complete)
+    except Exception as e:
+        print(f"Errore Analisi Pagine ({kind}): {e}")
+        return {}
+
+def analyze_pages_batch(registry, contexts, model_name, use_cache=True, budget=PAGES_CONTEXT_TOKENS):
+    """Contenuti di page1/page2/page3 per più deck: {fname: testo} -> {fname: risultato}.
+
+    Risultato: {"format_name", "page1": {...}, "page2": {...}, "page3": {...}}.
+    PAGES_BATCH_SIZE deck per richiesta (schema vincolato); un deck mancante
+    nella risposta viene ritentato una volta da solo, poi resta fuori dal risultato.
+    I testi sorgente di un blocco si preparano in parallelo.
+    """
+    results = {}
+    names = list(contexts)
+    with ThreadPoolExecutor(max_workers=PAGES_CONTEXT_WORKERS, thread_name_prefix="pages-context") as pool:
+        for start in range(0, len(names), PAGES_BATCH_SIZE):
+            chunk = names[start:start + PAGES_BATCH_SIZE]
+            keys = {f"deck_{i}": fname for i, fname in enumerate(chunk)}
+            # Copia del contesto per ogni deck: le chiamate restano attribuite nelle tracce
+            futures = {k: pool.submit(contextvars.copy_context().run, source_context, registry, contexts[fname], model_name, budget, use_cache)
+                       for k, fname in keys.items()}
+            payload = {k: fut.result() for k, fut in futures.items()}
+            out = _request_pages(registry, "pages_batch", payload, model_name, use_cache)
+            for k, fname in keys.items():
+                got = out.get(k) if isinstance(out, dict) else None
+                if not _pages_complete(got):
+                    got = _request_pages(registry, "pages_single", {"deck_0": payload[k]}, model_name, use_cache, refresh=True).get("deck_0")
+                if _pages_complete(got):
+                    results[fname] = got
+                else:
+                    print(f"Analisi pagine non riuscita per {fname}")
+    return results
+
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import threading
+import time
+
+import tracing
+
+# ======================================================
+# 🔌 REGISTRY CLIENT GOOGLE (UNO PER PROCESSO)
+# ======================================================
+# Streamlit riesegue app.py a ogni click: qui i client vengono costruiti una
+# sola volta per worker e condivisi tra sessioni e thread. Gli SDK pesanti
+# vengono importati solo al primo utilizzo.
+
+SCOPES = [
+    'https://www.googleapis.com/auth/cloud-platform',
+    'https://www.googleapis.com/auth/drive',
+    'https://www.googleapis.com/auth/presentations'
+]
+
+# Quote "per user" (il service account): Slides 60 write/min, Drive ~3 write/s
+SLIDES_WRITES_PER_MIN = 60
+DRIVE_WRITES_PER_MIN = 180
+# Connessioni keep-alive della sessione HTTP condivisa per GCS
+HTTP_POOL_SIZE = 16
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+# Documenti di discovery già parsati (condivisi da tutti i registry)
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+
+def _discovery_doc(api, version):
+    """Legge e parsa UNA volta il documento di discovery statico."""
+    key = (api, version)
+    with _discovery_lock:
+        if key not in _discovery_docs:
+            from googleapiclient import discovery_cache
+            _discovery_docs[key] = json.loads(discovery_cache.get_static_doc(api, version))
+        return _discovery_docs[key]
+
+
+class RateLimiter:
+    """Token bucket thread-safe: al massimo `per_minute` chiamate al minuto."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, per_minute // 6))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class ClientRegistry:
+    """Credenziali, Drive, Slides, GCS, Gemini e Vertex costruiti on-demand.
+
+    I service di googleapiclient non sono thread-safe (httplib2), quindi
+    Drive e Slides sono istanziati una volta PER THREAD a partire dallo
+    stesso documento di discovery già parsato.
+    """
+
+    def __init__(self, service_account_info, api_key, project_id, location, bucket_name):
+        self.service_account_info = service_account_info
+        self.api_key = api_key
+        self.project_id = project_id
+        self.location = location
+        self.bucket_name = bucket_name
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._creds = None
+        self._bucket = None
+        self._genai = None
+        self._vertex_ready = False
+        # Limiti condivisi da tutti i thread che usano queste credenziali
+        self.slides_writes = RateLimiter(SLIDES_WRITES_PER_MIN)
+        self.drive_writes = RateLimiter(DRIVE_WRITES_PER_MIN)
+
+    @property
+    def creds(self):
+        if self._creds is None:
+            with self._lock:
+                if self._creds is None:
+                    from google.oauth2 import service_account
+                    self._creds = service_account.Credentials.from_service_account_info(
+                        self.service_account_info, scopes=SCOPES
+                    )
+        return self._creds
+
+    def _service(self, api, version):
+        attr = f"{api}_{version}"
+        svc = getattr(self._local, attr, None)
+        if svc is None:
+            from googleapiclient.discovery import build_from_document
+            # Ogni execute() passa dal tracing (tracing.py)
+            svc = tracing.TracedService(build_from_document(_discovery_doc(api, version), credentials=self.creds), api)
+            setattr(self._local, attr, svc)
+        return svc
+
+    def drive(self):
+        return self._service('drive', 'v3')
+
+    def slides(self):
+        return self._service('slides', 'v1')
+
+    def bucket(self):
+        if self._bucket is None:
+            creds = self.creds
+            with self._lock:
+                if self._bucket is None:
+                    import requests
+                    from google.auth.transport.requests import AuthorizedSession
+                    from google.cloud import storage
+                    # Sessione autorizzata unica, con pool abbastanza grande per gli upload paralleli
+                    session = AuthorizedSession(creds)
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    storage_client = storage.Client(credentials=creds, project=self.project_id, _http=session)
+                    self._bucket = storage_client.bucket(self.bucket_name)
+        return self._bucket
+
+    def genai(self):
+        """Modulo google.generativeai già configurato con la API key."""
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def init_vertex(self):
+        if not self._vertex_ready:
+            creds = self.creds
+            with self._lock:
+                if not self._vertex_ready:
+                    import vertexai
+                    vertexai.init(project=self.project_id, location=self.location, credentials=creds)
+                    self._vertex_ready = True
+
+    def image_generation_model(self):
+        """Classe ImageGenerationModel di Vertex, con vertexai già inizializzato."""
+        self.init_vertex()
+        from vertexai.preview.vision_models import ImageGenerationModel
+        return ImageGenerationModel
+
+
+def get_registry(service_account_json, api_key, project_id, location, bucket_name):
+    """Restituisce il registry condiviso per queste credenziali (creandolo se serve).
+
+    La chiave è l'hash del JSON grezzo: il parsing avviene solo alla creazione.
+    """
+    raw = service_account_json if isinstance(service_account_json, str) else json.dumps(service_account_json, sort_keys=True)
+    key = hashlib.sha256("|".join([raw, api_key or "", project_id, location, bucket_name]).encode()).hexdigest()
+    with _registries_lock:
+        reg = _registries.get(key)
+        if reg is None:
+            info = json.loads(raw)
+            reg = ClientRegistry(info, api_key, project_id, location, bucket_name)
+            _registries[key] = reg
+        return reg
@@ -0,0 +1,184 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import CONTEXT_TOKEN_BUDGET
+
+# ======================================================
+# ✂️ CONTESTO PER GEMINI ENTRO UN BUDGET DI TOKEN
+# ======================================================
+# Il testo di analysis.py ("SLIDE n CONTENUTO: ... [[ ISTRUZIONI DALLE
+# NOTE: ... ]]" separati da ---) viene ripulito prima del prompt: il testo
+# ripetuto su più slide (titolo, footer, logo) resta solo alla prima
+# occorrenza e i segnaposto del template spariscono; le note con le
+# istruzioni vanno IN TESTA e sono le ultime a essere tagliate. Se il deck
+# sfora il budget, le slide si riassumono a blocchi in parallelo (map) e
+# si ricompongono (reduce). Modulo senza dipendenze: conteggio token e
+# riassunto arrivano come funzioni (vedi brain.source_context).
+
+# Stima prudente (italiano): meglio sovrastimare che sforare
+CHARS_PER_TOKEN = 3.5
+# Sotto questa frazione del budget la stima basta, sopra si contano i token veri
+EXACT_COUNT_RATIO = 0.7
+CHUNK_TOKENS = 4000
+SUMMARY_WORKERS = 4
+NOTES_HEADER = "ISTRUZIONI DALLE NOTE:"
+
+_SLIDE_RE = re.compile(r"^SLIDE (\d+) CONTENUTO: (.*?)\s*(?:\[\[ ISTRUZIONI DALLE NOTE: (.*) \]\])?\s*$", re.S)
+_TEMPLATE_RES = [
+    re.compile(r"^(fare clic|fai clic|clicca|click to|click here)\b", re.I),
+    re.compile(r"^\{\{[A-Z0-9_]+\}\}$"),
+]
+
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def _norm(line):
+    return " ".join(line.lower().split())
+
+
+class Slide:
+    __slots__ = ("num", "lines", "notes")
+
+    def __init__(self, num, lines, notes):
+        self.num = num
+        self.lines = lines
+        self.notes = notes
+
+    def text(self):
+        return f"SLIDE {self.num} CONTENUTO: " + " | ".join(self.lines)
+
+
+def parse_slides(text):
+    """Testo di analysis.analyze_pptx_content -> lista di Slide (testo libero = una slide)."""
+    slides = []
+    for i, block in enumerate(text.split("\n---\n")):
+        m = _SLIDE_RE.match(block.strip())
+        if m:
+            num, visible, notes = int(m.group(1)), m.group(2), (m.group(3) or "").strip()
+        else:
+            num, visible, notes = i + 1, block, ""
+        lines = [ln.strip() for part in visible.split(" | ") for ln in part.split("\n") if ln.strip()]
+        slides.append(Slide(num, lines, notes))
+    return slides
+
+
+def strip_boilerplate(slides):
+    """Toglie segnaposto del template, numero di pagina e testo ripetuto: di ogni riga resta
+    solo la prima occorrenza (il titolo del format ripetuto su ogni slide resta una volta).
+
+    Un numero da solo sparisce solo se è il numero della slide (footer): "12" come
+    partecipanti o durata resta."""
+    seen_lines, seen_notes = set(), set()
+    for s in slides:
+        kept = []
+        for ln in s.lines:
+            k = _norm(ln)
+            if k in seen_lines or k == str(s.num) or any(r.match(ln) for r in _TEMPLATE_RES):
+                continue
+            seen_lines.add(k)
+            kept.append(ln)
+        s.lines = kept
+        if _norm(s.notes) in seen_notes:
+            s.notes = ""
+        elif s.notes:
+            seen_notes.add(_norm(s.notes))
+    return [s for s in slides if s.lines or s.notes]
+
+
+def _notes_block(slides):
+    notes = [f"[SLIDE {s.num}] {s.notes}" for s in slides if s.notes]
+    return NOTES_HEADER + "\n" + "\n".join(notes) if notes else ""
+
+
+def _assemble(notes, parts):
+    return "\n---\n".join(([notes] if notes else []) + parts)
+
+
+def truncate(text, tokens):
+    """Taglio a fine parola entro ~tokens (stima)."""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit: return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > limit * 0.8 else cut) + " […]"
+
+
+def fit(text, budget):
+    """Versione senza chiamate: pulizia, note in testa, poi slide finché c'è budget (stima)."""
+    slides = strip_boilerplate(parse_slides(text))
+    notes = truncate(_notes_block(slides), budget)
+    left = budget - estimate_tokens(notes)
+    parts = []
+    for s in slides:
+        if left <= 0: break
+        t = s.text()
+        if estimate_tokens(t) > left:
+            t = truncate(t, left)
+        parts.append(t)
+        left -= estimate_tokens(t)
+    return _assemble(notes, parts)
+
+
+def _chunks(slides, chunk_tokens):
+    chunk, size = [], 0
+    for s in slides:
+        t = s.text()
+        n = estimate_tokens(t)
+        if chunk and size + n > chunk_tokens:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(t)
+        size += n
+    if chunk:
+        yield chunk
+
+
+def build_context(text, budget=CONTEXT_TOKEN_BUDGET, count_tokens=None, summarize=None, workers=SUMMARY_WORKERS):
+    """Contesto pronto per il prompt, entro budget token.
+
+    count_tokens(testo) -> token veri del modello (opzionale: altrimenti stima).
+    summarize(testo, max_parole) -> riassunto di un blocco di slide (opzionale:
+    senza, le slide in eccesso si tagliano come in fit). I blocchi si
+    riassumono in parallelo; un blocco fallito viene tagliato, non blocca il deck.
+    """
+    slides = strip_boilerplate(parse_slides(text))
+    notes = _notes_block(slides)
+    full = _assemble(notes, [s.text() for s in slides])
+    est = estimate_tokens(full)
+    if est <= budget * EXACT_COUNT_RATIO:
+        return full
+    exact = est
+    if count_tokens:
+        try: exact = count_tokens(full)
+        except Exception as e: print(f"Conteggio token non disponibile, uso la stima: {e}")
+    if exact <= budget:
+        return full
+    if summarize is None:
+        return fit(text, budget)
+
+    # Le note restano intere finché occupano al massimo metà budget
+    notes = truncate(notes, budget // 2)
+    left = budget - estimate_tokens(notes)
+    # Le stime dei blocchi si correggono col rapporto token veri / stimati
+    scale = max(1.0, exact / est)
+    chunks = list(_chunks(slides, int(CHUNK_TOKENS / scale)))
+    per_chunk = max(50, int(left / len(chunks) / scale))
+    words = max(30, int(per_chunk * CHARS_PER_TOKEN / 6))
+
+    def _map(chunk):
+        body = "\n---\n".join(chunk)
+        try:
+            return truncate(summarize(body, words), per_chunk)
+        except Exception as e:
+            print(f"Riassunto blocco non riuscito, taglio: {e}")
+            return truncate(body, per_chunk)
+
+    # Ogni blocco gira con una copia del contesto del chiamante: span e deck delle tracce restano attribuiti
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks))), thread_name_prefix="context") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _map, chunk) for chunk in chunks]
+        summaries = [f.result() for f in futures]
+    parts = [f"RIASSUNTO SLIDE {c[0].split()[1]}-{c[-1].split()[1]}: {s}" for c, s in zip(chunks, summaries)]
+    return _assemble(notes, parts)
@@ -0,0 +1,152 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import templates
+
+# ======================================================
+# ♨️ POOL DI COPIE DEL TEMPLATE PRE-RISCALDATE
+# ======================================================
+# files().copy è una delle chiamate più lente del finalize. Il pool tiene
+# N copie già pronte del template nella cartella di output: al salvataggio
+# se ne prende una e la si rinomina (una update, molto più rapida), poi il
+# pool si riempie di nuovo in background. Le copie portano in appProperties
+# template e revisione: sopravvivono ai riavvii. Quelle di una revisione
+# vecchia e quelle in più quando il pool si riduce (o si spegne) vengono
+# cancellate da Drive, non solo dimenticate.
+
+POOL_PREFIX = "_POOL_"
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class TemplateCopyPool:
+    def __init__(self, registry, template_id, folder_id, size):
+        self.registry = registry
+        self.template_id = template_id
+        self.folder_id = folder_id
+        self.size = size
+        self._ready = []              # [(file_id, revision)]
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._loaded = False
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="copy-pool")
+
+    def schedule_refill(self):
+        with self._lock:
+            if self._refilling: return
+            self._refilling = True
+        self._worker.submit(self._refill)
+
+    def take(self, filename, revision, app_properties=None):
+        """Copia pronta della revisione indicata, rinominata; None se il pool è vuoto."""
+        stale = []
+        file_id = None
+        with self._lock:
+            while self._ready:
+                fid, rev = self._ready.pop(0)
+                if rev == revision:
+                    file_id = fid
+                    break
+                stale.append(fid)
+        for fid in stale:
+            self._delete(fid)
+        self.schedule_refill()
+        if file_id is None:
+            return None
+        try:
+            self.registry.drive_writes.acquire()
+            props = {'pool_template': None, 'pool_revision': None, **(app_properties or {})}
+            self.registry.drive().files().update(
+                fileId=file_id, body={'name': filename, 'appProperties': props}, supportsAllDrives=True
+            ).execute()
+            return file_id
+        except Exception as e:
+            print(f"Copia dal pool non utilizzabile ({file_id}): {e}")
+            return None
+
+    def _load_existing(self):
+        """Recupera le copie lasciate da un processo precedente."""
+        q = (f"'{self.folder_id}' in parents and trashed = false and "
+             f"appProperties has {{ key='pool_template' and value='{self.template_id}' }}")
+        resp = self.registry.drive().files().list(
+            q=q, fields="files(id,appProperties)", supportsAllDrives=True, includeItemsFromAllDrives=True
+        ).execute()
+        found = [(f['id'], f.get('appProperties', {}).get('pool_revision')) for f in resp.get('files', [])]
+        with self._lock:
+            self._ready.extend(found)
+            self._loaded = True
+
+    def _delete(self, file_id):
+        try:
+            self.registry.drive_writes.acquire()
+            self.registry.drive().files().delete(fileId=file_id, supportsAllDrives=True).execute()
+        except Exception as e:
+            print(f"Errore cancellazione copia pool ({file_id}): {e}")
+
+    def _refill(self):
+        try:
+            if not self._loaded:
+                self._load_existing()
+            revision = str(templates.get_template_index(self.registry, self.template_id).revision)
+            with self._lock:
+                stale = [fid for fid, rev in self._ready if rev != revision]
+                self._ready = [(fid, rev) for fid, rev in self._ready if rev == revision]
+            for fid in stale:
+                self._delete(fid)
+            while True:
+                # La dimensione può cambiare durante il riempimento: le copie in più si cancellano
+                with self._lock:
+                    surplus = self._ready[max(0, self.size):]
+                    del self._ready[max(0, self.size):]
+                    full = len(self._ready) >= self.size
+                for fid, _ in surplus:
+                    self._delete(fid)
+                if full: break
+                self.registry.drive_writes.acquire()
+                copy = self.registry.drive().files().copy(
+                    fileId=self.template_id,
+                    body={'name': f"{POOL_PREFIX}{self.template_id}", 'parents': [self.folder_id],
+                          'appProperties': {'pool_template': self.template_id, 'pool_revision': revision}},
+                    supportsAllDrives=True
+                ).execute()
+                with self._lock:
+                    self._ready.append((copy['id'], revision))
+        except Exception as e:
+            print(f"Errore riempimento pool copie: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+                again = len(self._ready) > max(0, self.size)
+            if again: self.schedule_refill()
+
+
+def configure(registry, template_id, folder_id, size):
+    """Attiva (size > 0), ridimensiona o spegne il pool per template e cartella.
+
+    Riducendo la dimensione le copie in più vengono cancellate in background.
+    """
+    if not (template_id and folder_id) or size <= 0:
+        with _pools_lock:
+            pool = _pools.get((template_id, folder_id))
+        if pool and (pool.size > 0 or pool._ready):
+            pool.size = 0
+            pool.schedule_refill()
+        return None
+    with _pools_lock:
+        pool = _pools.get((template_id, folder_id))
+        if pool is None:
+            pool = TemplateCopyPool(registry, template_id, folder_id, size)
+            _pools[(template_id, folder_id)] = pool
+        pool.size = size
+    pool.schedule_refill()
+    return pool
+
+
+def take(template_id, folder_id, filename, revision, app_properties=None):
+    """Copia pre-riscaldata rinominata in filename, o None (pool assente o vuoto)."""
+    with _pools_lock:
+        pool = _pools.get((template_id, folder_id))
+    if pool is None or pool.size <= 0:
+        return None
+    return pool.take(filename, str(revision), app_properties)
@@ -0,0 +1,491 @@
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import clients
+import tracing
+
+# ======================================================
+# 🧪 SERVIZI FINTI IN-PROCESS (PER BENCHMARK E PROVE)
+# ======================================================
+# FakeRegistry ha la stessa interfaccia di clients.ClientRegistry: Drive,
+# Slides, GCS, Gemini e Imagen rispondono in memoria con latenza, errori e
+# 429 configurabili. Ogni chiamata viene contata e cronometrata, così la
+# pipeline vera (pipeline.py, finalize.py, brain.py...) si misura senza
+# toccare le API Google né consumare quote.
+
+# Latenze tipiche osservate (secondi): media e jitter uniforme +/-
+DEFAULT_LATENCY = {
+    "drive.files.get": (0.15, 0.05),
+    "drive.files.copy": (1.5, 0.5),
+    "drive.files.update": (0.3, 0.1),
+    "drive.files.list": (0.3, 0.1),
+    "drive.files.delete": (0.3, 0.1),
+    "drive.files.export": (1.0, 0.3),
+    "drive.files.create": (2.0, 0.6),
+    "slides.presentations.get": (0.6, 0.2),
+    "slides.presentations.batchUpdate": (1.2, 0.4),
+    "gcs.blob.exists": (0.08, 0.03),
+    "gcs.blob.upload_from_string": (0.4, 0.2),
+    "gcs.blob.download_as_bytes": (0.2, 0.1),
+    "gemini.generate_content": (8.0, 3.0),
+    "gemini.stream_first_chunk": (1.0, 0.3),
+    "gemini.count_tokens": (0.2, 0.05),
+    "imagen.generate_images": (6.0, 2.0),
+}
+
+TEMPLATE_TOKENS = ["{{TITLE}}", "{{SUBTITLE}}", "{{BODY_1}}", "{{BODY_2}}", "{{SVOLGIMENTO}}",
+                   "{{LOGISTICA}}", "{{TECNICA}}", "{{DETTAGLIO_COSTO}}"]
+TEMPLATE_STATIC = ["Il Format", "L'Esperienza", "Scheda Tecnica", "Costi", "Contatti"]
+TEMPLATE_IMAGES = ["IMG_1", "IMG_2", "IMG_3"]
+
+
+class FakeHttpError(Exception):
+    """Errore con .code come HttpError/GoogleAPICallError (is_transient e i 412 lo riconoscono)."""
+
+    def __init__(self, code, message):
+        super().__init__(f"<HttpError {code}: {message}>")
+        self.code = code
+
+
+class FakeConfig:
+    """latency_scale moltiplica DEFAULT_LATENCY (0 = istantaneo); error_rate e rate_429
+    sono probabilità per chiamata; image_fail_rate fa rifiutare singoli replaceImage."""
+
+    def __init__(self, latency_scale=1.0, error_rate=0.0, rate_429=0.0, image_fail_rate=0.0,
+                 latency=None, seed=None):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.image_fail_rate = image_fail_rate
+        self.seed = seed
+
+
+class FakeBackend:
+    """Stato condiviso (file, oggetti GCS) + contatori e tempi per operazione."""
+
+    def __init__(self, config=None):
+        self.config = config or FakeConfig()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.latencies = defaultdict(list)
+        self.files = {}                # id -> {"name", "parents", "appProperties", "template"}
+        self.blobs = {}                # name -> bytes
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._rnd = random.Random(self.config.seed)
+
+    def new_id(self, prefix):
+        return f"{prefix}{next(self._ids)}"
+
+    def _random(self):
+        with self._lock:
+            return self._rnd.random()
+
+    def call(self, op, fn=None, can_fail=True):
+        """Esegue una chiamata finta: latenza, errori iniettati, conteggio."""
+        mean, jitter = self.config.latency.get(op, (0.05, 0.0))
+        delay = max(0.0, (mean + (self._random() * 2 - 1) * jitter) * self.config.latency_scale)
+        t0 = time.perf_counter()
+        try:
+            time.sleep(delay)
+            if can_fail:
+                r = self._random()
+                if r < self.config.rate_429:
+                    raise FakeHttpError(429, "Quota exceeded (fake). Please retry in 1s")
+                if r < self.config.rate_429 + self.config.error_rate:
+                    raise FakeHttpError(500, "Internal error (fake)")
+            return fn() if fn else None
+        except Exception:
+            with self._lock: self.errors[op] += 1
+            raise
+        finally:
+            with self._lock:
+                self.calls[op] += 1
+                self.latencies[op].append(time.perf_counter() - t0)
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.latencies.clear()
+
+    def add_template(self, template_id="fake-template"):
+        self.files[template_id] = {"name": "TEMPLATE", "parents": [], "appProperties": {}, "template": True, "version": "1"}
+        return template_id
+
+
+class _Req:
+    """Come una HttpRequest di googleapiclient: la chiamata parte con execute()."""
+
+    def __init__(self, backend, op, fn, can_fail=True):
+        self.backend, self.op, self.fn, self.can_fail = backend, op, fn, can_fail
+
+    def execute(self, num_retries=0):
+        return self.backend.call(self.op, self.fn, self.can_fail)
+
+
+# --- DRIVE ---
+
+_APPPROP_RE = re.compile(r"appProperties has \{ key='([^']+)' and value='([^']*)' \}")
+_PARENT_RE = re.compile(r"'([^']+)' in parents")
+
+
+class _FakeFiles:
+    def __init__(self, b):
+        self.b = b
+
+    def get(self, fileId, fields=None, supportsAllDrives=True):
+        def fn():
+            f = self.b.files.get(fileId)
+            if f is None: raise FakeHttpError(404, f"File not found: {fileId}")
+            return {"id": fileId, "name": f["name"], "version": f.get("version", "1")}
+        return _Req(self.b, "drive.files.get", fn)
+
+    def copy(self, fileId, body, supportsAllDrives=True):
+        def fn():
+            if fileId not in self.b.files: raise FakeHttpError(404, f"File not found: {fileId}")
+            new_id = self.b.new_id("file_")
+            with self.b._lock:
+                self.b.files[new_id] = {"name": body.get("name"), "parents": body.get("parents", []),
+                                        "appProperties": dict(body.get("appProperties") or {}), "template": False}
+            return {"id": new_id}
+        return _Req(self.b, "drive.files.copy", fn)
+
+    def update(self, fileId, body, supportsAllDrives=True):
+        def fn():
+            f = self.b.files.get(fileId)
+            if f is None: raise FakeHttpError(404, f"File not found: {fileId}")
+            if "name" in body: f["name"] = body["name"]
+            for k, v in (body.get("appProperties") or {}).items():
+                if v is None: f["appProperties"].pop(k, None)
+                else: f["appProperties"][k] = v
+            return {"id": fileId}
+        return _Req(self.b, "drive.files.update", fn)
+
+    def create(self, body, media_body=None, fields=None, supportsAllDrives=True):
+        def fn():
+            new_id = self.b.new_id("file_")
+            with self.b._lock:
+                self.b.files[new_id] = {"name": body.get("name"), "parents": body.get("parents", []),
+                                        "appProperties": dict(body.get("appProperties") or {}), "template": False,
+                                        "size": media_body.size() if media_body is not None else 0}
+            return {"id": new_id}
+        return _Req(self.b, "drive.files.create", fn)
+
+    def export(self, fileId, mimeType):
+        def fn():
+            f = self.b.files.get(fileId)
+            if f is None: raise FakeHttpError(404, f"File not found: {fileId}")
+            return template_pptx()
+        return _Req(self.b, "drive.files.export", fn)
+
+    def delete(self, fileId, supportsAllDrives=True):
+        return _Req(self.b, "drive.files.delete", lambda: self.b.files.pop(fileId, None) and None)
+
+    def list(self, q="", fields=None, supportsAllDrives=True, includeItemsFromAllDrives=True, **kwargs):
+        def fn():
+            parent = _PARENT_RE.search(q)
+            props = _APPPROP_RE.findall(q)
+            out = []
+            for fid, f in list(self.b.files.items()):
+                if parent and parent.group(1) not in f["parents"]: continue
+                if any(f["appProperties"].get(k) != v for k, v in props): continue
+                out.append({"id": fid, "name": f["name"], "appProperties": dict(f["appProperties"])})
+            return {"files": out}
+        return _Req(self.b, "drive.files.list", fn)
+
+
+class _FakeDrive:
+    def __init__(self, b):
+        self.b = b
+
+    def files(self):
+        return _FakeFiles(self.b)
+
+
+# --- SLIDES ---
+
+def _template_presentation():
+    slides = []
+    for i, img in enumerate(TEMPLATE_IMAGES):
+        slides.append({"pageElements": [
+            {"objectId": f"img_{i}", "description": img},
+            {"objectId": f"txt_{i}", "shape": {"text": {"textElements": [{"textRun": {"content": TEMPLATE_STATIC[i]}}]}}},
+        ]})
+    tokens = [{"textRun": {"content": t + "\n"}} for t in TEMPLATE_TOKENS]
+    slides.append({"pageElements": [{"objectId": "tokens", "shape": {"text": {"textElements": tokens}}}]})
+    slides.append({"pageElements": [{"objectId": "extra", "shape": {"text": {"textElements": [
+        {"textRun": {"content": t}} for t in TEMPLATE_STATIC[3:]]}}}]})
+    return {"slides": slides}
+
+
+_template_pptx = None
+
+
+def template_pptx():
+    """Lo stesso template di _template_presentation, come lo esporterebbe Drive in .pptx."""
+    global _template_pptx
+    if _template_pptx is None:
+        from pptx import Presentation
+        from pptx.util import Inches
+        prs = Presentation()
+        prs.slide_width, prs.slide_height = Inches(13.333), Inches(7.5)
+        blank = prs.slide_layouts[6]
+        for i, img in enumerate(TEMPLATE_IMAGES):
+            slide = prs.slides.add_slide(blank)
+            pic = slide.shapes.add_picture(io.BytesIO(fake_image_bytes(img, (320, 240))), 0, 0, prs.slide_width, prs.slide_height)
+            pic._element.nvPicPr.cNvPr.set("descr", img)
+            slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(1)).text_frame.text = TEMPLATE_STATIC[i]
+        tf = prs.slides.add_slide(blank).shapes.add_textbox(Inches(1), Inches(1), Inches(10), Inches(5)).text_frame
+        tf.text = TEMPLATE_TOKENS[0]
+        for t in TEMPLATE_TOKENS[1:]:
+            tf.add_paragraph().text = t
+        tf = prs.slides.add_slide(blank).shapes.add_textbox(Inches(1), Inches(1), Inches(10), Inches(5)).text_frame
+        tf.text = TEMPLATE_STATIC[3]
+        for t in TEMPLATE_STATIC[4:]:
+            tf.add_paragraph().text = t
+        out = io.BytesIO()
+        prs.save(out)
+        _template_pptx = out.getvalue()
+    return _template_pptx
+
+
+class _FakePresentations:
+    def __init__(self, b):
+        self.b = b
+
+    def get(self, presentationId, fields=None):
+        def fn():
+            if presentationId not in self.b.files: raise FakeHttpError(404, f"Presentation not found: {presentationId}")
+            return _template_presentation()
+        return _Req(self.b, "slides.presentations.get", fn)
+
+    def batchUpdate(self, presentationId, body):
+        def fn():
+            if presentationId not in self.b.files: raise FakeHttpError(404, f"Presentation not found: {presentationId}")
+            for i, req in enumerate(body.get("requests", [])):
+                # Come Slides: una richiesta invalida fa fallire tutto il batch indicandone l'indice
+                if "replaceImage" in req and self.b._random() < self.b.config.image_fail_rate:
+                    raise FakeHttpError(400, f"Invalid requests[{i}].replaceImage: The provided image could not be retrieved (fake)")
+            return {"replies": [{} for _ in body.get("requests", [])]}
+        return _Req(self.b, "slides.presentations.batchUpdate", fn)
+
+
+class _FakeSlides:
+    def __init__(self, b):
+        self.b = b
+
+    def presentations(self):
+        return _FakePresentations(self.b)
+
+
+# --- GCS ---
+
+class _FakeBlob:
+    def __init__(self, b, name):
+        self.b, self.name = b, name
+
+    def exists(self):
+        return self.b.call("gcs.blob.exists", lambda: self.name in self.b.blobs, can_fail=False)
+
+    def upload_from_string(self, data, content_type=None, predefined_acl=None, if_generation_match=None):
+        def fn():
+            with self.b._lock:
+                if if_generation_match == 0 and self.name in self.b.blobs:
+                    raise FakeHttpError(412, "conditionNotMet (fake)")
+                self.b.blobs[self.name] = data
+        self.b.call("gcs.blob.upload_from_string", fn)
+
+    def download_as_bytes(self):
+        def fn():
+            if self.name not in self.b.blobs: raise FakeHttpError(404, f"No such object: {self.name}")
+            return self.b.blobs[self.name]
+        return self.b.call("gcs.blob.download_as_bytes", fn)
+
+
+class _FakeBucket:
+    def __init__(self, b, name):
+        self.b, self.name = b, name
+
+    def blob(self, name):
+        return _FakeBlob(self.b, name)
+
+
+# --- GEMINI ---
+
+_LOREM = ("Una ESPERIENZA coinvolgente che unisce il team attraverso sfide creative, collaborazione "
+          "e divertimento. Ogni fase è pensata per far emergere TALENTI e spirito di squadra. ")
+
+
+def _fake_brain_json():
+    body = _LOREM * 6
+    bullets = "\n".join(f"• Punto {i}: {_LOREM[:80]}" for i in range(5))
+    return {
+        "page_1_cover": {"title": "FORMAT DI PROVA", "subtitle": "Lo slogan del format", "image_prompt": "A team building activity, photo"},
+        "page_2_desc": {"body": body, "image_prompt": "People collaborating outdoors"},
+        "page_3_desc": {"body": body, "image_prompt": "Happy team celebrating"},
+        "page_4_details": {"svolgimento": bullets, "logistica": bullets, "tecnica": bullets},
+        "page_7_costi": {"dettaglio": bullets},
+    }
+
+
+def _fake_pages_json():
+    bullets = "\n".join(f"• Punto {i}: {_LOREM[:60]}" for i in range(4))
+    return {
+        "format_name": "FORMAT DI PROVA",
+        "page1": {"claim": "Lo slogan del format", "imagen_prompt": "A team building activity, photo"},
+        "page2": {"emotional_text": _LOREM[:280], "imagen_prompt": "People collaborating outdoors"},
+        "page3": {"category": "Scheda Tecnica", "body": bullets, "imagen_prompt": "Close-up of technical equipment"},
+    }
+
+
+def _translate_values(obj):
+    if isinstance(obj, dict):
+        return {k: _translate_values(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_translate_values(v) for v in obj]
+    return f"[EN] {obj}"
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# Pezzi in cui viene spezzata una risposta in streaming
+STREAM_CHUNKS = 12
+
+
+class _FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class _FakeGenerativeModel:
+    def __init__(self, b, model_name):
+        self.b, self.model_name = b, model_name
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        if stream:
+            return self._stream(contents)
+        return self.b.call("gemini.generate_content", lambda: _FakeResponse(self._respond(contents)))
+
+    def _respond(self, contents):
+        text = contents if isinstance(contents, str) else str(contents)
+        if "\nJSON:\n" in text:
+            out = _translate_values(json.loads(text.split("\nJSON:\n", 1)[1]))
+        elif "\nLIST:\n" in text:
+            out = {s: f"[EN] {s}" for s in json.loads(text.split("\nLIST:\n", 1)[1])}
+        elif "\nDECK:\n" in text:
+            out = {k: _fake_pages_json() for k in json.loads(text.split("\nDECK:\n", 1)[1])}
+        elif "\nSLIDE:\n" in text:
+            # Riassunto di un blocco (context_builder): le prime parole del blocco
+            out = {"summary": " ".join(text.split("\nSLIDE:\n", 1)[1].split()[:60])}
+        else:
+            out = _fake_brain_json()
+        return json.dumps(out, ensure_ascii=False)
+
+    def count_tokens(self, contents):
+        text = contents if isinstance(contents, str) else str(contents)
+        return self.b.call("gemini.count_tokens", lambda: _FakeTokenCount(len(text) // 4 + 1))
+
+    def _stream(self, contents):
+        # Primo pezzo dopo il "time to first token", poi il resto della durata tipica distribuito sui pezzi
+        text = self.b.call("gemini.stream_first_chunk", lambda: self._respond(contents))
+        mean, _ = self.b.config.latency.get("gemini.generate_content", (0.05, 0.0))
+        step = max(1, len(text) // STREAM_CHUNKS)
+        for i in range(0, len(text), step):
+            if i: time.sleep(mean * self.b.config.latency_scale / STREAM_CHUNKS)
+            yield _FakeResponse(text[i:i + step])
+
+
+class _FakeGenAI:
+    """Al posto del modulo google.generativeai già configurato."""
+
+    def __init__(self, b):
+        self.b = b
+
+    def GenerativeModel(self, model_name):
+        return _FakeGenerativeModel(self.b, model_name)
+
+
+# --- IMAGEN ---
+
+def fake_image_bytes(seed, size=(1408, 792)):
+    """Immagine 16:9 come quelle di Imagen (PNG valido se c'è Pillow)."""
+    try:
+        from PIL import Image
+        rnd = random.Random(seed)
+        im = Image.new("RGB", size, (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+        out = io.BytesIO()
+        im.save(out, "PNG")
+        return out.getvalue()
+    except ImportError:
+        return b"\x89PNG\r\n\x1a\n" + str(seed).encode() * 1000
+
+
+class _FakeImage:
+    def __init__(self, data):
+        self._image_bytes = data
+
+
+class _FakeImagenModel:
+    def __init__(self, b, model_name):
+        self.b, self.model_name = b, model_name
+
+    def generate_images(self, prompt, number_of_images=1, aspect_ratio="16:9", **kwargs):
+        def fn():
+            return [_FakeImage(fake_image_bytes(f"{prompt}|{i}|{self.b.new_id('')}")) for i in range(number_of_images)]
+        return self.b.call("imagen.generate_images", fn)
+
+
+class _FakeImageGenerationModel:
+    def __init__(self, b):
+        self.b = b
+
+    def from_pretrained(self, model_name):
+        return _FakeImagenModel(self.b, model_name)
+
+
+# --- REGISTRY ---
+
+class FakeRegistry:
+    """Stessa interfaccia di clients.ClientRegistry, servizi finti di un FakeBackend.
+
+    quotas=False toglie i RateLimiter (si misura la pipeline, non le quote).
+    """
+
+    def __init__(self, backend=None, bucket_name="fake-bucket", quotas=False):
+        self.backend = backend or FakeBackend()
+        self.bucket_name = bucket_name
+        self.project_id = "fake-project"
+        self.location = "fake-location"
+        self.creds = None
+        per_min = (clients.SLIDES_WRITES_PER_MIN, clients.DRIVE_WRITES_PER_MIN) if quotas else (10 ** 9, 10 ** 9)
+        self.slides_writes = clients.RateLimiter(per_min[0])
+        self.drive_writes = clients.RateLimiter(per_min[1])
+
+    def drive(self):
+        return tracing.TracedService(_FakeDrive(self.backend), "drive")
+
+    def slides(self):
+        return tracing.TracedService(_FakeSlides(self.backend), "slides")
+
+    def bucket(self):
+        return _FakeBucket(self.backend, self.bucket_name)
+
+    def genai(self):
+        return _FakeGenAI(self.backend)
+
+    def init_vertex(self):
+        pass
+
+    def image_generation_model(self):
+        return _FakeImageGenerationModel(self.backend)
@@ -0,0 +1,153 @@
+import re
+
+from brain import translate_deck
+import copy_pool
+import templates
+import tracing
+
+# ======================================================
+# 💾 FINALIZE: COPIA TEMPLATE + SOSTITUZIONI SLIDES
+# ======================================================
+# Ogni funzione riceve il registry: i service Drive/Slides sono per-thread
+# e le scritture passano dai rate limiter condivisi (quote per utente).
+# Per ogni copia: NESSUNA lettura (gli objectId vengono dall'indice del
+# template, vedi templates.py) e UN batchUpdate. Se è attivo il pool di
+# copie pre-riscaldate (copy_pool.py) la copia è solo una rinomina.
+
+_FAILED_REQUEST_RE = re.compile(r"requests\[(\d+)\]")
+
+def eng_filename(fname):
+    if "_ITA" in fname:
+        return fname.replace("_ITA", "_ENG")
+    return fname + "_ENG"
+
+def batch_update(registry, presentation_id, reqs):
+    registry.slides_writes.acquire()
+    return registry.slides().presentations().batchUpdate(presentationId=presentation_id, body={'requests': reqs}).execute()
+
+def copy_template(registry, template_id, folder_id, filename, app_properties=None):
+    body = {'name': filename, 'parents': [folder_id]}
+    if app_properties: body['appProperties'] = app_properties
+    registry.drive_writes.acquire()
+    copy = registry.drive().files().copy(fileId=template_id, body=body, supportsAllDrives=True).execute()
+    return copy.get('id')
+
+def find_tagged_copy(registry, folder_id, app_properties):
+    """Copia già creata con questi appProperties (es. da un salvataggio interrotto), o None."""
+    clauses = [f"'{folder_id}' in parents", "trashed = false"]
+    clauses += [f"appProperties has {{ key='{k}' and value='{v}' }}" for k, v in app_properties.items()]
+    resp = registry.drive().files().list(
+        q=" and ".join(clauses), fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True
+    ).execute()
+    files = resp.get('files', [])
+    return files[0]['id'] if files else None
+
+def image_requests(index, urls_map):
+    reqs = []
+    for label, url in urls_map.items():
+        el_id = index.get(label.strip().upper())
+        if url and el_id:
+            reqs.append({'replaceImage': {'imageObjectId': el_id, 'imageReplaceMethod': 'CENTER_CROP', 'url': url}})
+    return reqs
+
+def describe_request(req):
+    kind = next(iter(req))
+    if kind == 'replaceAllText':
+        return f"replaceAllText '{req[kind]['containsText']['text'][:40]}'"
+    if kind == 'replaceImage':
+        return f"replaceImage {req[kind]['imageObjectId']}"
+    return kind
+
+def apply_requests(registry, presentation_id, reqs):
+    """Invia tutte le richieste in UN batchUpdate atomico.
+
+    Se Slides rifiuta il batch indicando requests[N], quella richiesta viene
+    scartata e il resto ritentato. Restituisce la lista degli errori
+    (descrizione richiesta, messaggio); altri errori vengono rilanciati.
+    """
+    failures = []
+    pending = list(reqs)
+    while pending:
+        try:
+            with tracing.attempt(len(failures)):
+                batch_update(registry, presentation_id, pending)
+            return failures
+        except Exception as e:
+            m = _FAILED_REQUEST_RE.search(str(e))
+            if not m or int(m.group(1)) >= len(pending):
+                raise
+            bad = pending.pop(int(m.group(1)))
+            failures.append((describe_request(bad), str(e)))
+    return failures
+
+def placeholder_requests(final_data, tokens=None):
+    """replaceAllText per i {{TOKEN}}; con tokens si inviano solo quelli presenti nel template."""
+    main_format_title = final_data.get('page_1_cover', {}).get('title', 'Format')
+
+    reqs = []
+    reqs.append({'replaceAllText': {'containsText': {'text': '{{TITLE}}'}, 'replaceText': main_format_title}})
+
+    if 'page_1_cover' in final_data:
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{SUBTITLE}}'}, 'replaceText': final_data['page_1_cover'].get('subtitle', '')}})
+
+    if 'page_2_desc' in final_data:
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{BODY_1}}'}, 'replaceText': final_data['page_2_desc'].get('body', '')}})
+
+    if 'page_3_desc' in final_data:
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{BODY_2}}'}, 'replaceText': final_data['page_3_desc'].get('body', '')}})
+
+    if 'page_4_details' in final_data:
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{SVOLGIMENTO}}'}, 'replaceText': final_data['page_4_details'].get('svolgimento', '')}})
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{LOGISTICA}}'}, 'replaceText': final_data['page_4_details'].get('logistica', '')}})
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{TECNICA}}'}, 'replaceText': final_data['page_4_details'].get('tecnica', '')}})
+
+    if 'page_7_costi' in final_data:
+        reqs.append({'replaceAllText': {'containsText': {'text': '{{DETTAGLIO_COSTO}}'}, 'replaceText': final_data['page_7_costi'].get('dettaglio', '')}})
+
+    if tokens is not None:
+        reqs = [r for r in reqs if r['replaceAllText']['containsText']['text'] in tokens]
+    return reqs
+
+def worker_bot_finalize(registry, template_id, folder_id, filename, ai_data, urls_map, translate_mode, gemini_model, translated_data=None, use_cache=True,
+                        done=None, on_stage=None, tag=None, resumed=False):
+    """Crea una copia del template e la compila. Solleva eccezione se fallisce.
+
+    Restituisce (new_id, failures): failures elenca le singole richieste
+    scartate dal batchUpdate (es. URL immagine non raggiungibile).
+    In translate_mode si può passare translated_data già pronto (tradotto in
+    parallelo alla copia) per non rifare la traduzione qui.
+
+    Ripresa (save_jobs.py): done = fasi già completate {"copied": id, "filled": failures},
+    on_stage(fase, valore) viene chiamata a ogni fase completata, tag (appProperties)
+    marca la copia così che una copia fatta ma non registrata venga ritrovata:
+    la ricerca (files.list) si fa solo con resumed, non sui job appena creati.
+    Testi e immagini vanno nello stesso batchUpdate atomico: una sola fase "filled".
+    """
+    done = done or {}
+    if 'filled' in done:
+        return done['copied'], done['filled']
+    on_stage = on_stage or (lambda stage, value: None)
+
+    tindex = templates.get_template_index(registry, template_id)
+    new_id = done.get('copied') or (find_tagged_copy(registry, folder_id, tag) if tag and resumed else None)
+    if not new_id:
+        new_id = copy_pool.take(template_id, folder_id, filename, tindex.revision, tag)
+    if not new_id:
+        new_id = copy_template(registry, template_id, folder_id, filename, tag)
+    if 'copied' not in done:
+        on_stage('copied', new_id)
+
+    final_data = ai_data
+    reqs = []
+
+    if translate_mode:
+        final_data = translated_data or translate_deck(registry, ai_data, gemini_model, use_cache)
+
+        reqs.extend(templates.static_translation_requests(registry, tindex, gemini_model, use_cache))
+
+    reqs.extend(placeholder_requests(final_data, tindex.tokens))
+    reqs.extend(image_requests(tindex.images, urls_map))
+
+    failures = apply_requests(registry, new_id, reqs)
+    on_stage('filled', failures)
+    return new_id, failures
@@ -0,0 +1,125 @@
+import base64
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import images
+import tracing
+
+# ======================================================
+# 🎨 CLIENT IMAGEN REST (GENERATIVE LANGUAGE :predict)
+# ======================================================
+# Usato da page1/page2 (chiamata con API key, senza Vertex). Una sola
+# sessione HTTP keep-alive per processo con pool di connessioni, timeout
+# espliciti, retry con backoff sui 429/5xx e un pool di thread per
+# generare più prompt (o più campioni) in parallelo.
+
+API_ROOT = "https://generativelanguage.googleapis.com/v1beta"
+POOL_SIZE = 8
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 90              # una generazione può durare decine di secondi
+MAX_ATTEMPTS = 4
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_pool = None
+
+
+class ImagenRestError(Exception):
+    """Generazione non riuscita dopo i tentativi (o errore non ritentabile)."""
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.headers["Content-Type"] = "application/json"
+            _session = session
+        return _session
+
+
+def _get_pool():
+    global _pool
+    with _session_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="imagen-rest")
+        return _pool
+
+
+def predict_url(model_name):
+    if not model_name.startswith("models/"): model_name = f"models/{model_name}"
+    return f"{API_ROOT}/{model_name}:predict"
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Retry(Exception):
+    def __init__(self, message, hint=None):
+        super().__init__(message)
+        self.hint = hint
+
+
+def generate(prompt, api_key, model_name, sample_count=1, aspect_ratio="16:9", max_attempts=MAX_ATTEMPTS):
+    """Lista di immagini (bytes) per un prompt. Solleva ImagenRestError se fallisce."""
+    import requests
+    session = get_session()
+    body = {"instances": [{"prompt": prompt}], "parameters": {"aspectRatio": aspect_ratio, "sampleCount": sample_count}}
+    last = None
+    for attempt in range(max_attempts):
+        try:
+            with tracing.attempt(attempt), tracing.span("imagen_rest", "predict", len(prompt)) as sp:
+                try:
+                    resp = session.post(predict_url(model_name), params={"key": api_key}, json=body,
+                                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    raise _Retry(str(e)) from e
+                sp.bytes_in = len(resp.content)
+                if resp.status_code in RETRY_STATUS:
+                    raise _Retry(f"HTTP {resp.status_code}: {resp.text[:200]}", _retry_after(resp))
+                if resp.status_code >= 400:
+                    raise ImagenRestError(f"HTTP {resp.status_code}: {resp.text[:300]}")
+                predictions = resp.json().get("predictions") or []
+        except _Retry as e:
+            last = e
+            if attempt + 1 < max_attempts:
+                time.sleep(images.backoff_delay(attempt, e.hint))
+            continue
+        # Decodifica una predizione alla volta, liberando il base64 man mano
+        out = []
+        for pred in predictions:
+            data = pred.pop("bytesBase64Encoded", None)
+            if data: out.append(base64.b64decode(data))
+        if not out:
+            raise ImagenRestError("Nessuna immagine restituita (prompt filtrato?)")
+        return out
+    raise ImagenRestError(f"Imagen non disponibile dopo {max_attempts} tentativi: {last}")
+
+
+def submit(prompt, api_key, model_name, sample_count=1, aspect_ratio="16:9"):
+    """Come generate, ma restituisce subito un Future."""
+    # Il contesto (deck delle tracce) segue la richiesta nel thread del pool
+    ctx = contextvars.copy_context()
+    return _get_pool().submit(ctx.run, generate, prompt, api_key, model_name, sample_count, aspect_ratio)
+
+
+def generate_many(prompts, api_key, model_name, sample_count=1, aspect_ratio="16:9"):
+    """Più prompt in parallelo. Restituisce, nello stesso ordine, lista di bytes oppure l'eccezione."""
+    futures = [submit(p, api_key, model_name, sample_count, aspect_ratio) for p in prompts]
+    results = []
+    for fut in futures:
+        try:
+            results.append(fut.result())
+        except Exception as e:
+            results.append(e)
+    return results
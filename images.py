@@ -0,0 +1,428 @@
+import contextvars
+import hashlib
+import io
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import tracing
+from settings import cache_path
+
+# ======================================================
+# 🖼️ IMAGE STORE CONTENT-ADDRESSED (GCS)
+# ======================================================
+# Il nome dell'oggetto è l'hash del contenuto: gli stessi bytes (es. "Usa
+# Originale" cliccato due volte, stessa foto su ITA/ENG o su più deck)
+# finiscono sempre sullo stesso oggetto e vengono caricati una volta sola.
+
+INDEX_MAX_ENTRIES = 4096
+UPLOAD_WORKERS = 8
+# Immagini scaricate tenute in memoria (render locale) e timeout HTTP (s)
+FETCH_CACHE_ENTRIES = 64
+FETCH_TIMEOUT = 30
+
+
+class LRUIndex:
+    """Indice hash -> URL thread-safe con limite di dimensione."""
+
+    def __init__(self, max_entries=INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            url = self._data.get(key)
+            if url is not None:
+                self._data.move_to_end(key)
+            return url
+
+    def put(self, key, url):
+        with self._lock:
+            self._data[key] = url
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_index = LRUIndex()
+
+
+def sniff_content_type(data):
+    """Tipo MIME dai magic bytes (gli originali PPT non sono sempre PNG)."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n": return "image/png", "png"
+    if data[:3] == b"\xff\xd8\xff": return "image/jpeg", "jpg"
+    if data[:6] in (b"GIF87a", b"GIF89a"): return "image/gif", "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP": return "image/webp", "webp"
+    if data[:2] == b"BM": return "image/bmp", "bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"): return "image/tiff", "tiff"
+    return "image/png", "png"
+
+
+def object_name(image_bytes):
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    _, ext = sniff_content_type(image_bytes)
+    return f"img_{digest}.{ext}"
+
+
+def public_url(bucket_name, name):
+    return f"https://storage.googleapis.com/{bucket_name}/{name}"
+
+
+# ======================================================
+# 🗜️ NORMALIZZAZIONE A RISOLUZIONE SLIDE
+# ======================================================
+# Ogni immagine finisce in un riquadro 13.333x7.5 in (slot IMG_n con
+# CENTER_CROP, add_picture di page1/page2): prima dell'upload si ritaglia
+# a 16:9, si riduce a SLIDE_PIXELS e si ricodifica in JPEG entro
+# NORMALIZED_MAX_BYTES. Con trasparenza resta PNG: Slides accetta solo
+# PNG/JPEG/GIF, niente WebP. Risultati in cache per hash del contenuto:
+# in memoria (LRU) e su disco, con età e spazio massimi (i file meno usati
+# di recente se ne vanno per primi).
+
+SLIDE_PIXELS = (1920, 1080)
+NORMALIZED_MAX_BYTES = 700 * 1024
+JPEG_QUALITIES = (88, 80, 72, 64, 56)
+NORMALIZE_CACHE_ENTRIES = 32
+NORMALIZE_DISK_MAX_BYTES = 256 * 1024 * 1024
+NORMALIZE_DISK_TTL = 7 * 24 * 3600
+# Pulizia della cartella su disco ogni tante scritture
+NORMALIZE_PRUNE_EVERY = 50
+# Scarto di proporzioni sotto il quale non si ritaglia
+ASPECT_TOLERANCE = 0.01
+
+_normalized = LRUIndex(NORMALIZE_CACHE_ENTRIES)
+_prune_lock = threading.Lock()
+_writes_since_prune = NORMALIZE_PRUNE_EVERY     # la prima scrittura del processo fa pulizia
+
+
+def _crop_to(im, aspect):
+    w, h = im.size
+    if w / h > aspect + ASPECT_TOLERANCE:
+        nw = round(h * aspect)
+        left = (w - nw) // 2
+        return im.crop((left, 0, left + nw, h))
+    if w / h < aspect - ASPECT_TOLERANCE:
+        nh = round(w / aspect)
+        top = (h - nh) // 2
+        return im.crop((0, top, w, top + nh))
+    return im
+
+
+def _normalize(data, size, max_bytes):
+    try:
+        from PIL import Image, ImageOps
+        im = Image.open(io.BytesIO(data))
+        im.load()
+    except Exception:
+        # Formato che Pillow non legge (EMF/WMF...): si carica così com'è
+        return data
+    tw, th = size
+    w, h = im.size
+    if (sniff_content_type(data)[1] in ("jpg", "png") and w <= tw and h <= th
+            and abs(w / h - tw / th) <= ASPECT_TOLERANCE and len(data) <= max_bytes):
+        return data
+
+    im = _crop_to(ImageOps.exif_transpose(im), tw / th)
+    if im.width > tw:
+        im = im.resize((tw, th), Image.LANCZOS)
+
+    if im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info):
+        im = im.convert("RGBA")
+        if im.getchannel("A").getextrema()[0] < 255:
+            out = io.BytesIO()
+            im.save(out, "PNG", optimize=True)
+            if out.tell() > max_bytes:
+                out = io.BytesIO()
+                im.quantize(256).save(out, "PNG", optimize=True)
+            return out.getvalue()
+
+    im = im.convert("RGB")
+    for quality in JPEG_QUALITIES:
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        if out.tell() <= max_bytes:
+            break
+    return out.getvalue()
+
+
+def prune_normalized(max_bytes=NORMALIZE_DISK_MAX_BYTES, ttl=NORMALIZE_DISK_TTL):
+    """Toglie dalla cache su disco i file scaduti e, oltre max_bytes, i meno usati (mtime)."""
+    folder = os.path.dirname(cache_path("normalized_images", "x"))
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(".tmp"): continue    # scrittura in corso di un altro thread
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+    now = time.time()
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if now - mtime < ttl and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _maybe_prune():
+    global _writes_since_prune
+    with _prune_lock:
+        _writes_since_prune += 1
+        if _writes_since_prune < NORMALIZE_PRUNE_EVERY: return
+        _writes_since_prune = 0
+        try: prune_normalized()
+        except OSError as e: print(f"Pulizia cache immagini non riuscita: {e}")
+
+
+def normalize_image(image_bytes, size=SLIDE_PIXELS, max_bytes=NORMALIZED_MAX_BYTES):
+    """Immagine pronta per una slide (16:9, al massimo size, entro max_bytes)."""
+    key = f"{hashlib.sha256(image_bytes).hexdigest()}_{size[0]}x{size[1]}_{max_bytes}"
+    data = _normalized.get(key)
+    if data is not None:
+        return data
+    path = cache_path("normalized_images", key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        with tracing.span("local", "normalize_image", len(image_bytes)) as sp:
+            data = _normalize(image_bytes, size, max_bytes)
+            sp.bytes_in = len(data)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        _maybe_prune()
+    else:
+        # mtime = ultimo uso: prune_normalized toglie per primi i meno usati
+        try: os.utime(path)
+        except OSError: pass
+    _normalized.put(key, data)
+    return data
+
+
+def upload_bytes_to_bucket(registry, image_bytes, normalize=True):
+    """Carica l'immagine (se non c'è già) e restituisce l'URL pubblico. Solleva eccezione se fallisce.
+
+    normalize: prima la porta a risoluzione slide (normalize_image).
+    """
+    if normalize:
+        image_bytes = normalize_image(image_bytes)
+    name = object_name(image_bytes)
+    key = (registry.bucket_name, name)
+    url = _index.get(key)
+    if url:
+        return url
+
+    url = public_url(registry.bucket_name, name)
+    blob = registry.bucket().blob(name)
+    with tracing.span("gcs", "blob.exists"):
+        exists = blob.exists()
+    if not exists:
+        content_type, _ = sniff_content_type(image_bytes)
+        try:
+            # ACL nello stesso upload (niente make_public separato);
+            # if_generation_match=0: non sovrascrive se un altro thread l'ha già caricato
+            with tracing.span("gcs", "blob.upload", len(image_bytes)):
+                blob.upload_from_string(image_bytes, content_type=content_type, predefined_acl="publicRead", if_generation_match=0)
+        except Exception as e:
+            if getattr(e, "code", None) != 412:
+                raise
+    _index.put(key, url)
+    # Anteprime e render locale non devono riscaricare quello che abbiamo appena caricato
+    _fetched.put(url, image_bytes)
+    return url
+
+
+_fetched = LRUIndex(FETCH_CACHE_ENTRIES)
+
+
+def fetch_image(registry, url):
+    """Bytes di un'immagine per URL (render locale, vedi local_render.py).
+
+    Gli URL del nostro bucket si leggono dal blob con le credenziali del
+    registry; gli altri via HTTP. Piccola cache: ITA ed ENG usano le stesse.
+    """
+    data = _fetched.get(url)
+    if data is not None:
+        return data
+    prefix = public_url(registry.bucket_name, "")
+    if url.startswith(prefix):
+        name = url[len(prefix):]
+        with tracing.span("gcs", "blob.download"):
+            data = registry.bucket().blob(name).download_as_bytes()
+    else:
+        import requests
+        with tracing.span("http", "image.get"):
+            resp = requests.get(url, timeout=FETCH_TIMEOUT)
+            resp.raise_for_status()
+            data = resp.content
+    _fetched.put(url, data)
+    return data
+
+
+def upload_many(registry, images, workers=UPLOAD_WORKERS):
+    """Carica molte immagini in parallelo sulla sessione HTTP condivisa del registry.
+
+    images: dict chiave -> bytes. Restituisce dict chiave -> URL (None se fallito).
+    """
+    if not images:
+        return {}
+    registry.bucket()  # client creato una volta, prima dei thread
+
+    def _one(item):
+        k, data = item
+        try:
+            return k, upload_bytes_to_bucket(registry, data)
+        except Exception as e:
+            print(f"Errore Upload Bucket ({k}): {e}")
+            return k, None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(images))), thread_name_prefix="gcs") as pool:
+        return dict(pool.map(_one, images.items()))
+
+
+# ======================================================
+# 🎨 IMAGEN: HANDLE DEI MODELLI + BACKOFF ADATTIVO
+# ======================================================
+
+IMAGEN_MAX_ATTEMPTS = 5
+IMAGEN_DEADLINE = 45          # secondi totali per una generazione (tentativi + attese)
+IMAGEN_CALL_TIMEOUT = 40      # secondi per UNA chiamata generate_images
+# Bottone "Genera Immagine": l'utente aspetta, meglio fallire presto e riprovare
+INTERACTIVE_DEADLINE = 20
+INTERACTIVE_CALL_TIMEOUT = 15
+CANCEL_POLL = 0.25            # ogni quanto una chiamata in attesa controlla l'annullamento
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 20.0
+
+_RETRY_HINT_RES = [
+    re.compile(r'retryDelay"?\s*[:=]\s*"?(\d+(?:\.\d+)?)s', re.I),
+    re.compile(r'retry (?:in|after) (\d+(?:\.\d+)?)\s*s', re.I),
+]
+
+_models = {}
+_models_lock = threading.Lock()
+# La chiamata SDK non ha timeout: gira qui e chi la aspetta smette dopo call_timeout.
+# Un thread appeso resta occupato finché l'SDK non rinuncia, ma non blocca nessuno.
+_call_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="imagen-call")
+
+
+class ImagenError(Exception):
+    """Generazione non riuscita: il messaggio spiega il motivo (quota, timeout, annullata...)."""
+
+
+class _CallTimeout(ImagenError):
+    """Chiamata singola oltre call_timeout: si ritenta come un 429 se resta tempo."""
+
+
+def get_imagen_model(registry, model_name):
+    """Handle del modello Imagen, caricato una volta per registry e nome."""
+    key = (id(registry), model_name)
+    model = _models.get(key)
+    if model is None:
+        model_cls = registry.image_generation_model()
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = model_cls.from_pretrained(model_name)
+                _models[key] = model
+    return model
+
+
+def is_transient(e):
+    txt = str(e)
+    return ("429" in txt or "Quota" in txt or "503" in txt
+            or type(e).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable"))
+
+
+def retry_hint(e):
+    """Attesa suggerita dal server (RetryInfo gRPC o testo dell'errore), in secondi."""
+    for d in getattr(e, "details", None) or []:
+        delay = getattr(d, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    for rx in _RETRY_HINT_RES:
+        m = rx.search(str(e))
+        if m:
+            return float(m.group(1))
+    return None
+
+
+def backoff_delay(attempt, hint=None):
+    """Backoff esponenziale con full jitter; l'hint del server fa da minimo."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if hint:
+        delay = max(delay, hint)
+    return delay
+
+
+def _call_with_timeout(fn, timeout, cancel_event):
+    """fn() in _call_pool; ImagenError se supera timeout o se cancel_event scatta prima."""
+    fut = _call_pool.submit(contextvars.copy_context().run, fn)
+    end = time.monotonic() + timeout
+    while True:
+        try:
+            return fut.result(timeout=max(0.0, min(CANCEL_POLL, end - time.monotonic())))
+        except FutureTimeout:
+            if cancel_event.is_set():
+                raise ImagenError("generazione annullata")
+            if time.monotonic() >= end:
+                raise _CallTimeout(f"Imagen non ha risposto entro {timeout:.0f}s")
+
+
+def generate_imagen_safe(registry, prompt, model_name, cancel_event=None, deadline=IMAGEN_DEADLINE, max_attempts=IMAGEN_MAX_ATTEMPTS,
+                         call_timeout=IMAGEN_CALL_TIMEOUT):
+    """Genera 1 immagine 16:9 e restituisce i bytes. Solleva ImagenError con il motivo.
+
+    cancel_event (threading.Event) interrompe chiamata e attese; deadline limita
+    il tempo totale, call_timeout la singola chiamata (anche se l'SDK resta appeso).
+    """
+    cancel_event = cancel_event or threading.Event()
+    end = time.monotonic() + deadline
+    model = get_imagen_model(registry, model_name)
+    last_error = None
+    for attempt in range(max_attempts):
+        if cancel_event.is_set():
+            raise ImagenError("generazione annullata")
+        try:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise ImagenError(f"tempo massimo di {deadline}s superato: {last_error}")
+            # Parametri fissi per consistenza: 1 immagine, 16:9
+            with tracing.attempt(attempt), tracing.span("imagen", "generate_images", len(prompt)) as sp:
+                result = _call_with_timeout(
+                    lambda: model.generate_images(prompt=prompt, number_of_images=1, aspect_ratio="16:9", person_generation="allow_adult"),
+                    min(call_timeout, remaining), cancel_event)
+                if result: sp.bytes_in = len(result[0]._image_bytes)
+            if result: return result[0]._image_bytes
+            raise ImagenError("nessuna immagine restituita (prompt filtrato dai safety filter?)")
+        except _CallTimeout as e:
+            last_error = e
+        except ImagenError:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise ImagenError(str(e)) from e
+            last_error = e
+        delay = backoff_delay(attempt, retry_hint(last_error))
+        remaining = end - time.monotonic()
+        if delay >= remaining:
+            raise ImagenError(f"Imagen non disponibile, tempo massimo di {deadline}s superato: {last_error}")
+        if cancel_event.wait(delay):
+            raise ImagenError("generazione annullata")
+    raise ImagenError(f"Imagen non disponibile dopo {max_attempts} tentativi: {last_error}")
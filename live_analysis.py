@@ -0,0 +1,60 @@
+import threading
+
+import pipeline
+
+# ======================================================
+# 🌊 ANALISI IN BACKGROUND CON CAMPI IN STREAMING
+# ======================================================
+# ANALIZZA non blocca più lo script fino all'ultimo deck: l'analisi gira in
+# un thread e Gemini risponde in streaming. Ogni campo completo (titolo,
+# body, elenchi...) finisce in coda; lo script Streamlit li raccoglie con
+# collect() a ogni rerun e l'editor si riempie campo per campo.
+# Come in prefetch.py, i thread non toccano st.session_state.
+
+
+class LiveAnalysis:
+    """Analisi di UN batch: eventi ("field", fname, (sezione, campo, valore)),
+    ("done", fname, {"ai_data", "images"}) e ("error", fname, eccezione)."""
+
+    def __init__(self, registry, files, model_name, parse_workers, llm_workers, use_cache=True, context_budget=None):
+        self.order = [fname for fname, _ in files]
+        self._events = []
+        self._pending = set(self.order)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="live-analysis", daemon=True,
+                                        args=(registry, files, model_name, parse_workers, llm_workers, use_cache, context_budget))
+        self._thread.start()
+
+    def _push(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def _on_field(self, fname, section, field, value):
+        self._push(("field", fname, (section, field, value)))
+
+    def _run(self, registry, files, model_name, parse_workers, llm_workers, use_cache, context_budget):
+        try:
+            for fname, res, err in pipeline.analyze_batch(registry, files, model_name, parse_workers, llm_workers, use_cache,
+                                                          on_field=self._on_field, context_budget=context_budget):
+                with self._lock:
+                    self._pending.discard(fname)
+                    self._events.append(("error", fname, err) if err is not None else ("done", fname, res))
+        except Exception as e:
+            with self._lock:
+                for fname in self._pending:
+                    self._events.append(("error", fname, e))
+                self._pending.clear()
+
+    def pending(self):
+        """Deck non ancora conclusi."""
+        with self._lock:
+            return [f for f in self.order if f in self._pending]
+
+    def has_events(self):
+        with self._lock:
+            return bool(self._events)
+
+    def collect(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
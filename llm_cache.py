@@ -0,0 +1,103 @@
+import contextlib
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from settings import cache_path
+
+# ======================================================
+# 💾 CACHE PERSISTENTE RISPOSTE GEMINI (SQLITE)
+# ======================================================
+# Chiave: tipo di chiamata + versione del prompt + modello + hash del testo
+# inviato. Stesso deck ricaricato dopo un Reset, o ENG salvato due volte,
+# non costano un'altra chiamata.
+
+CACHE_TTL = 30 * 24 * 3600
+MAX_ENTRIES = 5000
+# Ogni quante scritture fare pulizia (scaduti + eccedenza LRU)
+EVICT_EVERY = 50
+
+
+class LLMCache:
+    def __init__(self, path, ttl=CACHE_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, kind TEXT, model TEXT, value TEXT,
+                created REAL, last_access REAL)""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Una connessione per operazione: sqlite3 non condivide connessioni tra thread
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def make_key(kind, version, model_name, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{kind}:v{version}:{model_name}:{digest}"
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                with self._lock: self.hits += 1
+                return json.loads(row[0])
+        with self._lock: self.misses += 1
+        return None
+
+    def put(self, key, kind, model_name, value):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, kind, model_name, json.dumps(value, ensure_ascii=False), now, now))
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            db.execute("""DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._connect() as db:
+            entries = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = LLMCache(cache_path("llm_cache.sqlite3"))
+        return _default
@@ -0,0 +1,226 @@
+import copy
+import hashlib
+import io
+import os
+import threading
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.oxml.ns import qn
+from pptx.text.text import _Paragraph
+
+from brain import translate_deck
+import finalize
+import images
+import templates
+import tracing
+from settings import cache_path
+
+# ======================================================
+# 🖨️ RENDER LOCALE (PYTHON-PPTX) + UN SOLO UPLOAD
+# ======================================================
+# Alternativa a copia template + batchUpdate Slides: il template viene
+# esportato in .pptx una volta per revisione, ogni deck si compila in
+# memoria con python-pptx (come page1/page2) e arriva su Drive con UNA
+# files.create, convertito in Google Slides oppure lasciato .pptx.
+# Le sostituzioni sono le stesse del percorso Slides: si riusano le
+# replaceAllText di finalize/templates e gli slot IMG_n (alt text) del
+# template, così i due percorsi producono lo stesso deck.
+
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+SLIDES_MIME = "application/vnd.google-apps.presentation"
+# Oltre questa dimensione Drive non accetta l'upload multipart: sessione resumable
+MULTIPART_LIMIT = 5 * 1024 * 1024
+
+_templates = {}                   # (template_id, revisione) -> bytes .pptx
+_templates_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def template_pptx(registry, tindex):
+    """Template esportato in .pptx, scaricato una volta per revisione (memoria + disco)."""
+    key = (tindex.template_id, tindex.revision)
+    with _templates_lock:
+        data = _templates.get(key)
+    if data is not None:
+        return data
+    path = cache_path("template_pptx", hashlib.sha256(f"{key[0]}|{key[1]}".encode()).hexdigest()[:32] + ".pptx")
+    # Un solo export alla volta: i thread degli altri deck aspettano il primo
+    with _export_lock:
+        with _templates_lock:
+            data = _templates.get(key)
+        if data is None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = registry.drive().files().export(fileId=tindex.template_id, mimeType=PPTX_MIME).execute()
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            with _templates_lock:
+                _templates[key] = data
+    return data
+
+
+# --- SOSTITUZIONI ---
+
+def text_pairs(reqs):
+    """replaceAllText (finalize/templates) -> coppie (cerca, sostituisci)."""
+    return [(r['replaceAllText']['containsText']['text'], r['replaceAllText']['replaceText']) for r in reqs if 'replaceAllText' in r]
+
+
+def _iter_shapes(shapes):
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _iter_shapes(shape.shapes)
+        else:
+            yield shape
+
+
+def _text_frames(shapes):
+    for shape in _iter_shapes(shapes):
+        if shape.has_text_frame:
+            yield shape.text_frame
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            for row in shape.table.rows:
+                for cell in row.cells:
+                    yield cell.text_frame
+
+
+def _set_text(p, text, rpr):
+    p.text = text
+    if rpr is None: return
+    for r in p._p.r_lst:
+        old = r.find(qn('a:rPr'))
+        if old is not None: r.remove(old)
+        r.insert(0, copy.deepcopy(rpr))
+
+
+def _replace_in_paragraph(p, pairs):
+    full = p.text
+    new = full
+    for find, repl in pairs:
+        if find in new: new = new.replace(find, repl)
+    if new == full: return
+    # Stile del primo run su tutto il testo; ogni riga nuova diventa un paragrafo
+    # clonato (come fa replaceAllText su Slides: elenchi puntati compresi)
+    first = p._p.r_lst[0] if p._p.r_lst else None
+    rpr = first.find(qn('a:rPr')) if first is not None else None
+    rpr = copy.deepcopy(rpr) if rpr is not None else None
+    lines = new.split("\n")
+    _set_text(p, lines[0], rpr)
+    anchor = p._p
+    for line in lines[1:]:
+        clone = copy.deepcopy(p._p)
+        anchor.addnext(clone)
+        anchor = clone
+        _set_text(_Paragraph(clone, p._parent), line, rpr)
+
+
+def _alt_text(shape):
+    try:
+        return shape._element._nvXxPr.cNvPr.get("descr") or ""
+    except AttributeError:
+        return ""
+
+
+def _replace_picture(slide, shape, img_bytes):
+    """Come replaceImage CENTER_CROP: stessa posizione, dimensione e livello dello slot."""
+    pic = slide.shapes.add_picture(io.BytesIO(img_bytes), shape.left, shape.top, shape.width, shape.height)
+    iw, ih = pic.image.size
+    box, img = shape.width / shape.height, iw / ih
+    if img > box:
+        pic.crop_left = pic.crop_right = (1 - box / img) / 2
+    elif img < box:
+        pic.crop_top = pic.crop_bottom = (1 - img / box) / 2
+    pic._element._nvXxPr.cNvPr.set("descr", _alt_text(shape))
+    # Z-order: la nuova immagine prende il posto dello slot nello _spTree (come page1/page2)
+    shape._element.addprevious(pic._element)
+    shape._element.getparent().remove(shape._element)
+
+
+def render_pptx(template, text_reqs, pictures):
+    """Compila in memoria una copia del template.
+
+    text_reqs: replaceAllText come per batchUpdate; pictures: {ETICHETTA: bytes}.
+    Restituisce (bytes .pptx, failures) con failures come finalize.apply_requests.
+    """
+    prs = Presentation(io.BytesIO(template))
+    pairs = text_pairs(text_reqs)
+    failures = []
+    for slide in prs.slides:
+        for tf in list(_text_frames(slide.shapes)):
+            for p in list(tf.paragraphs):
+                _replace_in_paragraph(p, pairs)
+        for shape in list(_iter_shapes(slide.shapes)):
+            label = _alt_text(shape).strip().upper()
+            if label in pictures:
+                try:
+                    _replace_picture(slide, shape, pictures[label])
+                except Exception as e:
+                    failures.append((f"immagine {label}", str(e)))
+    out = io.BytesIO()
+    prs.save(out)
+    return out.getvalue(), failures
+
+
+def build_deck(registry, template_id, ai_data, urls_map, translate_mode, gemini_model, translated_data=None, use_cache=True):
+    """Deck compilato in .pptx (bytes, failures), senza scrivere nulla su Drive."""
+    tindex = templates.get_template_index(registry, template_id)
+    template = template_pptx(registry, tindex)
+
+    final_data = ai_data
+    reqs = []
+    if translate_mode:
+        final_data = translated_data or translate_deck(registry, ai_data, gemini_model, use_cache)
+        reqs.extend(templates.static_translation_requests(registry, tindex, gemini_model, use_cache))
+    reqs.extend(finalize.placeholder_requests(final_data, tindex.tokens))
+
+    pictures, failures = {}, []
+    for label, url in urls_map.items():
+        if not url: continue
+        try:
+            pictures[label.strip().upper()] = images.normalize_image(images.fetch_image(registry, url))
+        except Exception as e:
+            failures.append((f"immagine {label}", str(e)))
+
+    with tracing.span("local", "render_pptx"):
+        data, render_failures = render_pptx(template, reqs, pictures)
+    return data, failures + render_failures
+
+
+def upload_pptx(registry, folder_id, filename, data, convert=True, app_properties=None):
+    """UNA files.create: il .pptx arriva su Drive (convertito in Google Slides se convert)."""
+    from googleapiclient.http import MediaIoBaseUpload
+    body = {'name': filename if convert else f"{filename}.pptx", 'parents': [folder_id]}
+    if convert: body['mimeType'] = SLIDES_MIME
+    if app_properties: body['appProperties'] = app_properties
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=PPTX_MIME, resumable=len(data) > MULTIPART_LIMIT)
+    registry.drive_writes.acquire()
+    created = registry.drive().files().create(body=body, media_body=media, fields='id', supportsAllDrives=True).execute()
+    return created.get('id')
+
+
+def worker_local_finalize(registry, template_id, folder_id, filename, ai_data, urls_map, translate_mode, gemini_model, translated_data=None, use_cache=True,
+                          done=None, on_stage=None, tag=None, convert=True, resumed=False):
+    """Come finalize.worker_bot_finalize, ma con render locale e un solo upload.
+
+    L'upload è atomico: le fasi "copied" e "filled" si registrano insieme e
+    un file già marcato con tag (salvataggio interrotto e resumed) è considerato completo.
+    """
+    done = done or {}
+    if 'filled' in done:
+        return done['copied'], done['filled']
+    on_stage = on_stage or (lambda stage, value: None)
+
+    new_id = done.get('copied') or (finalize.find_tagged_copy(registry, folder_id, tag) if tag and resumed else None)
+    failures = []
+    if not new_id:
+        data, failures = build_deck(registry, template_id, ai_data, urls_map, translate_mode, gemini_model, translated_data, use_cache)
+        new_id = upload_pptx(registry, folder_id, filename, data, convert, tag)
+    if 'copied' not in done:
+        on_stage('copied', new_id)
+    on_stage('filled', failures)
+    return new_id, failures
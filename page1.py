@@ -1,53 +1,45 @@
 import streamlit as st
-import google.generativeai as genai
-import json
-import requests
+import imagen_client
+import images
+import page_analysis
 import io
 from pptx.util import Inches, Pt
 
-def analyze_content(context, gemini_model):
+def analyze_content(registry, context, gemini_model):
+    """format_name, claim, imagen_prompt dall'analisi combinata del deck (page_analysis: una richiesta per tutte le pagine)."""
     try:
-        model = genai.GenerativeModel(gemini_model)
-        prompt_text = f"""
-        Sei un Art Director. COMPITI:
-        1. NOME FORMAT: Estrailo ESATTO dal testo.
-        2. CLAIM: Crea uno slogan commerciale potente (max 10 parole).
-        3. PROMPT IMMAGINE: Scrivi un prompt DETTAGLIATO in inglese per una copertina FOTOREALISTICA.
-
-        RISPONDI SOLO JSON: {{"format_name": "...", "claim": "...", "imagen_prompt": "..."}}
-
-        TESTO SORGENTE: {context[:5000]}
-        """
-        res_text = model.generate_content(prompt_text, generation_config={"response_mime_type": "application/json"})
-        return json.loads(res_text.text)
+        data = page_analysis.for_page(page_analysis.analyze(registry, context, gemini_model), 1)
     except Exception as e:
         st.error(f"Errore Analisi Gemini: {e}")
         return None
+    if data is None:
+        st.error("Errore Analisi Gemini: nessuna risposta")
+    return data
 
 def generate_image_with_imagen(prompt, api_key, model_name):
-    if not model_name.startswith("models/"): model_name = f"models/{model_name}"
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model_name}:predict?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    data = {"instances": [{"prompt": prompt}], "parameters": {"aspectRatio": "16:9", "sampleCount": 1}}
-    
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if "predictions" in result:
-            import base64
-            return base64.b64decode(result["predictions"][0]["bytesBase64Encoded"])
-        return None
+        return imagen_client.generate(prompt, api_key, model_name)[0]
     except Exception as e:
         st.error(f"Errore Imagen: {e}")
         return None
 
+def generate_images_with_imagen(prompts, api_key, model_name):
+    """Più slide in parallelo: una immagine (o None) per prompt, nello stesso ordine."""
+    out = []
+    for res in imagen_client.generate_many(prompts, api_key, model_name):
+        if isinstance(res, Exception):
+            st.error(f"Errore Imagen: {res}")
+            out.append(None)
+        else:
+            out.append(res[0])
+    return out
+
 def insert_content_into_ppt(slide, data, img_bytes):
     try:
         # 1. IMMAGINE (Tentativo Safe)
         if img_bytes:
             try:
-                image_stream = io.BytesIO(img_bytes)
+                image_stream = io.BytesIO(images.normalize_image(img_bytes))
                 pic = slide.shapes.add_picture(image_stream, Inches(0), Inches(0), width=Inches(13.333), height=Inches(7.5))
                 # Tentativo di spostare indietro
                 slide.shapes._spTree.remove(pic._element)
@@ -1,52 +1,45 @@
 import streamlit as st
-import google.generativeai as genai
-import json
-import requests
+import imagen_client
+import images
+import page_analysis
 import io
 from pptx.util import Inches, Pt
 
-def analyze_content(context, gemini_model):
+def analyze_content(registry, context, gemini_model):
+    """Come page1.analyze_content, per lo SCENARIO (format_name, emotional_text, imagen_prompt)."""
     try:
-        model = genai.GenerativeModel(gemini_model)
-        prompt_text = f"""
-        Sei un Copywriter. Pagina 2: SCENARIO.
-        JSON RICHIESTO:
-        1. "format_name": Nome del format.
-        2. "emotional_text": Testo emozionale (Max 300 caratteri).
-        3. "imagen_prompt": Prompt immagine sfondo 16:9.
-
-        RISPONDI SOLO JSON: {{"format_name": "...", "emotional_text": "...", "imagen_prompt": "..."}}
-        TESTO: {context[:6000]}
-        """
-        res_text = model.generate_content(prompt_text, generation_config={"response_mime_type": "application/json"})
-        return json.loads(res_text.text)
+        data = page_analysis.for_page(page_analysis.analyze(registry, context, gemini_model), 2)
     except Exception as e:
         st.error(f"Errore Analisi Page 2: {e}")
         return None
+    if data is None:
+        st.error("Errore Analisi Page 2: nessuna risposta")
+    return data
 
 def generate_image(prompt, api_key, model_name):
-    if not model_name.startswith("models/"): model_name = f"models/{model_name}"
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model_name}:predict?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    data = {"instances": [{"prompt": prompt}], "parameters": {"aspectRatio": "16:9", "sampleCount": 1}}
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if "predictions" in result:
-            import base64
-            return base64.b64decode(result["predictions"][0]["bytesBase64Encoded"])
-        return None
+        return imagen_client.generate(prompt, api_key, model_name)[0]
     except Exception as e:
         st.error(f"Errore Imagen: {e}")
         return None
 
+def generate_images(prompts, api_key, model_name):
+    """Più slide in parallelo: una immagine (o None) per prompt, nello stesso ordine."""
+    out = []
+    for res in imagen_client.generate_many(prompts, api_key, model_name):
+        if isinstance(res, Exception):
+            st.error(f"Errore Imagen: {res}")
+            out.append(None)
+        else:
+            out.append(res[0])
+    return out
+
 def insert_into_slide(slide, data, img_bytes):
     try:
         # 1. IMMAGINE (SAFE)
         if img_bytes:
             try:
-                image_stream = io.BytesIO(img_bytes)
+                image_stream = io.BytesIO(images.normalize_image(img_bytes))
                 pic = slide.shapes.add_picture(image_stream, Inches(0), Inches(0), width=Inches(13.333), height=Inches(7.5))
                 slide.shapes._spTree.remove(pic._element)
                 slide.shapes._spTree.insert(1, pic._element)
@@ -1,34 +1,19 @@
-import google.generativeai as genai
-import json
+import page_analysis
 
-def process(slide, context):
-    """LOGICA ESCLUSIVA PER PAGINA 3: DETTAGLI TECNICI"""
-    
-    model = genai.GenerativeModel("gemini-1.5-pro")
-    
-    prompt = f"""
-    Sei un tecnico esperto. Stai lavorando sulla pagina: DETTAGLI LOGISTICI E TECNICI.
-    
-    OBIETTIVI:
-    1. Titolo: Usa il Nome del Format.
-    2. Box Piccolo: Scrivi "Scheda Tecnica".
-    3. Box Grande: Estrai durata, numero partecipanti, location (indoor/outdoor) e requisiti tecnici. Usa un elenco puntato.
-    4. Imagen 3: Un close-up di un dettaglio tecnico o attrezzatura.
+GEMINI_MODEL = "gemini-1.5-pro"
 
-    Rispondi SOLO in JSON:
-    {{
-        "title": "Nome Format",
-        "category": "Scheda Tecnica",
-        "body": "Durata: ...\nPartecipanti: ...\nLocation: ...",
-        "imagen_prompt": "Prompt..."
-    }}
-    
-    CONTESTO: {context}
+def process(registry, slide, context, gemini_model=GEMINI_MODEL):
+    """LOGICA ESCLUSIVA PER PAGINA 3: DETTAGLI TECNICI
+
+    I dati arrivano dall'analisi combinata del deck (page_analysis), già
+    pronta prima di toccare la slide: con lo stesso modello di page1/page2
+    non c'è nessuna richiesta in più.
     """
-    
     try:
-        res = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-        data = json.loads(res.text)
+        data = page_analysis.for_page(page_analysis.analyze(registry, context, gemini_model), 3)
+        if data is None:
+            print("Errore Page 3: nessuna risposta da Gemini")
+            return
         
         if slide.shapes.title: slide.shapes.title.text = data.get("title", "")
         
@@ -0,0 +1,71 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import brain
+
+# ======================================================
+# 📄 ANALISI CONDIVISA DA page1 / page2 / page3
+# ======================================================
+# Le tre pagine leggono lo stesso testo sorgente: invece di tre chiamate
+# Gemini in fila (più una per slide in page3) si fa UNA richiesta per deck
+# (brain.analyze_pages_batch, più deck per richiesta). page1/page2.analyze_content
+# e page3.process chiedono qui il risultato del loro deck: la prima pagina
+# lo calcola, le altre lo ritrovano in memoria per (modello, testo). Chi
+# lavora su più deck chiama prima analyze_batch: i deck condividono le
+# richieste e le pagine trovano tutto già pronto.
+
+MEMO_ENTRIES = 256
+
+_memo = OrderedDict()       # (modello, sha256 testo) -> risultato, LRU
+_memo_lock = threading.Lock()
+
+
+def _key(context, model_name):
+    return (model_name, hashlib.sha256(context.encode("utf-8")).hexdigest())
+
+
+def _memo_get(key):
+    with _memo_lock:
+        res = _memo.get(key)
+        if res is not None:
+            _memo.move_to_end(key)
+        return res
+
+
+def _memo_put(key, res):
+    with _memo_lock:
+        _memo[key] = res
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_ENTRIES:
+            _memo.popitem(last=False)
+
+
+def analyze_batch(registry, contexts, model_name, use_cache=True):
+    """{fname: testo} -> {fname: risultato}; i deck già analizzati non vengono richiesti."""
+    results, todo = {}, {}
+    for fname, context in contexts.items():
+        hit = _memo_get(_key(context, model_name))
+        if hit is not None: results[fname] = hit
+        else: todo[fname] = context
+    if todo:
+        for fname, res in brain.analyze_pages_batch(registry, todo, model_name, use_cache).items():
+            _memo_put(_key(todo[fname], model_name), res)
+            results[fname] = res
+    return results
+
+
+def analyze(registry, context, model_name, use_cache=True):
+    """Risultato combinato per un deck, o None se Gemini non ha risposto."""
+    return analyze_batch(registry, {"deck": context}, model_name, use_cache).get("deck")
+
+
+def for_page(result, page):
+    """Dati nel formato che la pagina già usa (page1: format_name/claim/imagen_prompt...)."""
+    if not result: return None
+    data = dict(result.get(f"page{page}") or {})
+    if page == 3:
+        data["title"] = result.get("format_name", "")
+    else:
+        data["format_name"] = result.get("format_name", "")
+    return data
@@ -0,0 +1,266 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import analysis
+import brain
+import finalize
+import images
+import local_render
+import prefetch
+import tracing
+
+# ======================================================
+# ⚡ PIPELINE CONCORRENTE
+# ======================================================
+# Parsing PPTX (CPU-bound, tiene il GIL) -> process pool
+# Chiamate Gemini (I/O-bound)             -> thread pool limitato
+# Nessuna funzione tocca Streamlit: le usano sia app.py sia batch_cli.py.
+
+DEFAULT_PARSE_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_LLM_WORKERS = 4
+# Le scritture sono comunque limitate dai RateLimiter del registry
+DEFAULT_DRIVE_WORKERS = 4
+
+# Slot di final_images -> etichetta immagine nel template / indice slide originale
+SLOT_LABELS = {"cover": "IMG_1", "desc_1": "IMG_2", "desc_2": "IMG_3"}
+ORIGINAL_INDEX = {"cover": 0, "desc_1": 1, "desc_2": 2}
+# none: nessuna immagine; original: immagini del PPT; ai: Imagen; auto: Imagen, se fallisce l'originale
+IMAGE_MODES = ("none", "original", "ai", "auto")
+# slides: copia template + batchUpdate; local: render python-pptx + upload convertito
+# in Google Slides; pptx: render python-pptx + upload del .pptx così com'è
+RENDER_MODES = ("slides", "local", "pptx")
+
+_parse_pool = None
+_parse_pool_workers = 0
+_parse_pool_users = {}      # pool -> analisi in corso che lo usano
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool(workers):
+    """Process pool condiviso tra i click (spawn: sicuro con grpc/thread attivi).
+
+    Uno solo per processo. Ogni chiamata va chiusa con release_parse_pool:
+    se cambia la dimensione il vecchio pool viene chiuso solo quando l'ultima
+    analisi che lo usa lo rilascia, così nessuna sessione si ritrova a
+    sottomettere su un pool già chiuso.
+    """
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool_workers != workers:
+            old = _parse_pool
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _parse_pool_workers = workers
+            if old is not None and old not in _parse_pool_users:
+                old.shutdown(wait=False)
+        _parse_pool_users[_parse_pool] = _parse_pool_users.get(_parse_pool, 0) + 1
+        return _parse_pool
+
+
+def release_parse_pool(pool):
+    with _parse_pool_lock:
+        _parse_pool_users[pool] -= 1
+        if _parse_pool_users[pool]:
+            return
+        del _parse_pool_users[pool]
+        retired = pool is not _parse_pool
+    if retired:
+        pool.shutdown(wait=False)
+
+
+def analyze_batch(registry, files, model_name, parse_workers=DEFAULT_PARSE_WORKERS, llm_workers=DEFAULT_LLM_WORKERS, use_cache=True,
+                  on_field=None, context_budget=None):
+    """Analizza un batch di deck in parallelo.
+
+    files: lista di (fname, bytes). Genera (fname, result, error) man mano che
+    ogni deck termina, dove result = {"ai_data", "images"}.
+    Con parse_workers=0 il parsing gira nei thread (niente process pool).
+    Con on_field(fname, sezione, campo, valore) Gemini lavora in streaming e
+    ogni campo viene notificato appena completo, prima della fine del deck.
+    context_budget: token per il testo sorgente (None = default, 0 = testo intero).
+    """
+    if not files:
+        return
+    llm_pool = ThreadPoolExecutor(max_workers=max(1, llm_workers), thread_name_prefix="gemini")
+    shared_pool = get_parse_pool(parse_workers) if parse_workers > 0 else None
+    parse_pool = shared_pool or llm_pool
+
+    try:
+        parse_jobs = {parse_pool.submit(analysis.analyze_pptx_bytes, data): fname for fname, data in files}
+        sizes = {fname: len(data) for fname, data in files}
+        submitted = time.time()
+        llm_jobs = {}
+        parsed_images = {}
+
+        while parse_jobs or llm_jobs:
+            done, _ = wait(list(parse_jobs) + list(llm_jobs), return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in parse_jobs:
+                    fname = parse_jobs.pop(fut)
+                    try:
+                        txt, imgs = fut.result()
+                    except Exception as e:
+                        tracing.timed("local", "parse_pptx", [fname], submitted, time.time() - submitted, sizes[fname], "error")
+                        yield fname, None, e
+                        continue
+                    # Attesa in coda compresa: è il tempo che il deck ha davvero aspettato
+                    tracing.timed("local", "parse_pptx", [fname], submitted, time.time() - submitted, sizes[fname])
+                    parsed_images[fname] = imgs
+                    if on_field:
+                        fut = llm_pool.submit(tracing.bind(fname, brain.brain_process_stream), registry, txt, model_name, use_cache,
+                                              functools.partial(on_field, fname), context_budget)
+                    else:
+                        fut = llm_pool.submit(tracing.bind(fname, brain.brain_process), registry, txt, model_name, use_cache, context_budget)
+                    llm_jobs[fut] = fname
+                else:
+                    fname = llm_jobs.pop(fut)
+                    try:
+                        data = fut.result()
+                    except Exception as e:
+                        yield fname, None, e
+                        continue
+                    yield fname, {"ai_data": data, "images": parsed_images.pop(fname)}, None
+    finally:
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        if shared_pool: release_parse_pool(shared_pool)
+
+
+def urls_map_for(saved):
+    """final_images di un deck ({slot: url}) -> urls_map per finalize."""
+    return {SLOT_LABELS[slot]: url for slot, url in saved.items() if slot in SLOT_LABELS and url}
+
+
+def _deck_image(registry, mode, prompt, original, imagen_model):
+    if mode in ("ai", "auto") and prompt:
+        try:
+            return images.upload_bytes_to_bucket(registry, images.generate_imagen_safe(registry, prompt, imagen_model))
+        except Exception:
+            if mode == "ai" or not original: raise
+    if original:
+        return images.upload_bytes_to_bucket(registry, original)
+    return None
+
+
+def images_batch(registry, decks, mode, imagen_model, workers=prefetch.PREFETCH_WORKERS):
+    """Immagini automatiche per un batch senza editor.
+
+    decks: dict fname -> {"ai_data", "images"} come prodotto da analyze_batch.
+    Genera (fname, slot, url, error) man mano; url None se lo slot resta vuoto.
+    """
+    if mode == "none" or not decks:
+        return
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="images")
+    try:
+        jobs = {}
+        for fname, res in decks.items():
+            for section, slot in prefetch.SLOTS.items():
+                prompt = res["ai_data"].get(section, {}).get('image_prompt')
+                original = res["images"].get(ORIGINAL_INDEX[slot])
+                fut = pool.submit(tracing.bind(fname, _deck_image), registry, mode, prompt, original, imagen_model)
+                jobs[fut] = (fname, slot)
+        while jobs:
+            done, _ = wait(list(jobs), return_when=FIRST_COMPLETED)
+            for fut in done:
+                fname, slot = jobs.pop(fut)
+                try:
+                    yield fname, slot, fut.result(), None
+                except Exception as e:
+                    yield fname, slot, None, e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def finalize_worker(render):
+    """Funzione che salva UN file su Drive per la modalità render (vedi RENDER_MODES)."""
+    if render == "slides":
+        return finalize.worker_bot_finalize
+    return functools.partial(local_render.worker_local_finalize, convert=render == "local")
+
+
+def finalize_batch(registry, template_id, folder_id, decks, make_english, gemini_model,
+                   drive_workers=DEFAULT_DRIVE_WORKERS, llm_workers=DEFAULT_LLM_WORKERS, use_cache=True, translations=None,
+                   checkpoints=None, render="slides"):
+    """Salva su Drive un batch di deck come grafo di job concorrente.
+
+    decks: lista di (fname, ai_data, urls_map). Per ogni deck la copia ITA
+    parte subito sul pool Drive/Slides mentre le traduzioni ENG mancanti
+    girano sul pool Gemini, brain.TRANSLATE_BATCH_SIZE deck per richiesta;
+    a traduzione pronta parte la copia ENG.
+    translations: dict fname -> ai_data inglese già pronto, riusato così
+    com'è; le traduzioni nuove vengono aggiunte qui (per salvarle).
+    Genera (fname, lingua, new_id, failures, error) man mano che ogni file
+    termina; failures sono le singole richieste Slides scartate.
+    checkpoints (vedi save_jobs.SaveJob): fasi già fatte per (deck, lingua),
+    da saltare, e registrazione di quelle nuove, traduzioni comprese.
+    render: come si compila ogni file (RENDER_MODES).
+    """
+    worker = finalize_worker(render)
+    translations = {} if translations is None else translations
+    if checkpoints:
+        for fname, _, _ in decks:
+            done = checkpoints.done(fname, "ENG").get('translated')
+            if done and fname not in translations:
+                translations[fname] = done
+
+    def resume_kwargs(fname, lang):
+        if not checkpoints: return {}
+        return {"done": checkpoints.done(fname, lang), "tag": checkpoints.tag(fname, lang), "resumed": checkpoints.resumed,
+                "on_stage": lambda stage, value: checkpoints.record(fname, lang, stage, value)}
+    drive_pool = ThreadPoolExecutor(max_workers=max(1, drive_workers), thread_name_prefix="drive")
+    llm_pool = ThreadPoolExecutor(max_workers=max(1, llm_workers), thread_name_prefix="gemini")
+    pending_saves = {}      # future -> (file, lingua)
+    translate_jobs = {}     # future -> blocco di deck da tradurre
+
+    def submit_eng(fname, ai_data, urls_map):
+        fut = drive_pool.submit(tracing.bind(fname, worker), registry, template_id, folder_id, finalize.eng_filename(fname),
+                                ai_data, urls_map, True, gemini_model, translations[fname], use_cache, **resume_kwargs(fname, "ENG"))
+        pending_saves[fut] = (finalize.eng_filename(fname), "ENG")
+
+    try:
+        for fname, ai_data, urls_map in decks:
+            fut = drive_pool.submit(tracing.bind(fname, worker), registry, template_id, folder_id, fname,
+                                    ai_data, urls_map, False, gemini_model, use_cache=use_cache, **resume_kwargs(fname, "ITA"))
+            pending_saves[fut] = (fname, "ITA")
+        if make_english:
+            missing = [d for d in decks if d[0] not in translations]
+            for fname, ai_data, urls_map in decks:
+                if fname in translations:
+                    submit_eng(fname, ai_data, urls_map)
+            for start in range(0, len(missing), brain.TRANSLATE_BATCH_SIZE):
+                chunk = missing[start:start + brain.TRANSLATE_BATCH_SIZE]
+                fut = llm_pool.submit(tracing.bind([d[0] for d in chunk], brain.translate_decks), registry, {fname: ai_data for fname, ai_data, _ in chunk}, gemini_model, use_cache)
+                translate_jobs[fut] = chunk
+
+        while pending_saves or translate_jobs:
+            done, _ = wait(list(pending_saves) + list(translate_jobs), return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in translate_jobs:
+                    chunk = translate_jobs.pop(fut)
+                    try:
+                        translated = fut.result()
+                    except Exception as e:
+                        for fname, _, _ in chunk:
+                            yield finalize.eng_filename(fname), "ENG", None, [], e
+                        continue
+                    for fname, ai_data, urls_map in chunk:
+                        # Traduzione incompleta: niente checkpoint né riuso, l'ENG di questo deck fallisce
+                        if isinstance(translated[fname], Exception):
+                            yield finalize.eng_filename(fname), "ENG", None, [], translated[fname]
+                            continue
+                        translations[fname] = translated[fname]
+                        if checkpoints: checkpoints.record(fname, "ENG", "translated", translated[fname])
+                        submit_eng(fname, ai_data, urls_map)
+                else:
+                    fname, lang = pending_saves.pop(fut)
+                    try:
+                        new_id, failures = fut.result()
+                    except Exception as e:
+                        yield fname, lang, None, [], e
+                        continue
+                    yield fname, lang, new_id, failures, None
+    finally:
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        drive_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,129 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import images
+import tracing
+
+# ======================================================
+# 🔮 PRE-GENERAZIONE IMMAGINI IN BACKGROUND
+# ======================================================
+# Appena un deck è analizzato, i suoi tre image_prompt partono su un pool
+# di worker condiviso dal processo (la quota Imagen è per progetto).
+# I thread non toccano st.session_state: i risultati restano qui finché
+# lo script Streamlit non li raccoglie con collect().
+
+PREFETCH_WORKERS = 3
+# In background si può aspettare più a lungo che nel thread dello script
+PREFETCH_DEADLINE = 180
+
+# Sezione dell'ai_data -> slot di final_images
+SLOTS = {"page_1_cover": "cover", "page_2_desc": "desc_1", "page_3_desc": "desc_2"}
+
+_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# Generazioni chieste dall'utente: pool separato, non si mettono in coda dietro la pre-generazione
+INTERACTIVE_WORKERS = 4
+interactive_pool = ThreadPoolExecutor(max_workers=INTERACTIVE_WORKERS, thread_name_prefix="imagen-ui")
+
+
+class _Job:
+    def __init__(self, prompt, model_name, deadline, call_timeout):
+        self.prompt = prompt
+        self.model_name = model_name
+        self.deadline = deadline
+        self.call_timeout = call_timeout
+        self.cancel_event = threading.Event()
+        self.future = None
+
+
+class ImagePrefetcher:
+    """Job di pre-generazione di UNA sessione, indicizzati per (fname, slot).
+
+    Lo stesso meccanismo serve al bottone "Genera Immagine" (app.py), con
+    deadline brevi: la generazione non blocca lo script e si può annullare.
+    """
+
+    def __init__(self, registry, model_name, pool=None):
+        self.registry = registry
+        self.model_name = model_name
+        self._pool = pool or _pool
+        self._jobs = {}
+        self._results = []
+        self._lock = threading.Lock()
+
+    def submit_deck(self, fname, ai_data):
+        for section, slot in SLOTS.items():
+            prompt = ai_data.get(section, {}).get('image_prompt')
+            if prompt:
+                self.submit(fname, slot, prompt)
+
+    def submit(self, fname, slot, prompt, model_name=None, deadline=PREFETCH_DEADLINE, call_timeout=images.IMAGEN_CALL_TIMEOUT):
+        """Avvia (o riavvia, annullando il precedente) il job per questo slot."""
+        job = _Job(prompt, model_name or self.model_name, deadline, call_timeout)
+        with self._lock:
+            old = self._jobs.get((fname, slot))
+            self._jobs[(fname, slot)] = job
+        if old:
+            self._cancel_job(old)
+        job.future = self._pool.submit(tracing.bind(fname, self._run), fname, slot, job)
+
+    def resubmit_if_pending(self, fname, slot, prompt):
+        """Prompt modificato dall'utente: se il job è ancora in corso lo rilancia col nuovo testo."""
+        with self._lock:
+            job = self._jobs.get((fname, slot))
+        if job and job.prompt != prompt and not (job.future and job.future.done()):
+            self.submit(fname, slot, prompt)
+
+    def cancel(self, fname, slot):
+        with self._lock:
+            job = self._jobs.pop((fname, slot), None)
+        if job:
+            self._cancel_job(job)
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+            self._results.clear()
+        for job in jobs:
+            self._cancel_job(job)
+
+    def pending(self, fname, slot):
+        """Job di questo slot ancora in corso."""
+        with self._lock:
+            job = self._jobs.get((fname, slot))
+        return bool(job and not (job.future and job.future.done()))
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if not (j.future and j.future.done()))
+
+    def has_results(self):
+        with self._lock:
+            return bool(self._results)
+
+    def collect(self):
+        """Risultati arrivati dall'ultima chiamata: lista di (fname, slot, url, errore)."""
+        with self._lock:
+            out, self._results = self._results, []
+            return out
+
+    @staticmethod
+    def _cancel_job(job):
+        job.cancel_event.set()
+        if job.future:
+            job.future.cancel()
+
+    def _run(self, fname, slot, job):
+        url, err = None, None
+        try:
+            img = images.generate_imagen_safe(self.registry, job.prompt, job.model_name, cancel_event=job.cancel_event,
+                                              deadline=job.deadline, call_timeout=job.call_timeout)
+            if not job.cancel_event.is_set():
+                url = images.upload_bytes_to_bucket(self.registry, img)
+        except Exception as e:
+            err = e
+        with self._lock:
+            # Job annullato o sostituito da uno più recente: il risultato si scarta
+            if self._jobs.get((fname, slot)) is not job or job.cancel_event.is_set():
+                return
+            self._results.append((fname, slot, url, err))
@@ -0,0 +1,258 @@
+import contextlib
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import finalize
+import pipeline
+from settings import cache_path
+
+# ======================================================
+# 📦 SALVATAGGI IN BACKGROUND, RIPRENDIBILI
+# ======================================================
+# Un "SALVA SU DRIVE" diventa un job: parametri e fasi completate di ogni
+# file (deck + lingua) finiscono in SQLite man mano. Il job gira in un
+# thread del processo, non nello script Streamlit: un refresh o un rerun
+# non lo interrompono e la UI si limita a leggerne lo stato. Se il processo
+# muore a metà, la ripresa salta le fasi già registrate (copia, testi +
+# immagini, traduzione ENG) e ritrova via appProperties le copie create ma
+# non ancora registrate: niente file duplicati su Drive.
+
+JOB_WORKERS = 2
+# Job creati prima di questo processo (riavvio): nessuna sessione li segue più
+PROCESS_STARTED = time.time()
+# I job conclusi si tengono una settimana (riepilogo), poi si cancellano
+JOB_RETENTION = 7 * 24 * 3600
+# Fasi registrate per file: translated (solo ENG), copied, filled; error se fallisce
+STAGES = ("translated", "copied", "filled")
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY, created REAL, updated REAL, status TEXT, params TEXT, error TEXT)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS stages (
+                job_id TEXT, fname TEXT, lang TEXT, stage TEXT, value TEXT, at REAL,
+                PRIMARY KEY (job_id, fname, lang, stage))""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Come in llm_cache.py: una connessione per operazione (thread diversi)
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def create(self, params):
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+                       (job_id, now, now, "queued", json.dumps(params, ensure_ascii=False), None))
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT job_id, created, updated, status, params, error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row: return None
+        return {"job_id": row[0], "created": row[1], "updated": row[2], "status": row[3], "params": json.loads(row[4]), "error": row[5]}
+
+    def recent(self, limit=10, template_id=None, folder_id=None):
+        """Ultimi job, eventualmente solo quelli di un template e una cartella."""
+        sql, args = "SELECT job_id FROM jobs", []
+        if template_id is not None:
+            sql += " WHERE json_extract(params, '$.template_id') = ? AND json_extract(params, '$.folder_id') = ?"
+            args += [template_id, folder_id]
+        with self._connect() as db:
+            ids = [r[0] for r in db.execute(sql + " ORDER BY created DESC LIMIT ?", args + [limit])]
+        return [self.get(j) for j in ids]
+
+    def set_status(self, job_id, status, error=None):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE job_id = ?", (status, error, time.time(), job_id))
+
+    def record(self, job_id, fname, lang, stage, value):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                       (job_id, fname, lang, stage, json.dumps(value, ensure_ascii=False), now))
+            db.execute("UPDATE jobs SET updated = ? WHERE job_id = ?", (now, job_id))
+
+    def stages(self, job_id):
+        """{(fname, lang): {fase: valore}}"""
+        out = {}
+        with self._connect() as db:
+            for fname, lang, stage, value in db.execute("SELECT fname, lang, stage, value FROM stages WHERE job_id = ?", (job_id,)):
+                out.setdefault((fname, lang), {})[stage] = json.loads(value)
+        return out
+
+    def clear_errors(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM stages WHERE job_id = ? AND stage = 'error'", (job_id,))
+
+    def prune(self, max_age=JOB_RETENTION):
+        with self._connect() as db:
+            old = [r[0] for r in db.execute("SELECT job_id FROM jobs WHERE updated < ?", (time.time() - max_age,))]
+        for job_id in old:
+            self.delete(job_id)
+
+    def delete(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM stages WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+
+class SaveJob:
+    """Checkpoint di UN job, nel formato che si aspetta pipeline.finalize_batch."""
+
+    def __init__(self, store, job_id, resumed=False):
+        self.store = store
+        self.job_id = job_id
+        # Solo un job già partito può avere copie create ma non registrate da cercare su Drive
+        self.resumed = resumed
+        self._done = store.stages(job_id)
+        self._lock = threading.Lock()
+
+    def done(self, fname, lang):
+        with self._lock:
+            return dict(self._done.get((fname, lang), {}))
+
+    def record(self, fname, lang, stage, value):
+        self.store.record(self.job_id, fname, lang, stage, value)
+        with self._lock:
+            self._done.setdefault((fname, lang), {})[stage] = value
+
+    def tag(self, fname, lang):
+        # appProperties: chiave + valore max 124 byte, il nome file può essere lungo
+        return {"sm_job": self.job_id, "sm_file": hashlib.sha1(f"{fname}|{lang}".encode("utf-8")).hexdigest()[:16]}
+
+
+def progress(store, job_id):
+    """Stato di un job per la UI: totali + righe per file."""
+    job = store.get(job_id)
+    if job is None: return None
+    p = job["params"]
+    langs = ["ITA", "ENG"] if p["make_english"] else ["ITA"]
+    stages = store.stages(job_id)
+    files = []
+    for fname, _, _ in p["decks"]:
+        for lang in langs:
+            st_ = stages.get((fname, lang), {})
+            files.append({
+                "fname": fname, "lang": lang,
+                "name": fname if lang == "ITA" else finalize.eng_filename(fname),
+                "new_id": st_.get("copied"),
+                "done": "filled" in st_,
+                "failures": st_.get("filled") or [],
+                "error": None if "filled" in st_ else st_.get("error"),
+                "stages": [s for s in STAGES if s in st_],
+            })
+    translations = {fname: s["translated"] for (fname, lang), s in stages.items() if lang == "ENG" and "translated" in s}
+    return {
+        "job_id": job_id, "status": job["status"], "error": job["error"], "running": is_running(job_id),
+        "total": len(files), "done": sum(f["done"] for f in files), "failed": sum(1 for f in files if f["error"]),
+        "files": files, "translations": translations, "created": job["created"],
+    }
+
+
+def run_job(registry, store, job_id):
+    """Esegue (o riprende) un job fino in fondo. Gira nel thread del runner."""
+    stored = store.get(job_id)
+    p = stored["params"]
+    store.set_status(job_id, "running")
+    store.clear_errors(job_id)
+    job = SaveJob(store, job_id, resumed=stored["status"] != "queued")
+    owner = {}
+    for fname, _, _ in p["decks"]:
+        owner[fname] = fname
+        owner[finalize.eng_filename(fname)] = fname
+    errors = 0
+    try:
+        decks = [tuple(d) for d in p["decks"]]
+        for out_name, lang, new_id, failures, err in pipeline.finalize_batch(
+                registry, p["template_id"], p["folder_id"], decks, p["make_english"], p["gemini_model"],
+                p["drive_workers"], p["llm_workers"], p["use_cache"], p.get("translations") or {}, checkpoints=job,
+                render=p.get("render", "slides")):
+            if err is not None:
+                errors += 1
+                job.record(owner[out_name], lang, "error", str(err))
+        store.set_status(job_id, "failed" if errors else "done")
+    except Exception as e:
+        store.set_status(job_id, "failed", str(e))
+
+
+_runner = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="save-job")
+_running = set()
+_running_lock = threading.Lock()
+
+
+def is_running(job_id):
+    with _running_lock:
+        return job_id in _running
+
+
+def submit(registry, store, job_id):
+    """Avvia (o riprende) il job in background; False se sta già girando."""
+    with _running_lock:
+        if job_id in _running: return False
+        _running.add(job_id)
+
+    def _run():
+        try:
+            run_job(registry, store, job_id)
+        finally:
+            with _running_lock:
+                _running.discard(job_id)
+
+    _runner.submit(_run)
+    return True
+
+
+def start(registry, store, template_id, folder_id, decks, make_english, gemini_model,
+          drive_workers, llm_workers, use_cache=True, translations=None, render="slides", owner=None):
+    """Crea il job con tutti i parametri (per poterlo riprendere) e lo avvia.
+
+    owner: sessione che lo ha creato, l'unica a cui interrupted lo mostra.
+    """
+    job_id = store.create({
+        "template_id": template_id, "folder_id": folder_id, "decks": [list(d) for d in decks],
+        "make_english": make_english, "gemini_model": gemini_model, "drive_workers": drive_workers,
+        "llm_workers": llm_workers, "use_cache": use_cache, "translations": translations or {},
+        "render": render, "owner": owner,
+    })
+    submit(registry, store, job_id)
+    return job_id
+
+
+def interrupted(store, template_id, folder_id, owner, limit=10):
+    """Job rimasti a metà (processo riavviato o errori) che questa sessione può riprendere.
+
+    Solo job dello stesso template e cartella, e solo i propri: quelli di altre
+    sessioni restano nascosti, tranne se creati prima del riavvio del processo
+    (nessuna sessione li segue più).
+    """
+    return [j for j in store.recent(limit, template_id, folder_id)
+            if j["status"] in ("queued", "running", "failed") and not is_running(j["job_id"])
+            and (j["params"].get("owner") == owner or j["created"] < PROCESS_STARTED)]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = JobStore(cache_path("save_jobs.sqlite3"))
+            _default.prune()
+        return _default
@@ -0,0 +1,133 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+from settings import CACHE_DIR
+
+# ======================================================
+# 🗂️ IMMAGINI ORIGINALI DELLA SESSIONE (MEMORIA LIMITATA)
+# ======================================================
+# I blob originali restano in RAM fino al budget della sessione, poi
+# vengono scaricati su disco (cartella temporanea della sessione) e riletti
+# solo quando servono (es. "Usa Originale"). L'editor mostra miniature
+# piccole, calcolate una volta. La cartella sparisce con clear() o quando
+# la sessione Streamlit viene eliminata.
+
+DEFAULT_BUDGET_MB = 64
+THUMB_MAX_PX = 640
+THUMB_QUALITY = 80
+# Slide le cui immagini l'editor mostra (cover, pagina 2, pagina 3): miniature precalcolate
+PREVIEW_SLOTS = (0, 1, 2)
+
+
+def make_thumbnail(blob, max_px=THUMB_MAX_PX):
+    """JPEG ridotto per l'anteprima; None se il formato non è leggibile (es. EMF/WMF)."""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(blob)) as im:
+            im.thumbnail((max_px, max_px))
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=THUMB_QUALITY)
+            return out.getvalue()
+    except Exception:
+        return None
+
+
+class SessionImageStore:
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self._hot = OrderedDict()     # (fname, idx) -> bytes in RAM (LRU)
+        self._hot_bytes = 0
+        self._sizes = {}              # (fname, idx) -> peso in bytes
+        self._thumbs = {}             # (fname, idx) -> JPEG (o None)
+        self._lock = threading.Lock()
+        root = os.path.join(CACHE_DIR, "session_images")
+        os.makedirs(root, exist_ok=True)
+        self._dir = tempfile.mkdtemp(prefix="session_", dir=root)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._dir, True)
+
+    def set_budget(self, budget_mb):
+        with self._lock:
+            self.budget = int(budget_mb * 1024 * 1024)
+            self._spill()
+
+    def _path(self, key):
+        # Il nome del deck arriva dal file caricato: meglio non usarlo come path
+        return os.path.join(self._dir, hashlib.sha1(f"{key[0]}|{key[1]}".encode()).hexdigest() + ".bin")
+
+    def _spill(self):
+        # Chiamata con il lock: scarica su disco i meno usati finché si rientra nel budget
+        while self._hot_bytes > self.budget and self._hot:
+            key, blob = self._hot.popitem(last=False)
+            with open(self._path(key), "wb") as f:
+                f.write(blob)
+            self._hot_bytes -= len(blob)
+
+    def put(self, fname, idx, blob):
+        key = (fname, idx)
+        with self._lock:
+            self._drop(key)
+            self._sizes[key] = len(blob)
+            self._hot[key] = blob
+            self._hot_bytes += len(blob)
+            self._spill()
+        if idx in PREVIEW_SLOTS:
+            self._thumbs[key] = make_thumbnail(blob)
+
+    def put_many(self, fname, images):
+        for idx, blob in images.items():
+            self.put(fname, idx, blob)
+
+    def has(self, fname, idx):
+        return (fname, idx) in self._sizes
+
+    def size(self, fname, idx):
+        return self._sizes.get((fname, idx), 0)
+
+    def get(self, fname, idx):
+        """Blob completo (da RAM o da disco); None se non c'è."""
+        key = (fname, idx)
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+            if key not in self._sizes:
+                return None
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def thumbnail(self, fname, idx):
+        key = (fname, idx)
+        if key not in self._thumbs:
+            blob = self.get(fname, idx)
+            self._thumbs[key] = make_thumbnail(blob) if blob else None
+        return self._thumbs[key]
+
+    def _drop(self, key):
+        blob = self._hot.pop(key, None)
+        if blob is not None:
+            self._hot_bytes -= len(blob)
+        self._sizes.pop(key, None)
+        self._thumbs.pop(key, None)
+        try: os.remove(self._path(key))
+        except OSError: pass
+
+    def clear(self):
+        with self._lock:
+            self._hot.clear()
+            self._hot_bytes = 0
+            self._sizes.clear()
+            self._thumbs.clear()
+            for name in os.listdir(self._dir):
+                try: os.remove(os.path.join(self._dir, name))
+                except OSError: pass
+
+    def memory_bytes(self):
+        return self._hot_bytes + sum(len(t) for t in self._thumbs.values() if t)
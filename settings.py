@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+# ======================================================
+# 📁 PERCORSI CACHE LOCALI
+# ======================================================
+# Tutte le cache su disco (traduzioni, risposte LLM, immagini...) vivono qui.
+CACHE_DIR = os.environ.get("SLIDE_MONSTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "slide_monster_cache"))
+
+
+def cache_path(*parts):
+    """Percorso dentro CACHE_DIR, creando la cartella padre se serve."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+# ======================================================
+# ☁️ PROGETTO GCP E MODELLI (CONDIVISI DA APP E CLI)
+# ======================================================
+GCP_PROJECT_ID = os.environ.get("SLIDE_MONSTER_GCP_PROJECT", "gen-lang-client-0247086002")
+GCS_BUCKET_NAME = os.environ.get("SLIDE_MONSTER_BUCKET", "bucket_grimmy")
+GCP_LOCATION = os.environ.get("SLIDE_MONSTER_LOCATION", "us-central1")
+
+# Il primo di ogni lista è il default
+GEMINI_MODELS = ["models/gemini-3-pro-preview", "models/gemini-1.5-pro"]
+IMAGEN_MODELS = ["imagen-3.0-generate-001", "imagen-3.0-fast-generate-001"]
+
+# Budget di token per il testo sorgente nel prompt di analisi (vedi context_builder.py)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("SLIDE_MONSTER_CONTEXT_BUDGET", "12000"))
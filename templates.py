@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from brain import translate_list_strings
+from settings import cache_path
+
+# ======================================================
+# 🧩 INDICE DEL TEMPLATE (PER REVISIONE DRIVE)
+# ======================================================
+# Una copia Drive mantiene gli objectId del template: slot immagine
+# (IMG_1..IMG_3), token {{...}} e testi statici si leggono UNA volta dal
+# template e valgono per tutte le copie finché la revisione non cambia.
+
+# Ogni quanto (s) ricontrollare la revisione del template su Drive
+REVISION_CHECK_TTL = 30
+# Validità su disco della mappa IT->EN dei testi statici
+STATIC_TRANSLATION_TTL = 7 * 24 * 3600
+
+PRESENTATION_FIELDS = "slides(pageElements(objectId,description,shape(text(textElements(textRun(content))))))"
+
+_TOKEN_RE = re.compile(r"\{\{[A-Z0-9_]+\}\}")
+
+_cache = {}
+_cache_lock = threading.Lock()
+_template_locks = {}
+
+
+class TemplateIndex:
+    def __init__(self, template_id, revision, images, tokens, static_texts):
+        self.template_id = template_id
+        self.revision = revision
+        self.images = images              # DESCRIPTION (maiuscolo) -> objectId
+        self.tokens = tokens              # set dei {{TOKEN}} presenti
+        self.static_texts = static_texts  # testi fissi traducibili
+        self.checked_at = time.monotonic()
+        self.static_requests = {}         # modello -> batch replaceAllText IT->EN
+
+
+def extract_static_text(prs):
+    """Testi fissi del template (esclusi i {{PLACEHOLDER}}) da una presentazione già letta."""
+    texts = set()
+    for slide in prs.get('slides', []):
+        for el in slide.get('pageElements', []):
+            if 'shape' in el and 'text' in el['shape']:
+                for tr in el['shape']['text'].get('textElements', []):
+                    if 'textRun' in tr and 'content' in tr['textRun']:
+                        c = tr['textRun']['content'].strip()
+                        if c and "{{" not in c and "}}" not in c and len(c) > 2: texts.add(c)
+    return list(texts)
+
+def extract_tokens(prs):
+    """Token {{...}} presenti (anche se spezzati su più textRun della stessa shape)."""
+    tokens = set()
+    for slide in prs.get('slides', []):
+        for el in slide.get('pageElements', []):
+            if 'shape' in el and 'text' in el['shape']:
+                full = "".join(tr['textRun'].get('content', '') for tr in el['shape']['text'].get('textElements', []) if 'textRun' in tr)
+                tokens.update(_TOKEN_RE.findall(full))
+    return tokens
+
+def image_index(prs):
+    """Mappa DESCRIPTION (maiuscolo) -> objectId degli elementi della presentazione."""
+    index = {}
+    for slide in prs.get('slides', []):
+        for el in slide.get('pageElements', []):
+            if el.get('description'):
+                index.setdefault(el['description'].strip().upper(), el['objectId'])
+    return index
+
+def get_revision(registry, template_id):
+    """Identificativo di revisione: 'version' Drive (headRevisionId non esiste per i file Google)."""
+    meta = registry.drive().files().get(fileId=template_id, fields="version,headRevisionId,modifiedTime", supportsAllDrives=True).execute()
+    return meta.get('headRevisionId') or meta.get('version') or meta.get('modifiedTime')
+
+def scan_template(registry, template_id, revision):
+    prs = registry.slides().presentations().get(presentationId=template_id, fields=PRESENTATION_FIELDS).execute()
+    return TemplateIndex(template_id, revision, image_index(prs), extract_tokens(prs), extract_static_text(prs))
+
+def _template_lock(template_id):
+    with _cache_lock:
+        return _template_locks.setdefault(template_id, threading.Lock())
+
+def get_template_index(registry, template_id):
+    """Indice del template, riletto solo se la revisione Drive è cambiata."""
+    lock = _template_lock(template_id)
+    with _cache_lock:
+        idx = _cache.get(template_id)
+    if idx and time.monotonic() - idx.checked_at < REVISION_CHECK_TTL:
+        return idx
+
+    # Un solo thread per template controlla/riscansiona, gli altri aspettano
+    with lock:
+        with _cache_lock:
+            idx = _cache.get(template_id)
+        if idx and time.monotonic() - idx.checked_at < REVISION_CHECK_TTL:
+            return idx
+        revision = get_revision(registry, template_id)
+        if idx and idx.revision == revision:
+            idx.checked_at = time.monotonic()
+            return idx
+        idx = scan_template(registry, template_id, revision)
+        with _cache_lock:
+            _cache[template_id] = idx
+        return idx
+
+def invalidate(template_id=None):
+    with _cache_lock:
+        if template_id is None: _cache.clear()
+        else: _cache.pop(template_id, None)
+
+
+# ======================================================
+# 🇬🇧 TRADUZIONE TESTI STATICI (UNA VOLTA PER REVISIONE)
+# ======================================================
+
+def _static_cache_file(tindex, model_name):
+    key = hashlib.sha256(f"{tindex.template_id}|{tindex.revision}|{model_name}".encode()).hexdigest()[:32]
+    return cache_path("static_translations", f"{key}.json")
+
+def _load_static_map(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if time.time() - saved["created"] < STATIC_TRANSLATION_TTL:
+            return saved["map"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _save_static_map(path, t_map):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"created": time.time(), "map": t_map}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def static_translation_requests(registry, tindex, model_name, use_cache=True):
+    """Batch replaceAllText IT->EN dei testi statici, pronto da accodare al batchUpdate.
+
+    La mappa è calcolata una volta per revisione del template (memoria + disco
+    con TTL) e contiene solo stringhe effettivamente presenti nel template.
+    Con use_cache=False la mappa su disco e la cache LLM non si leggono (la
+    mappa viene ricalcolata e sovrascritta), ma il risultato in memoria vale
+    comunque per la revisione: i deck successivi dello stesso batch lo riusano.
+    """
+    reqs = tindex.static_requests.get(model_name)
+    if reqs is not None:
+        return reqs
+    with _template_lock(tindex.template_id):
+        reqs = tindex.static_requests.get(model_name)
+        if reqs is not None:
+            return reqs
+
+        path = _static_cache_file(tindex, model_name)
+        t_map = _load_static_map(path) if use_cache else None
+        if t_map is None and tindex.static_texts:
+            t_map = translate_list_strings(registry, tindex.static_texts, model_name, use_cache)
+            # Mappa vuota = errore Gemini: non va memorizzata
+            if t_map: _save_static_map(path, t_map)
+
+        present = set(tindex.static_texts)
+        reqs = []
+        for it, en in (t_map or {}).items():
+            if it in present and isinstance(en, str) and en and it != en:
+                reqs.append({'replaceAllText': {'containsText': {'text': it, 'matchCase': True}, 'replaceText': en}})
+        if t_map or not tindex.static_texts:
+            tindex.static_requests[model_name] = reqs
+        return reqs
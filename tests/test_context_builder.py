@@ -0,0 +1,72 @@
+import contextvars
+
+import context_builder as cb
+
+
+def _deck(slides):
+    return "\n---\n".join(f"SLIDE {i} CONTENUTO: {body}" for i, body in enumerate(slides, 1))
+
+
+def test_repeated_title_kept_once():
+    text = _deck([f"CACCIA AL TESORO | Fase {i}: indizi nel parco" for i in range(1, 6)])
+    out = cb.build_context(text, budget=10000)
+    assert out.count("CACCIA AL TESORO") == 1
+    assert out.startswith("SLIDE 1 CONTENUTO: CACCIA AL TESORO")
+    for i in range(1, 6):
+        assert f"Fase {i}: indizi nel parco" in out
+
+
+def test_template_placeholders_dropped():
+    text = _deck(["Fare clic per modificare il titolo | {{TITLE}} | 1 | Contenuto vero"])
+    assert cb.build_context(text, budget=10000) == "SLIDE 1 CONTENUTO: Contenuto vero"
+
+
+def test_bare_numbers_kept_unless_slide_number():
+    text = _deck(["Partecipanti | 40 | Durata in ore | 3", "Fase due | 2"])
+    out = cb.build_context(text, budget=10000)
+    assert out == "SLIDE 1 CONTENUTO: Partecipanti | 40 | Durata in ore | 3\n---\nSLIDE 2 CONTENUTO: Fase due"
+
+
+def test_notes_first():
+    text = _deck(["Intro", "Dettagli\n[[ ISTRUZIONI DALLE NOTE: durata 2 ore ]]"])
+    out = cb.build_context(text, budget=10000)
+    assert out.startswith("ISTRUZIONI DALLE NOTE:\n[SLIDE 2] durata 2 ore\n---\n")
+    assert "SLIDE 1 CONTENUTO: Intro" in out
+
+
+def test_fit_respects_budget_and_keeps_notes():
+    slides = [f"Fase {i}: " + "testo lungo " * 40 for i in range(1, 30)]
+    slides[-1] += "\n[[ ISTRUZIONI DALLE NOTE: nota importante ]]"
+    out = cb.fit(_deck(slides), 300)
+    assert cb.estimate_tokens(out) <= 320
+    assert out.startswith("ISTRUZIONI DALLE NOTE:\n[SLIDE 29] nota importante")
+
+
+def test_summarize_over_budget_and_failed_chunk_truncated():
+    slides = [f"Fase {i}: " + "attività di squadra " * 60 for i in range(1, 40)]
+    calls = []
+
+    def summarize(body, words):
+        calls.append(body)
+        if len(calls) == 1:
+            raise RuntimeError("quota")
+        return "riassunto"
+
+    out = cb.build_context(_deck(slides), budget=2000, count_tokens=lambda t: cb.estimate_tokens(t), summarize=summarize)
+    assert len(calls) > 1
+    assert out.count("RIASSUNTO SLIDE") == len(calls)
+    assert cb.estimate_tokens(out) <= 2200
+
+
+def test_summaries_keep_caller_context():
+    var = contextvars.ContextVar("deck", default=None)
+    var.set("deck_a.pptx")
+    seen = []
+
+    def summarize(body, words):
+        seen.append(var.get())
+        return "riassunto"
+
+    slides = [f"Fase {i}: " + "attività di squadra " * 60 for i in range(1, 40)]
+    cb.build_context(_deck(slides), budget=2000, summarize=summarize)
+    assert seen and set(seen) == {"deck_a.pptx"}
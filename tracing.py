@@ -0,0 +1,265 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+# ======================================================
+# 📈 TRACCE DELLE CHIAMATE ESTERNE
+# ======================================================
+# Ogni chiamata a Gemini, Imagen, Drive, Slides e GCS diventa uno span:
+# servizio, operazione, deck, durata, bytes inviati/ricevuti, tentativo ed
+# esito. Gli span recenti restano in un buffer circolare (timeline per deck
+# nel pannello della sidebar, export JSON lines); i totali per operazione
+# sono cumulativi ed esportabili in formato testo Prometheus.
+# Il deck non si passa come argomento: lo fissa bind()/deck() nel thread
+# che lavora per quel deck (i pool non ereditano il contesto da soli).
+
+MAX_SPANS = 20000
+# Bucket dell'istogramma durate (secondi)
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+METRIC_PREFIX = "slide_monster_api"
+
+_deck = contextvars.ContextVar("trace_deck", default=())
+_attempt = contextvars.ContextVar("trace_attempt", default=0)
+
+
+class Span:
+    __slots__ = ("service", "op", "decks", "start", "duration", "bytes_out", "bytes_in", "attempt", "outcome", "error")
+
+    def __init__(self, service, op, decks, bytes_out, attempt):
+        self.service = service
+        self.op = op
+        self.decks = decks
+        self.start = time.time()
+        self.duration = 0.0
+        self.bytes_out = bytes_out or 0
+        self.bytes_in = 0
+        self.attempt = attempt
+        self.outcome = "ok"
+        self.error = None
+
+    def to_dict(self):
+        return {"service": self.service, "op": self.op, "decks": list(self.decks), "start": round(self.start, 4),
+                "duration_ms": round(self.duration * 1000, 1), "bytes_out": self.bytes_out, "bytes_in": self.bytes_in,
+                "attempt": self.attempt, "outcome": self.outcome, "error": self.error}
+
+
+class _OpStats:
+    __slots__ = ("outcomes", "buckets", "total_s", "count", "bytes_out", "bytes_in", "retries")
+
+    def __init__(self):
+        self.outcomes = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.total_s = 0.0
+        self.count = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+
+
+class Tracer:
+    def __init__(self, max_spans=MAX_SPANS):
+        self._spans = deque(maxlen=max_spans)
+        self._stats = {}              # (service, op) -> _OpStats
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self._spans.append(span)
+            st = self._stats.get((span.service, span.op))
+            if st is None:
+                st = self._stats[(span.service, span.op)] = _OpStats()
+            st.outcomes[span.outcome] = st.outcomes.get(span.outcome, 0) + 1
+            i = bisect.bisect_left(DURATION_BUCKETS, span.duration)
+            if i < len(st.buckets): st.buckets[i] += 1
+            st.total_s += span.duration
+            st.count += 1
+            st.bytes_out += span.bytes_out
+            st.bytes_in += span.bytes_in
+            if span.attempt: st.retries += 1
+
+    def spans(self, deck=None):
+        with self._lock:
+            spans = list(self._spans)
+        if deck is None: return spans
+        return [s for s in spans if deck in s.decks]
+
+    def decks(self):
+        seen = {}
+        for s in self.spans():
+            for d in s.decks: seen[d] = True
+        return list(seen)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._stats.clear()
+
+    def summary(self):
+        """Righe per (servizio, operazione): chiamate, errori, p50/p95 (dagli span nel buffer), bytes, retry."""
+        by_op = {}
+        for s in self.spans():
+            by_op.setdefault((s.service, s.op), []).append(s.duration)
+        rows = []
+        with self._lock:
+            items = sorted(self._stats.items())
+        for (service, op), st in items:
+            durs = sorted(by_op.get((service, op), [0.0]))
+            rows.append({
+                "servizio": service, "operazione": op, "chiamate": st.count,
+                "errori": sum(n for o, n in st.outcomes.items() if o == "error"),
+                "p50 ms": round(durs[len(durs) // 2] * 1000), "p95 ms": round(durs[min(len(durs) - 1, int(len(durs) * 0.95))] * 1000),
+                "totale s": round(st.total_s, 1), "KB inviati": st.bytes_out // 1024, "KB ricevuti": st.bytes_in // 1024,
+                "retry": st.retries,
+            })
+        return rows
+
+    def export_jsonl(self, deck=None):
+        return "".join(json.dumps(s.to_dict(), ensure_ascii=False) + "\n" for s in self.spans(deck))
+
+    def export_prometheus(self):
+        def lbl(v):
+            # Formato testo Prometheus: nei valori delle label si escapano backslash, virgolette e a capo
+            return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        with self._lock:
+            items = sorted((k, (dict(v.outcomes), list(v.buckets), v.total_s, v.count, v.bytes_out, v.bytes_in, v.retries))
+                           for k, v in self._stats.items())
+        p = METRIC_PREFIX
+        lines = [f"# HELP {p}_calls_total Chiamate alle API esterne per esito.", f"# TYPE {p}_calls_total counter"]
+        for (service, op), (outcomes, *_rest) in items:
+            for outcome, n in sorted(outcomes.items()):
+                lines.append(f'{p}_calls_total{{service="{lbl(service)}",op="{lbl(op)}",outcome="{lbl(outcome)}"}} {n}')
+        lines += [f"# HELP {p}_call_duration_seconds Durata delle chiamate.", f"# TYPE {p}_call_duration_seconds histogram"]
+        for (service, op), (_, buckets, total_s, count, *_rest) in items:
+            labels = f'service="{lbl(service)}",op="{lbl(op)}"'
+            acc = 0
+            for le, n in zip(DURATION_BUCKETS, buckets):
+                acc += n
+                lines.append(f'{p}_call_duration_seconds_bucket{{{labels},le="{le}"}} {acc}')
+            lines.append(f'{p}_call_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{p}_call_duration_seconds_sum{{{labels}}} {total_s:.6f}")
+            lines.append(f"{p}_call_duration_seconds_count{{{labels}}} {count}")
+        for name, idx, help_ in (("bytes_sent_total", 4, "Bytes inviati."), ("bytes_received_total", 5, "Bytes ricevuti."),
+                                 ("retries_total", 6, "Chiamate che erano un nuovo tentativo.")):
+            lines += [f"# HELP {p}_{name} {help_}", f"# TYPE {p}_{name} counter"]
+            for (service, op), vals in items:
+                lines.append(f'{p}_{name}{{service="{lbl(service)}",op="{lbl(op)}"}} {vals[idx]}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()
+
+
+@contextlib.contextmanager
+def span(service, op, bytes_out=0):
+    """Traccia un blocco. L'eccezione passa, lo span la registra come errore."""
+    sp = Span(service, op, _deck.get(), bytes_out, _attempt.get())
+    t0 = time.perf_counter()
+    try:
+        yield sp
+    except BaseException as e:
+        sp.outcome = "error"
+        sp.error = str(e)[:300]
+        raise
+    finally:
+        sp.duration = time.perf_counter() - t0
+        tracer.record(sp)
+
+
+def timed(service, op, decks, start, duration, bytes_out=0, outcome="ok"):
+    """Span misurato altrove (es. parsing in un processo figlio: lì il tracer non c'è)."""
+    sp = Span(service, op, tuple(decks), bytes_out, 0)
+    sp.start, sp.duration, sp.outcome = start, duration, outcome
+    tracer.record(sp)
+
+
+def event(service, op, outcome, bytes_in=0):
+    """Evento senza durata (es. risposta servita dalla cache)."""
+    sp = Span(service, op, _deck.get(), 0, _attempt.get())
+    sp.outcome = outcome
+    sp.bytes_in = bytes_in
+    tracer.record(sp)
+
+
+@contextlib.contextmanager
+def deck(*names):
+    token = _deck.set(tuple(names))
+    try:
+        yield
+    finally:
+        _deck.reset(token)
+
+
+def bind(names, fn):
+    """fn da eseguire in un pool, con gli span attribuiti a names (uno o più deck)."""
+    names = (names,) if isinstance(names, str) else tuple(names)
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with deck(*names):
+            return fn(*args, **kwargs)
+    return run
+
+
+@contextlib.contextmanager
+def attempt(n):
+    """Gli span dentro il blocco sono il tentativo n (0 = primo)."""
+    token = _attempt.set(n)
+    try:
+        yield
+    finally:
+        _attempt.reset(token)
+
+
+# --- googleapiclient (Drive / Slides) ---
+
+def _payload_size(obj):
+    if obj is None: return 0
+    if isinstance(obj, (bytes, str)): return len(obj)
+    try: return len(json.dumps(obj))
+    except (TypeError, ValueError): return 0
+
+
+class _TracedRequest:
+    def __init__(self, request, service, op, kwargs):
+        self._request = request
+        self._service = service
+        self._op = op
+        self._kwargs = kwargs
+
+    def execute(self, *args, **kwargs):
+        body = getattr(self._request, "body", None) or self._kwargs.get("body")
+        with span(self._service, self._op, _payload_size(body)) as sp:
+            result = self._request.execute(*args, **kwargs)
+            sp.bytes_in = _payload_size(result)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+class TracedService:
+    """Proxy di un service googleapiclient: ogni .execute() diventa uno span
+    con operazione ricavata dalla catena (es. files().copy -> files.copy)."""
+
+    def __init__(self, resource, service, path=()):
+        self._resource = resource
+        self._service = service
+        self._path = path
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if not callable(attr): return attr
+
+        def call(*args, **kwargs):
+            res = attr(*args, **kwargs)
+            path = self._path + (name,)
+            if hasattr(res, "execute"):
+                return _TracedRequest(res, self._service, ".".join(path), kwargs)
+            return TracedService(res, self._service, path)
+        return call